@@ -1,9 +1,12 @@
 import json
 import argparse
 from datetime import datetime
+from itertools import chain
 from colorama import init, Fore, Style
 from tabulate import tabulate
 
+from tx_output import is_normalized, iter_groups
+
 # Инициализация colorama
 init()
 
@@ -31,158 +34,181 @@ def format_date(date_str):
     except:
         return date_str
 
+def iter_related_groups(path):
+    """Группы из файла результатов по одной: (тип связи, описание, группа). Нормализованный файл
+    (tx_output) читается лениво; файл прежнего формата загружается целиком. Цепочки возвращаются
+    как {"transactions": [...]}"""
+    if is_normalized(path):
+        yield from iter_groups(path)
+        return
+    
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    for group_info in data:
+        for chain in group_info.get("chains", []):
+            yield group_info["type"], group_info["description"], {"transactions": chain}
+        for group in group_info.get("groups", []):
+            yield group_info["type"], group_info["description"], group
+
+def show_same_amount_group(i, group):
+    """Отображает группу транзакций с одинаковой суммой"""
+    amount = group.get("amount", 0)
+    transaction_count = group.get("transaction_count", 0)
+    
+    print(f"\n{Fore.MAGENTA}Группа {i+1}: {transaction_count} транзакций с суммой {Fore.RED}{format_amount(amount)}{Style.RESET_ALL}")
+    
+    headers = ["ID", "Дата", "Плательщик", "Получатель"]
+    table_data = []
+    
+    for j, tx in enumerate(group.get("transactions", [])):
+        payers = tx.get("payers", [])
+        recipients = tx.get("recipients", [])
+        
+        payer_str = ", ".join([format_person(p) for p in payers]) if payers else "Не указан"
+        recipient_str = ", ".join([format_person(r) for r in recipients]) if recipients else "Не указан"
+        
+        table_data.append([
+            tx.get("tx_id", ""),
+            format_date(tx.get("tx_time", "")),
+            payer_str,
+            recipient_str
+        ])
+    
+    print(tabulate(table_data, headers=headers, tablefmt="grid"))
+
+def show_split_payment_group(i, group):
+    """Отображает группу возможного дробления платежей"""
+    direction = "исходящих" if group.get("type") == "outgoing" else "входящих"
+    person = group.get("person", {})
+    total_amount = group.get("total_amount", 0)
+    transaction_count = group.get("transaction_count", 0)
+    
+    print(f"\n{Fore.MAGENTA}Группа {i+1}: {Fore.YELLOW}{transaction_count} {direction} транзакций")
+    print(f"Лицо: {Fore.BLUE}{format_person(person)}")
+    print(f"Общая сумма: {Fore.RED}{format_amount(total_amount)}{Style.RESET_ALL}")
+    
+    headers = ["ID", "Дата", "Сумма"]
+    if group.get("type") == "outgoing":
+        headers.append("Получатель")
+    else:
+        headers.append("Плательщик")
+    
+    table_data = []
+    
+    for tx in group.get("transactions", []):
+        tx_id = tx.get("tx_id", "")
+        tx_time = format_date(tx.get("tx_time", ""))
+        amount = format_amount(tx.get("amount", 0))
+        
+        if group.get("type") == "outgoing":
+            recipients = tx.get("recipients", [])
+            party = ", ".join([format_person(r) for r in recipients]) if recipients else "Не указан"
+        else:
+            payers = tx.get("payers", [])
+            party = ", ".join([format_person(p) for p in payers]) if payers else "Не указан"
+        
+        table_data.append([tx_id, tx_time, amount, party])
+    
+    print(tabulate(table_data, headers=headers, tablefmt="grid"))
+
+# Типы связи, группы которых отображаются таблицами
+GROUP_PRINTERS = {
+    "same_amount_in_time_window": show_same_amount_group,
+    "split_payments": show_split_payment_group,
+}
+
 def show_transaction_groups(groups, limit=None):
-    """Отображает группы транзакций"""
+    """Отображает группы транзакций; groups - (тип связи, описание, группа), группы одного типа подряд"""
     group_count = 0
+    current_type = None
+    type_count = 0
     
-    for group_info in groups:
-        group_type = group_info["type"]
-        description = group_info["description"]
-        
-        print(f"\n{Fore.CYAN}{'='*80}")
-        print(f"{Fore.GREEN}Тип связи: {Fore.YELLOW}{description}")
-        print(f"{Fore.CYAN}{'='*80}{Style.RESET_ALL}")
+    def report_hidden():
+        if current_type in GROUP_PRINTERS and limit and type_count > limit:
+            print(f"\n{Fore.RED}Показано {limit} из {type_count} групп...{Style.RESET_ALL}")
+    
+    for group_type, description, group in groups:
+        if group_type != current_type:
+            report_hidden()
+            current_type = group_type
+            type_count = 0
+            
+            print(f"\n{Fore.CYAN}{'='*80}")
+            print(f"{Fore.GREEN}Тип связи: {Fore.YELLOW}{description}")
+            print(f"{Fore.CYAN}{'='*80}{Style.RESET_ALL}")
         
-        if group_type == "same_amount_in_time_window":
-            for i, group in enumerate(group_info.get("groups", [])):
-                if limit and i >= limit:
-                    print(f"\n{Fore.RED}Показано {limit} из {len(group_info.get('groups', []))} групп...{Style.RESET_ALL}")
-                    break
-                
-                amount = group.get("amount", 0)
-                transaction_count = group.get("transaction_count", 0)
-                
-                print(f"\n{Fore.MAGENTA}Группа {i+1}: {transaction_count} транзакций с суммой {Fore.RED}{format_amount(amount)}{Style.RESET_ALL}")
-                
-                headers = ["ID", "Дата", "Плательщик", "Получатель"]
-                table_data = []
-                
-                for j, tx in enumerate(group.get("transactions", [])):
-                    payers = tx.get("payers", [])
-                    recipients = tx.get("recipients", [])
-                    
-                    payer_str = ", ".join([format_person(p) for p in payers]) if payers else "Не указан"
-                    recipient_str = ", ".join([format_person(r) for r in recipients]) if recipients else "Не указан"
-                    
-                    table_data.append([
-                        tx.get("tx_id", ""),
-                        format_date(tx.get("tx_time", "")),
-                        payer_str,
-                        recipient_str
-                    ])
-                
-                print(tabulate(table_data, headers=headers, tablefmt="grid"))
-                group_count += 1
-                
-        elif group_type == "split_payments":
-            for i, group in enumerate(group_info.get("groups", [])):
-                if limit and i >= limit:
-                    print(f"\n{Fore.RED}Показано {limit} из {len(group_info.get('groups', []))} групп...{Style.RESET_ALL}")
-                    break
-                
-                direction = "исходящих" if group.get("type") == "outgoing" else "входящих"
-                person = group.get("person", {})
-                total_amount = group.get("total_amount", 0)
-                transaction_count = group.get("transaction_count", 0)
-                
-                print(f"\n{Fore.MAGENTA}Группа {i+1}: {Fore.YELLOW}{transaction_count} {direction} транзакций")
-                print(f"Лицо: {Fore.BLUE}{format_person(person)}")
-                print(f"Общая сумма: {Fore.RED}{format_amount(total_amount)}{Style.RESET_ALL}")
-                
-                headers = ["ID", "Дата", "Сумма"]
-                if group.get("type") == "outgoing":
-                    headers.append("Получатель")
-                else:
-                    headers.append("Плательщик")
-                
-                table_data = []
-                
-                for tx in group.get("transactions", []):
-                    tx_id = tx.get("tx_id", "")
-                    tx_time = format_date(tx.get("tx_time", ""))
-                    amount = format_amount(tx.get("amount", 0))
-                    
-                    if group.get("type") == "outgoing":
-                        recipients = tx.get("recipients", [])
-                        party = ", ".join([format_person(r) for r in recipients]) if recipients else "Не указан"
-                    else:
-                        payers = tx.get("payers", [])
-                        party = ", ".join([format_person(p) for p in payers]) if payers else "Не указан"
-                    
-                    table_data.append([tx_id, tx_time, amount, party])
-                
-                print(tabulate(table_data, headers=headers, tablefmt="grid"))
-                group_count += 1
+        type_count += 1
+        printer = GROUP_PRINTERS.get(group_type)
+        if printer and not (limit and type_count > limit):
+            printer(type_count - 1, group)
+            group_count += 1
+    report_hidden()
     
     print(f"\n{Fore.GREEN}Всего отображено {group_count} групп транзакций{Style.RESET_ALL}")
 
 def search_by_person(groups, person_id, name_part=None):
-    """Поиск транзакций по ИИН/БИН или части имени человека/организации"""
+    """Поиск транзакций по ИИН/БИН (или идентификатору сущности) или части имени человека/организации"""
     found_transactions = []
     
-    for group_info in groups:
-        for group in group_info.get("groups", []):
-            for tx in group.get("transactions", []):
-                person_match = False
-                
-                # Проверка плательщиков
-                for payer in tx.get("payers", []):
-                    if person_id and payer.get("id") == person_id:
-                        person_match = True
-                    elif name_part and name_part.lower() in payer.get("name", "").lower():
-                        person_match = True
-                
-                # Проверка получателей
-                for recipient in tx.get("recipients", []):
-                    if person_id and recipient.get("id") == person_id:
-                        person_match = True
-                    elif name_part and name_part.lower() in recipient.get("name", "").lower():
-                        person_match = True
-                
-                if person_match:
-                    found_transactions.append({
-                        "tx_id": tx.get("tx_id"),
-                        "amount": group.get("amount"),
-                        "tx_time": tx.get("tx_time"),
-                        "payers": tx.get("payers", []),
-                        "recipients": tx.get("recipients", []),
-                        "group_type": group_info.get("type"),
-                        "description": group_info.get("description")
-                    })
+    for group_type, description, group in groups:
+        for tx in group.get("transactions", []):
+            person_match = False
+            
+            # Проверка плательщиков
+            for payer in tx.get("payers", []):
+                if person_id and person_id in (payer.get("id"), payer.get("entity_id")):
+                    person_match = True
+                elif name_part and name_part.lower() in (payer.get("name") or "").lower():
+                    person_match = True
+            
+            # Проверка получателей
+            for recipient in tx.get("recipients", []):
+                if person_id and person_id in (recipient.get("id"), recipient.get("entity_id")):
+                    person_match = True
+                elif name_part and name_part.lower() in (recipient.get("name") or "").lower():
+                    person_match = True
+            
+            if person_match:
+                found_transactions.append({
+                    "tx_id": tx.get("tx_id"),
+                    "amount": group.get("amount", tx.get("amount")),
+                    "tx_time": tx.get("tx_time"),
+                    "payers": tx.get("payers", []),
+                    "recipients": tx.get("recipients", []),
+                    "group_type": group_type,
+                    "description": description
+                })
     
     return found_transactions
 
+def search_component(groups, person_id):
+    """Поиск связной компоненты, в которую входит участник с данным ИИН/БИН"""
+    for group_type, _, group in groups:
+        if group_type != "connected_components":
+            continue
+        if any(member.get("id") == person_id for member in group.get("members", [])):
+            return group
+    return None
+
 def search_by_amount(groups, min_amount, max_amount=None):
-    """Поиск транзакций по сумме"""
-    found_groups = []
-    
-    for group_info in groups:
-        matching_groups = []
+    """Поиск групп транзакций по сумме (лениво, в формате show_transaction_groups)"""
+    for group_type, description, group in groups:
+        amount = group.get("amount") or 0
+        total_amount = group.get("total_amount") or 0
         
-        for group in group_info.get("groups", []):
-            amount = group.get("amount", 0)
-            total_amount = group.get("total_amount", 0)
-            
-            check_amount = amount if amount > 0 else total_amount
-            
-            if (check_amount >= min_amount and 
-                (max_amount is None or check_amount <= max_amount)):
-                matching_groups.append(group)
+        check_amount = amount if amount > 0 else total_amount
         
-        if matching_groups:
-            found_groups.append({
-                "type": group_info.get("type"),
-                "description": group_info.get("description"),
-                "groups": matching_groups
-            })
-    
-    return found_groups
+        if (check_amount >= min_amount and 
+            (max_amount is None or check_amount <= max_amount)):
+            yield group_type, description, group
 
 def main():
     parser = argparse.ArgumentParser(description='Анализ связанных транзакций')
-    parser.add_argument('--file', '-f', default='related_transactions.json', help='Путь к файлу с данными')
+    parser.add_argument('--file', '-f', default='related_transactions.jsonl',
+                        help='Путь к файлу результатов (нормализованный .jsonl или прежний .json)')
     parser.add_argument('--search-person', '-p', help='Поиск по ИИН/БИН человека/организации')
     parser.add_argument('--search-name', '-n', help='Поиск по части имени человека/организации')
+    parser.add_argument('--component', '-c', help='Все участники, связанные с ИИН/БИН переводами')
     parser.add_argument('--min-amount', '-min', type=float, help='Минимальная сумма для поиска')
     parser.add_argument('--max-amount', '-max', type=float, help='Максимальная сумма для поиска')
     parser.add_argument('--limit', '-l', type=int, default=10, help='Ограничение количества групп для отображения')
@@ -190,10 +216,24 @@ def main():
     args = parser.parse_args()
     
     try:
-        with open(args.file, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        data = iter_related_groups(args.file)
         
-        if args.search_person or args.search_name:
+        if args.component:
+            # Связная компонента участника
+            component = search_component(data, args.component)
+            
+            if not component:
+                print(f"{Fore.RED}Участник {args.component} не найден в связных группах{Style.RESET_ALL}")
+                return
+            
+            print(f"\n{Fore.GREEN}Компонента {component.get('component_id')}: участников {component.get('size')}, "
+                  f"транзакций {component.get('transaction_count')}, сумма "
+                  f"{Fore.RED}{format_amount(component.get('total_amount', 0))}{Style.RESET_ALL}")
+            
+            table_data = [[member.get("id", ""), member.get("name", "")] for member in component.get("members", [])]
+            print(tabulate(table_data, headers=["ИИН/БИН", "Наименование"], tablefmt="grid"))
+            
+        elif args.search_person or args.search_name:
             # Поиск по человеку/организации
             results = search_by_person(data, args.search_person, args.search_name)
             
@@ -228,11 +268,12 @@ def main():
             # Поиск по сумме
             results = search_by_amount(data, args.min_amount, args.max_amount)
             
-            if not results:
+            first = next(results, None)
+            if first is None:
                 print(f"{Fore.RED}Группы транзакций по заданным критериям не найдены{Style.RESET_ALL}")
                 return
             
-            show_transaction_groups(results, args.limit)
+            show_transaction_groups(chain([first], results), args.limit)
         else:
             # Отображение всех групп
             show_transaction_groups(data, args.limit)
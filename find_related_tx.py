@@ -1,6 +1,30 @@
+import os
 import json
-from datetime import datetime, timedelta
-from pprint import pprint
+import sqlite3
+import argparse
+import multiprocessing
+from contextlib import nullcontext
+
+import numpy as np
+
+from tx_entities import resolve_entities
+from tx_graph import (FlowGraph, UnionFind, band_pairs, fan_hubs, find_chains, find_cycles, onward_pairs,
+                      participant_key, time_window_groups)
+from tx_index import TxIndex
+from tx_output import RelatedWriter
+from tx_rank import TopGroups, group_score, load_risk
+from tx_time import NO_TIME, TimeIndex, from_epoch_seconds, parse_time, parse_times, to_datetimes
+
+# Общие данные детекторов (транзакции, индексы, граф, параметры). Дочерние процессы пула создаются
+# через fork и читают их без копирования (copy-on-write); в задачи передаются только границы частей.
+_SHARED = {}
+
+# Детекторы в порядке типов связи в результате
+DETECTORS = ('chains', 'onward_payments', 'round_trips', 'fan_hubs', 'multiple_tx', 'split_outgoing', 'split_incoming',
+             'same_amount')
+
+# Детекторы, работа которых делится на части: по начальным ребрам, участникам или суммам
+PARTITIONED_DETECTORS = ('round_trips', 'split_outgoing', 'split_incoming', 'same_amount')
 
 def format_transaction(message):
     """Форматирует транзакцию для удобного отображения"""
@@ -47,40 +71,19 @@ def format_transaction(message):
     }
 
 def parse_datetime(dt_str):
-    """Парсит строку даты в объект datetime"""
-    if not dt_str:
-        return None
-    try:
-        # Пробуем разные форматы даты
-        formats = [
-            "%Y-%m-%dT%H:%M:%S.%f",
-            "%Y-%m-%dT%H:%M:%S",
-            "%Y-%m-%d %H:%M:%S"
-        ]
-        
-        for fmt in formats:
-            try:
-                return datetime.strptime(dt_str, fmt)
-            except ValueError:
-                continue
-        
-        # Если не удалось распарсить, возвращаем None
-        return None
-    except Exception as e:
-        print(f"Ошибка при парсинге даты {dt_str}: {e}")
-        return None
+    """Парсит строку даты в объект datetime (см. tx_time.parse_time)"""
+    return parse_time(dt_str)
 
-def find_related_transactions(messages, max_time_diff_hours=24):
-    """Находит взаимосвязанные транзакции по участникам, суммам и времени"""
+def find_related_transactions(messages, max_time_diff_hours=24, **options):
+    """Находит взаимосвязанные транзакции по участникам, суммам и времени
+    (параметры поиска - см. find_related_in_tx_data)"""
     print(f"Анализируем {len(messages)} сообщений...")
-    
-    # Словари для индексации транзакций
-    by_person = {}  # по участникам
-    by_amount = {}  # по суммам
-    by_time_window = {}  # по временным окнам
+    return find_related_in_tx_data(parse_transactions(messages), max_time_diff_hours, **options)
+
+def parse_transactions(messages):
+    """Разбирает сообщения в словарь транзакций {ID: данные транзакции}"""
     tx_data = {}  # данные о транзакциях для быстрого доступа
     
-    # Первый проход: индексация всех транзакций
     for idx, msg in enumerate(messages):
         if 'row_to_json' in msg:
             data = msg['row_to_json']
@@ -92,45 +95,11 @@ def find_related_transactions(messages, max_time_diff_hours=24):
         if not tx_id:
             continue  # Пропускаем транзакции без ID
         
-        # Собираем информацию обо всех участниках
-        payers = []
-        recipients = []
-        all_participants = []
+        # Собираем информацию обо всех участниках: плательщики (pl1, pl2) и получатели (pol1, pol2)
+        payers = [p for p in (participant_info(data, 'pl1'), participant_info(data, 'pl2')) if p]
+        recipients = [r for r in (participant_info(data, 'pol1'), participant_info(data, 'pol2')) if r]
+        all_participants = payers + recipients
         
-        # Плательщики (pl1, pl2)
-        if data.get("gmember_name_pl1") and data.get("gmember_name_pl1").strip() != "":
-            payer_pl1 = {
-                "name": data.get("gmember_name_pl1"),
-                "id": data.get("gmember_maincode_pl1")
-            }
-            payers.append(payer_pl1)
-            all_participants.append(payer_pl1)
-            
-        if data.get("gmember_name_pl2") and data.get("gmember_name_pl2").strip() != "":
-            payer_pl2 = {
-                "name": data.get("gmember_name_pl2"),
-                "id": data.get("gmember_maincode_pl2")
-            }
-            payers.append(payer_pl2)
-            all_participants.append(payer_pl2)
-        
-        # Получатели (pol1, pol2)
-        if data.get("gmember_name_pol1") and data.get("gmember_name_pol1").strip() != "":
-            recipient_pol1 = {
-                "name": data.get("gmember_name_pol1"),
-                "id": data.get("gmember_maincode_pol1")
-            }
-            recipients.append(recipient_pol1)
-            all_participants.append(recipient_pol1)
-            
-        if data.get("gmember_name_pol2") and data.get("gmember_name_pol2").strip() != "":
-            recipient_pol2 = {
-                "name": data.get("gmember_name_pol2"),
-                "id": data.get("gmember_maincode_pol2")
-            }
-            recipients.append(recipient_pol2)
-            all_participants.append(recipient_pol2)
-            
         # Сохраняем данные о транзакции
         tx_data[tx_id] = {
             'amount': data.get('goper_tenge_amount'),
@@ -140,141 +109,526 @@ def find_related_transactions(messages, max_time_diff_hours=24):
             'all_participants': all_participants,
             'msg_idx': idx  # Индекс сообщения в исходном массиве
         }
-        
-        # Парсим время транзакции
-        tx_time = parse_datetime(data.get('goper_trans_date'))
-        if tx_time:
+    
+    # Время разбирается одной колонкой; секунды от 1970-01-01 хранятся в транзакции и используются детекторами
+    tx_ids = list(tx_data)
+    microseconds = parse_times([tx_data[tx_id]['tx_time_str'] for tx_id in tx_ids])
+    for tx_id, tx_time, value in zip(tx_ids, to_datetimes(microseconds), microseconds.tolist()):
+        if value != NO_TIME:
             tx_data[tx_id]['tx_time'] = tx_time
-            
-            # Индексация по временным окнам (каждый час)
-            time_key = tx_time.strftime("%Y-%m-%d %H")
-            if time_key not in by_time_window:
-                by_time_window[time_key] = set()
-            by_time_window[time_key].add(tx_id)
+            tx_data[tx_id]['tx_seconds'] = value // 1_000_000
+    
+    return tx_data
+
+def participant_info(data, suffix):
+    """Участник сообщения по суффиксу полей (pl1, pl2, pol1, pol2); None, если наименование не указано.
+    Резидентство и страна банка (для разрешения сущностей) добавляются, если заполнены"""
+    name = data.get(f"gmember_name_{suffix}")
+    if not name or name.strip() == "":
+        return None
+    participant = {
+        "name": name,
+        "id": data.get(f"gmember_maincode_{suffix}")
+    }
+    for key, field in (("residence", "gmember_residence_"), ("bank_country", "gmember_bank_address_")):
+        if data.get(field + suffix) not in (None, ""):
+            participant[key] = data.get(field + suffix)
+    return participant
+
+def build_indexes(tx_data):
+    """Строит индексы транзакций: по участникам, ролям, суммам и времени (TimeIndex)"""
+    by_person = {}  # по участникам
+    by_payer = {}  # по плательщикам: [(секунды, ID транзакции, участник)], отсортировано по времени
+    by_recipient = {}  # по получателям: то же
+    by_amount = {}  # по суммам
+    timed_ids = []  # по времени
+    
+    for tx_id, tx in tx_data.items():
+        tx_time = tx.get('tx_time')
+        if tx_time:
+            timed_ids.append(tx_id)
         
         # Индексация по участникам
-        for participant in all_participants:
-            person_id = participant["id"]
+        for participant in tx['all_participants']:
+            person_id = participant_key(participant)
             if person_id:
                 if person_id not in by_person:
                     by_person[person_id] = set()
                 by_person[person_id].add(tx_id)
         
+        # Индексация по ролям (только транзакции с известным временем)
+        if tx_time:
+            for role_index, role_participants in ((by_payer, tx['payers']), (by_recipient, tx['recipients'])):
+                role_ids = set()
+                for participant in role_participants:
+                    person_id = participant_key(participant)
+                    if person_id and person_id not in role_ids:
+                        role_ids.add(person_id)
+                        role_index.setdefault(person_id, []).append((tx['tx_seconds'], tx_id, participant))
+        
         # Индексация по суммам
-        amount = data.get('goper_tenge_amount')
+        amount = tx.get('amount')
         if amount:
             if amount not in by_amount:
                 by_amount[amount] = set()
             by_amount[amount].add(tx_id)
     
+    for role_index in (by_payer, by_recipient):
+        for entries in role_index.values():
+            entries.sort(key=lambda entry: entry[0])
+    
+    time_index = TimeIndex(timed_ids, [tx_data[tx_id]['tx_seconds'] for tx_id in timed_ids])
+    return by_person, by_payer, by_recipient, by_amount, time_index
+
+def find_related_in_tx_data(tx_data, max_time_diff_hours=24, onward_delay_hours=None,
+                            min_amount_ratio=None, max_amount_ratio=None, window_mode='gap',
+                            amount_tolerance=None, amount_tolerance_pct=None, max_cycle_length=6,
+                            cycle_window_hours=168, hub_bucket_hours=24, min_hub_counterparties=10, workers=1,
+                            writer=None, top_k=None, risk=None, entity_resolution=True, component_data=None,
+                            stored_components=False):
+    """Находит взаимосвязанные транзакции среди разобранных транзакций (parse_transactions).
+    window_mode - группировка по времени для дробления и одинаковых сумм: 'gap' или 'sliding';
+    amount_tolerance (тенге) или amount_tolerance_pct (%) - поиск близких, а не одинаковых сумм;
+    max_cycle_length и cycle_window_hours ограничивают поиск возврата средств отправителю;
+    концентратор - участник с min_hub_counterparties и более различными контрагентами за hub_bucket_hours;
+    workers - число процессов для детекторов (1 - в текущем процессе);
+    writer (tx_output.RelatedWriter) - группы пишутся в файл по мере выполнения детекторов;
+    группам проставляется оценка (tx_rank.group_score, risk - {ИИН/БИН: риск участника}); при заданном top_k
+    в результате остаются top_k групп каждого типа с наибольшей оценкой, полный результат - только в writer;
+    entity_resolution - участники без ИИН/БИН и варианты наименований сводятся к сущностям (tx_entities);
+    component_data - все транзакции, по которым строятся сущности и связные компоненты, если tx_data - их
+    часть (те же словари транзакций, например затронутые новыми сообщениями в --index); в результат
+    попадают компоненты, содержащие транзакции tx_data;
+    stored_components - номера компонент уже проставлены транзакциям постоянным индексом (tx_index), а
+    component_data содержит эти компоненты целиком: компоненты собираются по номерам, а не строятся заново"""
+    if component_data is None:
+        component_data = tx_data
+    if entity_resolution:
+        stats = resolve_entities(component_data)
+        print(f"Участники: {stats['profiles']} различных записей, {stats['entities']} сущностей, "
+              f"отнесено к ИИН/БИН записей без кода: {stats['resolved']}")
+    
+    by_person, by_payer, by_recipient, by_amount, time_index = build_indexes(tx_data)
     print(f"Проиндексировано {len(tx_data)} транзакций")
     
-    # Второй проход: поиск связанных транзакций
-    related_groups = []
+    # Граф потоков между участниками (CSR, ребра отсортированы по времени)
+    graph = FlowGraph(tx_data)
+    print(f"Граф потоков: {graph.node_count} участников, {graph.edge_count} переводов")
     
-    # 1. Поиск связанных по участникам транзакций (цепочки переводов)
-    person_chains = find_transaction_chains(tx_data, by_person)
-    if person_chains:
-        related_groups.append({
-            'type': 'chain_by_person',
-            'description': 'Цепочки транзакций, где получатель становится плательщиком',
-            'chains': person_chains
-        })
+    # Связные компоненты участников: номер компоненты нужен транзакциям до записи групп
+    if stored_components:
+        components = collect_stored_components(component_data)
+    else:
+        components = find_connected_components(component_data)
+    if component_data is not tx_data:
+        components = [component for component in components
+                      if any(tx_id in tx_data for tx_id in component['tx_ids'])]
     
-    # 2. Поиск множественных транзакций между одними и теми же лицами
-    person_multitx = find_multiple_transactions_between_same_persons(tx_data, by_person)
-    if person_multitx:
-        related_groups.append({
-            'type': 'multiple_tx_between_same_persons',
-            'description': 'Множественные транзакции между одними и теми же лицами',
-            'groups': person_multitx
-        })
+    if onward_delay_hours is None:
+        onward_delay_hours = max_time_diff_hours
     
-    # 3. Поиск дробления платежей (несколько платежей близких по времени с одинаковым плательщиком или получателем)
-    split_payments = find_split_payments(tx_data, by_person, by_time_window, max_time_diff_hours)
-    if split_payments:
-        related_groups.append({
-            'type': 'split_payments',
-            'description': 'Возможное дробление платежей',
-            'groups': split_payments
-        })
+    if amount_tolerance is not None or amount_tolerance_pct is not None:
+        tolerance = f"{amount_tolerance_pct}%" if amount_tolerance_pct is not None else f"{amount_tolerance} тенге"
+        same_amount_description = (f'Транзакции с близкими суммами (отклонение до {tolerance}) '
+                                   f'в течение {max_time_diff_hours} часов')
+    else:
+        same_amount_description = f'Транзакции с одинаковыми суммами в течение {max_time_diff_hours} часов'
     
-    # 4. Поиск транзакций с одинаковыми суммами в ограниченном временном окне
-    same_amount_groups = find_same_amount_transactions(tx_data, by_amount, by_time_window, max_time_diff_hours)
-    if same_amount_groups:
-        related_groups.append({
-            'type': 'same_amount_in_time_window',
-            'description': f'Транзакции с одинаковыми суммами в течение {max_time_diff_hours} часов',
-            'groups': same_amount_groups
-        })
+    # Типы связи в порядке вывода: (тип, детекторы, описание)
+    relation_types = [
+        # 1. Цепочки транзакций, где получатель становится плательщиком
+        ('chain_by_person', ('chains',), 'Цепочки транзакций, где получатель становится плательщиком'),
+        # 1a. Транзит: участник получил средства и перевел их дальше в течение onward_delay_hours
+        ('onward_payments', ('onward_payments',),
+         f'Поступление и дальнейший перевод средств в течение {onward_delay_hours} часов'),
+        # 1b. Возврат средств отправителю (A -> B -> ... -> A)
+        ('round_trips', ('round_trips',),
+         f'Возврат средств отправителю (до {max_cycle_length} звеньев в течение {cycle_window_hours} часов)'),
+        # 1c. Концентраторы: много плательщиков одного получателя или один плательщик многим получателям
+        ('fan_hubs', ('fan_hubs',),
+         f'Сбор средств от {min_hub_counterparties} и более плательщиков или раздача '
+         f'{min_hub_counterparties} и более получателям за {hub_bucket_hours} часов'),
+        # 2. Множественные транзакции между одними и теми же лицами
+        ('multiple_tx_between_same_persons', ('multiple_tx',), 'Множественные транзакции между одними и теми же лицами'),
+        # 3. Дробление платежей (несколько платежей близких по времени с одинаковым плательщиком или получателем)
+        ('split_payments', ('split_outgoing', 'split_incoming'), 'Возможное дробление платежей'),
+        # 4. Транзакции с одинаковыми (близкими) суммами в ограниченном временном окне
+        ('same_amount_in_time_window', ('same_amount',), same_amount_description),
+        # 5. Связные компоненты участников; номер компоненты проставляется всем транзакциям в результатах
+        ('connected_components', (), 'Связные группы участников (все, кто связан переводами напрямую или через других)'),
+    ]
+    by_detector = {name: (group_type, description)
+                   for group_type, names, description in relation_types for name in names}
+    
+    # Группы оцениваются по мере выполнения детекторов: все пишутся в writer, в памяти - все или top_k лучших
+    ranking = TopGroups(top_k) if top_k else None
+    collected = {group_type: [] for group_type, _, _ in relation_types}
+    
+    def collect(group_type, description, groups):
+        for group in groups:
+            score = group_score(group, component_data, risk)
+            if isinstance(group, dict):
+                group['score'] = score
+            if ranking is not None:
+                ranking.push(group_type, score, group)
+            else:
+                collected[group_type].append(group)
+        if writer is not None:
+            writer.write_groups(group_type, description, groups)
+    
+    # Второй проход: поиск связанных транзакций (детекторы работают параллельно над общими данными)
+    run_detectors({
+        'tx_data': tx_data,
+        'graph': graph,
+        'by_person': by_person,
+        'by_payer': by_payer,
+        'by_recipient': by_recipient,
+        'by_amount': by_amount,
+        'time_index': time_index,
+        'max_time_diff_hours': max_time_diff_hours,
+        'onward_delay_hours': onward_delay_hours,
+        'min_amount_ratio': min_amount_ratio,
+        'max_amount_ratio': max_amount_ratio,
+        'window_mode': window_mode,
+        'amount_tolerance': amount_tolerance,
+        'amount_tolerance_pct': amount_tolerance_pct,
+        'max_cycle_length': max_cycle_length,
+        'cycle_window_hours': cycle_window_hours,
+        'hub_bucket_hours': hub_bucket_hours,
+        'min_hub_counterparties': min_hub_counterparties,
+    }, workers, lambda name, output: collect(*by_detector[name], output))
+    components_type, _, components_description = relation_types[-1]
+    collect(components_type, components_description, components)
+    
+    related_groups = []
+    for group_type, _, description in relation_types:
+        groups = ranking.groups(group_type) if ranking is not None else collected[group_type]
+        if not groups:
+            continue
+        group_info = {
+            'type': group_type,
+            'description': description,
+            'chains' if group_type == 'chain_by_person' else 'groups': groups
+        }
+        if ranking is not None and ranking.totals[group_type] > len(groups):
+            group_info['total_groups'] = ranking.totals[group_type]
+        related_groups.append(group_info)
+    annotate_components(related_groups, tx_data)
     
     return related_groups
 
-def find_transaction_chains(tx_data, by_person, min_chain_length=2):
-    """Находит цепочки транзакций, где получатель становится плательщиком"""
-    chains = []
-    visited = set()
+def run_detectors(shared, workers=1, on_output=None):
+    """Выполняет детекторы над общими данными и возвращает {детектор: список результатов}.
+    При workers > 1 детекторы и части делимых детекторов выполняются в пуле процессов (fork);
+    результаты частей объединяются в исходном порядке, поэтому не зависят от числа процессов.
+    Если задан on_output(детектор, результаты), он вызывается для каждой части сразу после ее выполнения,
+    а результаты не накапливаются"""
+    global _SHARED
+    _SHARED = shared
+    parallel = workers > 1 and 'fork' in multiprocessing.get_all_start_methods()
+    tasks = detector_tasks(shared, workers * 4 if parallel else 1)
+    results = {}
+    # Одна цепочка (цикл) может найтись в разных частях, если у транзакции несколько плательщиков
+    seen = {'chains': set(), 'round_trips': set()}
+    try:
+        with multiprocessing.get_context('fork').Pool(workers) if parallel else nullcontext() as pool:
+            outputs = pool.imap(run_detector_task, tasks, chunksize=1) if parallel else map(run_detector_task, tasks)
+            for (name, _, _), output in zip(tasks, outputs):
+                if name in seen:
+                    output = unique_items(name, output, seen[name])
+                if on_output is not None:
+                    on_output(name, output)
+                else:
+                    results.setdefault(name, []).extend(output)
+    finally:
+        _SHARED = {}
+    return results
+
+def unique_items(name, output, seen):
+    """Цепочки (циклы) части, которых еще не было среди seen. В seen хранятся хеши последовательностей ID
+    транзакций, а не сами последовательности, поэтому память на цепочку постоянна"""
+    unique = []
+    for item in output:
+        key = hash(tuple(tx['tx_id'] for tx in (item if name == 'chains' else item['transactions'])))
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+def detector_tasks(shared, parts):
+    """Задачи детекторов: (детектор, начало части, конец части) в порядке типов связи в результате,
+    чтобы части одного типа записывались подряд"""
+    graph = shared['graph']
+    sizes = {
+        'round_trips': graph.edge_count,
+        'split_outgoing': len(shared['by_payer']),
+        'split_incoming': len(shared['by_recipient']),
+        'same_amount': len(shared['by_amount']),
+    }
+    if shared['amount_tolerance'] is not None or shared['amount_tolerance_pct'] is not None:
+        sizes['same_amount'] = 1  # Ленточное соединение выполняется целиком
     
-    for tx_id, tx_info in tx_data.items():
-        if tx_id in visited:
+    tasks = []
+    for name in DETECTORS:
+        if name not in PARTITIONED_DETECTORS:
+            tasks.append((name, 0, 0))
             continue
+        bounds = np.linspace(0, sizes[name], max(1, min(parts, sizes[name])) + 1).astype(int).tolist()
+        tasks.extend((name, start, end) for start, end in zip(bounds[:-1], bounds[1:]))
+    return tasks
+
+def run_detector_task(task):
+    """Выполняет часть одного детектора над общими данными _SHARED"""
+    name, start, end = task
+    shared = _SHARED
+    tx_data = shared['tx_data']
+    graph = shared['graph']
+    hours = shared['max_time_diff_hours']
+    
+    if name == 'chains':
+        return find_transaction_chains(tx_data, graph, max_gap_hours=hours)
+    if name == 'round_trips':
+        return find_round_trips(tx_data, graph, shared['max_cycle_length'], shared['cycle_window_hours'],
+                                start_edges=graph.out_edges.edge_list[start:end])
+    if name == 'onward_payments':
+        return find_onward_payments(tx_data, graph, shared['onward_delay_hours'], shared['min_amount_ratio'],
+                                    shared['max_amount_ratio'])
+    if name == 'fan_hubs':
+        return find_fan_hubs(tx_data, graph, shared['hub_bucket_hours'], shared['min_hub_counterparties'])
+    if name == 'multiple_tx':
+        return find_multiple_transactions_between_same_persons(tx_data, shared['by_person'])
+    if name in ('split_outgoing', 'split_incoming'):
+        role_index = shared['by_payer'] if name == 'split_outgoing' else shared['by_recipient']
+        part = {person_id: role_index[person_id] for person_id in list(role_index)[start:end]}
+        by_payer, by_recipient = (part, {}) if name == 'split_outgoing' else ({}, part)
+        return find_split_payments(tx_data, by_payer, by_recipient, hours, window_mode=shared['window_mode'])
+    if name == 'same_amount':
+        if shared['amount_tolerance'] is not None or shared['amount_tolerance_pct'] is not None:
+            return find_similar_amount_transactions(tx_data, hours, shared['amount_tolerance'],
+                                                    shared['amount_tolerance_pct'], time_index=shared['time_index'])
+        by_amount = shared['by_amount']
+        part = {amount: by_amount[amount] for amount in list(by_amount)[start:end]}
+        return find_same_amount_transactions(tx_data, part, shared['time_index'], hours,
+                                             window_mode=shared['window_mode'])
+    raise ValueError(f"Неизвестный детектор: {name}")
+
+def find_transaction_chains(tx_data, graph, min_chain_length=2, max_depth=6, max_gap_hours=72, max_chains=100000,
+                            start_edges=None):
+    """Находит цепочки транзакций, где получатель становится плательщиком (A -> B -> C -> ...)
+
+    Каждое следующее звено совершается позже предыдущего, но не позднее чем через max_gap_hours;
+    длина цепочки ограничена max_depth звеньями. Одна транзакция может входить в несколько цепочек.
+    """
+    chains = []
+    
+    for chain_indexes in find_chains(graph, max_depth=max_depth, max_gap_seconds=int(max_gap_hours * 3600),
+                                     min_length=min_chain_length, max_chains=max_chains, start_edges=start_edges):
+        chains.append([chain_tx_info(graph.tx_ids[index], tx_data[graph.tx_ids[index]]) for index in chain_indexes])
+    
+    return chains
+
+def chain_tx_info(tx_id, tx):
+    """Описание транзакции - звена цепочки или цикла"""
+    formatted_tx = {
+        'tx_id': tx_id,
+        'amount': tx.get('amount'),
+        'tx_time': tx.get('tx_time_str'),
+    }
+    
+    # Добавляем информацию о плательщиках
+    if tx.get('payers'):
+        formatted_tx['payers'] = tx.get('payers')
+    
+    # Добавляем информацию о получателях
+    if tx.get('recipients'):
+        formatted_tx['recipients'] = tx.get('recipients')
+    
+    return formatted_tx
+
+def find_round_trips(tx_data, graph, max_length=6, window_hours=168, max_cycles=100000, start_edges=None):
+    """Находит циклы переводов, возвращающие средства отправителю (A -> B -> ... -> A) в пределах window_hours"""
+    result = []
+    
+    for cycle_indexes in find_cycles(graph, max_length=max_length, window_seconds=int(window_hours * 3600),
+                                     max_cycles=max_cycles, start_edges=start_edges):
+        transactions = [chain_tx_info(graph.tx_ids[index], tx_data[graph.tx_ids[index]]) for index in cycle_indexes]
+        first, last = tx_data[graph.tx_ids[cycle_indexes[0]]], tx_data[graph.tx_ids[cycle_indexes[-1]]]
+        
+        # Отправитель - плательщик первого звена, который получает средства в последнем
+        last_recipients = {participant_key(recipient) for recipient in last.get('recipients', [])}
+        origin = next((payer for payer in first.get('payers', []) if participant_key(payer) in last_recipients), None)
+        
+        result.append({
+            'person': origin,
+            'length': len(transactions),
+            'duration_hours': round((last['tx_seconds'] - first['tx_seconds']) / 3600, 2),
+            'transactions': transactions
+        })
+    
+    return result
+
+def find_fan_hubs(tx_data, graph, bucket_hours=24, min_counterparties=10):
+    """Находит концентраторы: получателей с min_counterparties и более различными плательщиками (fan_in)
+    и плательщиков с min_counterparties и более различными получателями (fan_out) за интервал bucket_hours"""
+    result = []
+    
+    for direction, hub_type in (('in', 'fan_in'), ('out', 'fan_out')):
+        for node, bucket_start, degree, edge_ids in fan_hubs(graph, int(bucket_hours * 3600), min_counterparties,
+                                                            direction):
+            tx_indexes = sorted(set(graph.tx_index[edge_ids].tolist()),
+                                key=lambda index: tx_data[graph.tx_ids[index]]['tx_seconds'])
+            transactions = [chain_tx_info(graph.tx_ids[index], tx_data[graph.tx_ids[index]]) for index in tx_indexes]
+            result.append({
+                'type': hub_type,
+                'person': graph.encoder.participants[node],
+                'bucket_start': from_epoch_seconds(bucket_start).isoformat(),
+                'counterparty_count': degree,
+                'transaction_count': len(transactions),
+                'total_amount': sum(tx['amount'] or 0 for tx in transactions),
+                'transactions': transactions
+            })
+    
+    result.sort(key=lambda group: group['counterparty_count'], reverse=True)
+    return result
+
+def find_onward_payments(tx_data, graph, max_delay_hours, min_amount_ratio=None, max_amount_ratio=None):
+    """Находит пары (поступление, перевод дальше) через одного участника в пределах max_delay_hours;
+    отношение суммы перевода к сумме поступления можно ограничить min_amount_ratio/max_amount_ratio"""
+    nodes, in_edges, out_edges = onward_pairs(graph, int(max_delay_hours * 3600), min_amount_ratio, max_amount_ratio)
+    
+    # Группируем пары по участнику-посреднику
+    by_node = {}
+    for node, in_edge, out_edge in zip(nodes.tolist(), in_edges.tolist(), out_edges.tolist()):
+        by_node.setdefault(node, []).append((in_edge, out_edge))
+    
+    result = []
+    for node, pairs in by_node.items():
+        transactions = {}
+        pair_info = []
+        for in_edge, out_edge in pairs:
+            in_tx_id = graph.tx_ids[graph.tx_index_list[in_edge]]
+            out_tx_id = graph.tx_ids[graph.tx_index_list[out_edge]]
+            in_tx = tx_data[in_tx_id]
+            out_tx = tx_data[out_tx_id]
             
-        # Начинаем новую цепочку с текущей транзакции
-        recipients = tx_info.get('recipients', [])
-        if not recipients:
-            continue
+            for tx_id, tx in ((in_tx_id, in_tx), (out_tx_id, out_tx)):
+                if tx_id not in transactions:
+                    transactions[tx_id] = {
+                        'tx_id': tx_id,
+                        'amount': tx.get('amount'),
+                        'tx_time': tx.get('tx_time_str'),
+                        'payers': tx.get('payers'),
+                        'recipients': tx.get('recipients')
+                    }
             
-        # Проверяем, являются ли получатели плательщиками в других транзакциях
-        current_chain = [tx_id]
-        visited.add(tx_id)
+            pair_info.append({
+                'in_tx_id': in_tx_id,
+                'out_tx_id': out_tx_id,
+                'delay_hours': round((out_tx['tx_seconds'] - in_tx['tx_seconds']) / 3600, 2),
+                'amount_ratio': round(out_tx['amount'] / in_tx['amount'], 4) if in_tx.get('amount') and out_tx.get('amount') else None
+            })
         
-        # Перебираем всех получателей
-        for recipient in recipients:
-            recipient_id = recipient.get('id')
-            if not recipient_id or recipient_id not in by_person:
+        result.append({
+            'person': graph.encoder.participants[node],
+            'pair_count': len(pair_info),
+            'pairs': pair_info,
+            'transactions': list(transactions.values())
+        })
+    
+    result.sort(key=lambda group: group['pair_count'], reverse=True)
+    return result
+
+def find_connected_components(tx_data, min_size=2):
+    """Разбивает участников на связные компоненты (система непересекающихся множеств по плательщикам
+    и получателям каждой транзакции) и записывает номер компоненты в tx_data[tx_id]['component_id'].
+    Компоненты нумеруются по убыванию числа участников; возвращаются компоненты не меньше min_size"""
+    codes = {}  # maincode -> номер участника
+    participants = []
+    tx_members = []
+    for tx_id, tx in tx_data.items():
+        members = []
+        for participant in tx.get('all_participants', []):
+            person_id = participant_key(participant)
+            if not person_id:
                 continue
-                
-            # Ищем следующие звенья цепочки
-            for next_tx_id in by_person[recipient_id]:
-                if next_tx_id in visited:
-                    continue
-                    
-                # Проверяем, является ли получатель плательщиком в следующей транзакции
-                is_payer = False
-                for payer in tx_data[next_tx_id].get('payers', []):
-                    if payer.get('id') == recipient_id:
-                        is_payer = True
-                        break
-                        
-                if is_payer:
-                    # Нашли следующее звено, где получатель стал плательщиком
-                    current_chain.append(next_tx_id)
-                    visited.add(next_tx_id)
-        
-        # Если нашли цепочку достаточной длины, добавляем её
-        if len(current_chain) >= min_chain_length:
-            chain_info = []
-            for chain_tx_id in current_chain:
-                tx = tx_data[chain_tx_id]
-                formatted_tx = {
-                    'tx_id': chain_tx_id,
-                    'amount': tx.get('amount'),
-                    'tx_time': tx.get('tx_time_str'),
-                }
-                
-                # Добавляем информацию о плательщиках
-                if tx.get('payers'):
-                    formatted_tx['payers'] = tx.get('payers')
-                
-                # Добавляем информацию о получателях
-                if tx.get('recipients'):
-                    formatted_tx['recipients'] = tx.get('recipients')
-                
-                chain_info.append(formatted_tx)
-                
-            chains.append(chain_info)
+            code = codes.get(person_id)
+            if code is None:
+                code = codes[person_id] = len(participants)
+                participants.append(participant)
+            members.append(code)
+        tx_members.append((tx_id, members))
     
-    return chains
+    components = UnionFind(len(participants))
+    for _, members in tx_members:
+        for member in members[1:]:
+            components.union(members[0], member)
+    roots = components.labels()
+    
+    # Участники, транзакции и суммы по корням компонент
+    by_root = {}
+    for code, root in enumerate(roots):
+        by_root.setdefault(root, {'members': [], 'tx_ids': [], 'total_amount': 0})['members'].append(participants[code])
+    for tx_id, members in tx_members:
+        if not members:
+            tx_data[tx_id]['component_id'] = None
+            continue
+        component = by_root[roots[members[0]]]
+        component['tx_ids'].append(tx_id)
+        component['total_amount'] += tx_data[tx_id].get('amount') or 0
+    
+    ordered = sorted(by_root.items(), key=lambda item: (-len(item[1]['members']), item[0]))
+    result = []
+    for component_id, (_, component) in enumerate(ordered, start=1):
+        for tx_id in component['tx_ids']:
+            tx_data[tx_id]['component_id'] = component_id
+        if len(component['members']) < min_size:
+            continue
+        result.append({
+            'component_id': component_id,
+            'size': len(component['members']),
+            'transaction_count': len(component['tx_ids']),
+            'total_amount': component['total_amount'],
+            'members': component['members'],
+            'tx_ids': component['tx_ids']
+        })
+    
+    return result
+
+def collect_stored_components(tx_data, min_size=2):
+    """Связные компоненты по номерам, уже проставленным транзакциям (tx_index.TxIndex.load_components), в формате
+    find_connected_components; порядок - по убыванию числа участников"""
+    by_component = {}
+    for tx_id, tx in tx_data.items():
+        if tx.get('component_id') is None:
+            continue
+        component = by_component.setdefault(tx['component_id'], {'members': {}, 'tx_ids': [], 'total_amount': 0})
+        for participant in tx.get('all_participants', []):
+            person_id = participant_key(participant)
+            if person_id:
+                component['members'].setdefault(str(person_id), participant)
+        component['tx_ids'].append(tx_id)
+        component['total_amount'] += tx.get('amount') or 0
+    
+    result = []
+    for component_id, component in sorted(by_component.items(), key=lambda item: (-len(item[1]['members']), item[0])):
+        if len(component['members']) < min_size:
+            continue
+        result.append({
+            'component_id': component_id,
+            'size': len(component['members']),
+            'transaction_count': len(component['tx_ids']),
+            'total_amount': component['total_amount'],
+            'members': list(component['members'].values()),
+            'tx_ids': component['tx_ids']
+        })
+    return result
+
+def annotate_components(related_groups, tx_data):
+    """Проставляет номер связной компоненты транзакциям во всех группах результата"""
+    for group_info in related_groups:
+        for item in group_info.get('chains', []) + group_info.get('groups', []):
+            for tx in item if isinstance(item, list) else item.get('transactions', []):
+                tx['component_id'] = tx_data[tx['tx_id']].get('component_id')
 
 def find_multiple_transactions_between_same_persons(tx_data, by_person, min_transactions=2):
     """Находит множественные транзакции между одними и теми же лицами"""
@@ -286,12 +640,12 @@ def find_multiple_transactions_between_same_persons(tx_data, by_person, min_tran
         recipients = tx_info.get('recipients', [])
         
         for payer in payers:
-            payer_id = payer.get('id')
+            payer_id = participant_key(payer)
             if not payer_id:
                 continue
                 
             for recipient in recipients:
-                recipient_id = recipient.get('id')
+                recipient_id = participant_key(recipient)
                 if not recipient_id:
                     continue
                     
@@ -313,13 +667,13 @@ def find_multiple_transactions_between_same_persons(tx_data, by_person, min_tran
                 
                 # Ищем плательщика с нужным ID
                 for payer in tx.get('payers', []):
-                    if payer.get('id') == payer_id:
+                    if participant_key(payer) == payer_id:
                         payer_info = payer
                         break
                 
                 # Ищем получателя с нужным ID
                 for recipient in tx.get('recipients', []):
-                    if recipient.get('id') == recipient_id:
+                    if participant_key(recipient) == recipient_id:
                         recipient_info = recipient
                         break
                 
@@ -345,128 +699,56 @@ def find_multiple_transactions_between_same_persons(tx_data, by_person, min_tran
     
     return result
 
-def find_split_payments(tx_data, by_person, by_time_window, max_time_diff_hours, min_transactions=2):
-    """Находит возможное дробление платежей"""
+def find_split_payments(tx_data, by_payer, by_recipient, max_time_diff_hours, min_transactions=2, window_mode='gap'):
+    """Находит возможное дробление платежей: серии исходящих платежей одного плательщика
+    или входящих платежей одного получателя, близких по времени (см. time_window_groups).
+    Лицо, которое в одной транзакции и платит, и получает, учитывается в обеих ролях"""
     result = []
+    window_seconds = int(max_time_diff_hours * 3600)
     
-    # Проходим по всем лицам и ищем множественные исходящие или входящие транзакции в заданном временном окне
-    for person_id, tx_ids in by_person.items():
-        if len(tx_ids) < min_transactions:
+    for role, role_index, counterparts_key in (('outgoing', by_payer, 'recipients'),
+                                               ('incoming', by_recipient, 'payers')):
+        # Все серии роли в одном массиве, отсортированном по (лицо, время)
+        series = [person_entries for person_entries in role_index.values() if len(person_entries) >= min_transactions]
+        if not series:
             continue
-            
-        # Группируем транзакции по ролям (плательщик/получатель)
-        outgoing = []  # Исходящие (person является плательщиком)
-        incoming = []  # Входящие (person является получателем)
-        
-        for tx_id in tx_ids:
-            tx = tx_data[tx_id]
-            
-            # Проверяем, является ли лицо плательщиком
-            is_payer = False
-            for payer in tx.get('payers', []):
-                if payer.get('id') == person_id:
-                    is_payer = True
-                    outgoing.append(tx_id)
-                    break
-            
-            # Если не плательщик, проверяем, является ли получателем
-            if not is_payer:
-                for recipient in tx.get('recipients', []):
-                    if recipient.get('id') == person_id:
-                        incoming.append(tx_id)
-                        break
-        
-        # Проверяем исходящие транзакции на дробление
-        if len(outgoing) >= min_transactions:
-            time_groups = group_by_time_proximity(outgoing, tx_data, max_time_diff_hours)
-            for group in time_groups:
-                if len(group) >= min_transactions:
-                    # Получаем информацию о лице
-                    person_info = None
-                    for tx_id in group:
-                        tx = tx_data[tx_id]
-                        for payer in tx.get('payers', []):
-                            if payer.get('id') == person_id:
-                                person_info = payer
-                                break
-                        if person_info:
-                            break
-                    
-                    # Получаем информацию о транзакциях
-                    transactions = []
-                    total_amount = 0
-                    for tx_id in group:
-                        tx = tx_data[tx_id]
-                        amount = tx.get('amount', 0)
-                        if amount:
-                            total_amount += amount
-                        
-                        tx_recipients = []
-                        for recipient in tx.get('recipients', []):
-                            tx_recipients.append(recipient)
-                        
-                        transactions.append({
-                            'tx_id': tx_id,
-                            'amount': amount,
-                            'tx_time': tx.get('tx_time_str'),
-                            'recipients': tx_recipients
-                        })
-                    
-                    result.append({
-                        'type': 'outgoing',
-                        'person': person_info,
-                        'transaction_count': len(group),
-                        'total_amount': total_amount,
-                        'transactions': transactions
-                    })
+        entries = [entry for person_entries in series for entry in person_entries]
+        keys = np.repeat(np.arange(len(series)), [len(person_entries) for person_entries in series])
+        seconds = np.fromiter((entry[0] for entry in entries), dtype=np.int64, count=len(entries))
         
-        # Проверяем входящие транзакции на дробление
-        if len(incoming) >= min_transactions:
-            time_groups = group_by_time_proximity(incoming, tx_data, max_time_diff_hours)
-            for group in time_groups:
-                if len(group) >= min_transactions:
-                    # Получаем информацию о лице
-                    person_info = None
-                    for tx_id in group:
-                        tx = tx_data[tx_id]
-                        for recipient in tx.get('recipients', []):
-                            if recipient.get('id') == person_id:
-                                person_info = recipient
-                                break
-                        if person_info:
-                            break
-                    
-                    # Получаем информацию о транзакциях
-                    transactions = []
-                    total_amount = 0
-                    for tx_id in group:
-                        tx = tx_data[tx_id]
-                        amount = tx.get('amount', 0)
-                        if amount:
-                            total_amount += amount
-                        
-                        tx_payers = []
-                        for payer in tx.get('payers', []):
-                            tx_payers.append(payer)
-                        
-                        transactions.append({
-                            'tx_id': tx_id,
-                            'amount': amount,
-                            'tx_time': tx.get('tx_time_str'),
-                            'payers': tx_payers
-                        })
-                    
-                    result.append({
-                        'type': 'incoming',
-                        'person': person_info,
-                        'transaction_count': len(group),
-                        'total_amount': total_amount,
-                        'transactions': transactions
-                    })
+        starts, ends = time_window_groups(seconds, window_seconds, window_mode, keys, min_transactions)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            result.append(split_payment_group(tx_data, role, counterparts_key, entries[start:end]))
     
     return result
 
-def find_same_amount_transactions(tx_data, by_amount, by_time_window, max_time_diff_hours, min_transactions=2):
+def split_payment_group(tx_data, role, counterparts_key, entries):
+    """Формирует описание серии платежей для find_split_payments"""
+    transactions = []
+    total_amount = 0
+    for _, tx_id, _ in entries:
+        tx = tx_data[tx_id]
+        amount = tx.get('amount', 0)
+        if amount:
+            total_amount += amount
+        
+        transactions.append({
+            'tx_id': tx_id,
+            'amount': amount,
+            'tx_time': tx.get('tx_time_str'),
+            counterparts_key: list(tx.get(counterparts_key, []))
+        })
+    
+    return {
+        'type': role,
+        'person': entries[0][2],
+        'transaction_count': len(entries),
+        'total_amount': total_amount,
+        'transactions': transactions
+    }
+
+def find_same_amount_transactions(tx_data, by_amount, time_index, max_time_diff_hours, min_transactions=2,
+                                  window_mode='gap'):
     """Находит транзакции с одинаковыми суммами в ограниченном временном окне"""
     result = []
     
@@ -476,75 +758,103 @@ def find_same_amount_transactions(tx_data, by_amount, by_time_window, max_time_d
             continue
             
         # Группируем транзакции по временной близости
-        time_groups = group_by_time_proximity(tx_ids, tx_data, max_time_diff_hours)
+        time_groups = group_by_time_proximity(tx_ids, tx_data, max_time_diff_hours, window_mode, min_transactions,
+                                              time_index)
         
         for group in time_groups:
             if len(group) >= min_transactions:
-                # Получаем информацию о транзакциях
-                transactions = []
-                for tx_id in group:
-                    tx = tx_data[tx_id]
-                    
-                    tx_info = {
-                        'tx_id': tx_id,
-                        'tx_time': tx.get('tx_time_str')
-                    }
-                    
-                    # Добавляем информацию о плательщиках
-                    if tx.get('payers'):
-                        tx_info['payers'] = tx.get('payers')
-                    
-                    # Добавляем информацию о получателях
-                    if tx.get('recipients'):
-                        tx_info['recipients'] = tx.get('recipients')
-                    
-                    transactions.append(tx_info)
-                
                 result.append({
                     'amount': amount,
                     'transaction_count': len(group),
-                    'transactions': transactions
+                    'transactions': [same_amount_tx_info(tx_id, tx_data[tx_id]) for tx_id in group]
                 })
     
     return result
 
-def group_by_time_proximity(tx_ids, tx_data, max_time_diff_hours):
-    """Группирует транзакции по временной близости"""
-    # Сортируем транзакции по времени
-    sorted_tx = []
-    for tx_id in tx_ids:
-        tx_time = tx_data[tx_id].get('tx_time')
-        if tx_time:
-            sorted_tx.append((tx_id, tx_time))
-    sorted_tx.sort(key=lambda x: x[1])
+def find_similar_amount_transactions(tx_data, max_time_diff_hours, amount_tolerance=None, amount_tolerance_pct=None,
+                                     min_transactions=2, time_index=None):
+    """Находит транзакции с близкими суммами: суммы пары отличаются не более чем на amount_tolerance тенге
+    (или на amount_tolerance_pct процентов от меньшей), время - не более чем на max_time_diff_hours.
+    Пары находятся ленточным соединением по отсортированным суммам (band_pairs), группа - связная
+    компонента пар, поэтому крайние суммы и времена группы могут отличаться больше допуска"""
+    if amount_tolerance is not None and amount_tolerance_pct is not None:
+        raise ValueError("Допуск задается либо в тенге, либо в процентах")
     
-    if not sorted_tx:
-        return []
+    if time_index is None:
+        time_index = build_indexes(tx_data)[-1]
     
-    # Группируем транзакции, находящиеся в пределах max_time_diff_hours друг от друга
-    groups = []
-    current_group = [sorted_tx[0][0]]
-    current_time = sorted_tx[0][1]
+    # Транзакции с суммой из общего индекса времени (уже в порядке времени)
+    with_amount = np.fromiter((bool(tx_data[tx_id].get('amount')) for tx_id in time_index.tx_ids), dtype=bool,
+                              count=len(time_index))
+    tx_ids = [tx_id for tx_id, ok in zip(time_index.tx_ids, with_amount.tolist()) if ok]
+    seconds = time_index.seconds[with_amount]
+    amounts = np.fromiter((tx_data[tx_id]['amount'] for tx_id in tx_ids), dtype=np.float64, count=len(tx_ids))
     
-    for tx_id, tx_time in sorted_tx[1:]:
-        time_diff = (tx_time - current_time).total_seconds() / 3600  # разница в часах
-        
-        if time_diff <= max_time_diff_hours:
-            # Транзакция находится в пределах временного окна
-            current_group.append(tx_id)
-        else:
-            # Начинаем новую группу
-            if len(current_group) > 1:
-                groups.append(current_group)
-            current_group = [tx_id]
-        
-        current_time = tx_time
+    if amount_tolerance_pct is not None:
+        # Процентный допуск - постоянная ширина в логарифмах: max / min <= 1 + pct / 100
+        keep = amounts > 0
+        tx_ids = [tx_id for tx_id, positive in zip(tx_ids, keep.tolist()) if positive]
+        amounts, seconds = amounts[keep], seconds[keep]
+        first, second = band_pairs(np.log(amounts), seconds, np.log1p(amount_tolerance_pct / 100),
+                                   int(max_time_diff_hours * 3600))
+    else:
+        first, second = band_pairs(amounts, seconds, amount_tolerance, int(max_time_diff_hours * 3600))
+    
+    components = UnionFind(len(tx_ids))
+    components.union_pairs(first.tolist(), second.tolist())
+    members = {}
+    for index in np.unique(np.concatenate((first, second))).tolist():
+        members.setdefault(components.find(index), []).append(index)
     
-    # Добавляем последнюю группу
-    if len(current_group) > 1:
-        groups.append(current_group)
+    result = []
+    for indexes in members.values():
+        if len(indexes) < min_transactions:
+            continue
+        indexes.sort(key=lambda index: seconds[index])
+        group_amounts = amounts[indexes]
+        result.append({
+            'amount': float(group_amounts.min()),
+            'amount_max': float(group_amounts.max()),
+            'transaction_count': len(indexes),
+            'transactions': [same_amount_tx_info(tx_ids[index], tx_data[tx_ids[index]], with_amount=True)
+                             for index in indexes]
+        })
     
-    return groups
+    result.sort(key=lambda group: group['amount'])
+    return result
+
+def same_amount_tx_info(tx_id, tx, with_amount=False):
+    """Описание транзакции для групп с одинаковыми (близкими) суммами"""
+    tx_info = {
+        'tx_id': tx_id,
+        'tx_time': tx.get('tx_time_str')
+    }
+    if with_amount:
+        tx_info['amount'] = tx.get('amount')
+    
+    # Добавляем информацию о плательщиках
+    if tx.get('payers'):
+        tx_info['payers'] = tx.get('payers')
+    
+    # Добавляем информацию о получателях
+    if tx.get('recipients'):
+        tx_info['recipients'] = tx.get('recipients')
+    
+    return tx_info
+
+def group_by_time_proximity(tx_ids, tx_data, max_time_diff_hours, mode='gap', min_size=2, time_index=None):
+    """Группирует транзакции по временной близости (режимы 'gap' и 'sliding', см. time_window_groups).
+    Если передан общий индекс времени, порядок транзакций берется из него без сортировки по датам"""
+    if time_index is None:
+        time_index = TimeIndex([tx_id for tx_id in tx_ids if tx_data[tx_id].get('tx_seconds') is not None],
+                               [tx_data[tx_id]['tx_seconds'] for tx_id in tx_ids
+                                if tx_data[tx_id].get('tx_seconds') is not None])
+    sorted_ids, seconds = time_index.sort(tx_ids)
+    if len(sorted_ids) < min_size:
+        return []
+    
+    starts, ends = time_window_groups(seconds, int(max_time_diff_hours * 3600), mode, min_size=min_size)
+    return [sorted_ids[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
 
 def print_related_transactions(related_groups):
     """Выводит информацию о связанных транзакциях"""
@@ -556,6 +866,9 @@ def print_related_transactions(related_groups):
         print(f"\n{'='*80}")
         print(f"Тип связи: {group_info['description']}")
         print(f"{'='*80}")
+        if 'total_groups' in group_info:
+            shown = len(group_info.get('chains', group_info.get('groups', [])))
+            print(f"Показаны {shown} из {group_info['total_groups']} групп с наибольшей оценкой")
         
         if group_info['type'] == 'chain_by_person':
             for i, chain in enumerate(group_info['chains']):
@@ -571,6 +884,41 @@ def print_related_transactions(related_groups):
                         for recipient in tx['recipients']:
                             print(f"     Получатель: {recipient['name']} ({recipient['id']})")
         
+        elif group_info['type'] == 'round_trips':
+            for i, group in enumerate(group_info['groups']):
+                person = group['person'] or {}
+                print(f"\nЦикл {i+1} (длина: {group['length']}, {group['duration_hours']} ч): "
+                      f"{person.get('name')} ({person.get('id')})")
+                for j, tx in enumerate(group['transactions']):
+                    print(f"  {j+1}. ID: {tx['tx_id']}, Сумма: {tx['amount']}, Время: {tx['tx_time']}")
+                    for payer in tx.get('payers', []):
+                        print(f"     Плательщик: {payer['name']} ({payer['id']})")
+                    for recipient in tx.get('recipients', []):
+                        print(f"     Получатель: {recipient['name']} ({recipient['id']})")
+        
+        elif group_info['type'] == 'connected_components':
+            for group in group_info['groups']:
+                print(f"\nКомпонента {group['component_id']}: участников {group['size']}, "
+                      f"транзакций {group['transaction_count']}, сумма {group['total_amount']}")
+                for member in group['members']:
+                    print(f"   {member['name']} ({member['id']})")
+        
+        elif group_info['type'] == 'fan_hubs':
+            for i, group in enumerate(group_info['groups']):
+                role = 'Получатель' if group['type'] == 'fan_in' else 'Плательщик'
+                print(f"\nКонцентратор {i+1}: {role} {group['person']['name']} ({group['person']['id']}), "
+                      f"контрагентов: {group['counterparty_count']}, с {group['bucket_start']}, сумма: {group['total_amount']}")
+                for j, tx in enumerate(group['transactions']):
+                    print(f"   {j+1}. ID: {tx['tx_id']}, Сумма: {tx['amount']}, Время: {tx['tx_time']}")
+        
+        elif group_info['type'] == 'onward_payments':
+            for i, group in enumerate(group_info['groups']):
+                print(f"\nПосредник {i+1}: {group['person']['name']} ({group['person']['id']}), пар: {group['pair_count']}")
+                for j, pair in enumerate(group['pairs']):
+                    ratio = f", доля: {pair['amount_ratio']}" if pair['amount_ratio'] is not None else ""
+                    print(f"   {j+1}. Поступление {pair['in_tx_id']} -> перевод {pair['out_tx_id']} "
+                          f"через {pair['delay_hours']} ч{ratio}")
+        
         elif group_info['type'] == 'multiple_tx_between_same_persons':
             for i, group in enumerate(group_info['groups']):
                 print(f"\nГруппа {i+1}: {group['transaction_count']} транзакций между")
@@ -597,9 +945,13 @@ def print_related_transactions(related_groups):
         
         elif group_info['type'] == 'same_amount_in_time_window':
             for i, group in enumerate(group_info['groups']):
-                print(f"\nГруппа {i+1}: {group['transaction_count']} транзакций с суммой {group['amount']}")
+                if 'amount_max' in group:
+                    print(f"\nГруппа {i+1}: {group['transaction_count']} транзакций с суммами от {group['amount']} до {group['amount_max']}")
+                else:
+                    print(f"\nГруппа {i+1}: {group['transaction_count']} транзакций с суммой {group['amount']}")
                 for j, tx in enumerate(group['transactions']):
-                    print(f"   {j+1}. ID: {tx['tx_id']}, Время: {tx['tx_time']}")
+                    amount = f", Сумма: {tx['amount']}" if 'amount' in tx else ""
+                    print(f"   {j+1}. ID: {tx['tx_id']}, Время: {tx['tx_time']}{amount}")
                     # Вывод плательщиков
                     if 'payers' in tx:
                         for payer in tx['payers']:
@@ -609,40 +961,109 @@ def print_related_transactions(related_groups):
                         for recipient in tx['recipients']:
                             print(f"      Получатель: {recipient['name']} ({recipient['id']})")
 
+def load_messages(path):
+    """Загружает сообщения из JSON (список, {"messages": [...]} или одно сообщение)"""
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    
+    # Определяем структуру данных
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict) and 'messages' in data:
+        return data['messages']
+    return [data]
+
 def main():
+    parser = argparse.ArgumentParser(description='Поиск взаимосвязанных транзакций')
+    parser.add_argument('--input', '-i', default='json do_range.json', help='Файл с сообщениями')
+    parser.add_argument('--output', '-o', help='Файл результатов (по умолчанию related_transactions.jsonl '
+                                                 'или related_transactions.json для --format json)')
+    parser.add_argument('--format', choices=('jsonl', 'json'), default='jsonl',
+                        help='jsonl - нормализованный формат с записью по мере нахождения групп, '
+                             'json - прежний формат одним массивом')
+    parser.add_argument('--index', help='Постоянный индекс SQLite: сообщения дописываются в него, '
+                                        'связи ищутся только для затронутых участников и сумм')
+    parser.add_argument('--hours', type=float, default=48, help='Временное окно поиска, часов')
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1, help='Число процессов для детекторов')
+    parser.add_argument('--top', '-k', type=int, default=100,
+                        help='Групп каждого типа с наибольшей оценкой в отчете (0 - все); в файл jsonl пишутся все группы')
+    parser.add_argument('--risk', help='JSON-файл с риском участников {ИИН/БИН: риск} для оценки групп')
+    tolerance = parser.add_mutually_exclusive_group()
+    tolerance.add_argument('--amount-tolerance', type=float, help='Поиск близких сумм: допустимое отклонение, тенге')
+    tolerance.add_argument('--amount-tolerance-pct', type=float, help='Поиск близких сумм: допустимое отклонение, %%')
+    parser.add_argument('--no-entity-resolution', action='store_true',
+                        help='Не сводить участников без ИИН/БИН и варианты наименований к сущностям')
+    
+    args = parser.parse_args()
+    output = args.output or f"related_transactions.{args.format}"
+    
     try:
         # Загружаем JSON с сообщениями
-        with open('json do_range.json', 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            
-            # Определяем структуру данных
-            if isinstance(data, list):
-                messages = data
-            elif isinstance(data, dict) and 'messages' in data:
-                messages = data['messages']
-            else:
-                messages = [data]
-            
-            print(f"Загружено {len(messages)} сообщений")
-            
-            # Находим взаимосвязанные транзакции
-            related_groups = find_related_transactions(messages, max_time_diff_hours=48)
-            
-            # Выводим результаты
-            print_related_transactions(related_groups)
+        messages = load_messages(args.input)
+        print(f"Загружено {len(messages)} сообщений")
+        
+        # Находим взаимосвязанные транзакции
+        if args.index:
+            index = TxIndex(args.index, entity_resolution=not args.no_entity_resolution)
+            new_data = parse_transactions(messages)
+            new_ids, persons, amounts = index.append(new_data)
+            print(f"Новых транзакций: {len(new_ids)}, затронуто участников: {len(persons)}, сумм: {len(amounts)}")
+            if not new_ids:
+                print("Новых транзакций нет")
+                return
             
-            # Сохраняем результаты в файл
+            # Старые транзакции берутся в пределах горизонта, за который могут сложиться цепочки и циклы
+            horizon = int(max(args.hours * 6, 168) * 3600)
+            new_seconds = [new_data[tx_id]['tx_seconds'] for tx_id in new_ids if 'tx_seconds' in new_data[tx_id]]
+            start = min(new_seconds) - horizon if new_seconds else None
+            end = max(new_seconds) + horizon if new_seconds else None
+            # Детекторы работают по затронутым транзакциям; сущности и связные компоненты индекс дописал
+            # по новым транзакциям, загружаются только компоненты, в которые входят затронутые транзакции
+            touched = index.touched_tx_ids(persons, amounts, start, end, args.amount_tolerance,
+                                           args.amount_tolerance_pct)
+            component_data = index.load_components(touched)
+            tx_data = {tx_id: component_data[tx_id] for tx_id in touched if tx_id in component_data}
+            print(f"Загружено из индекса для проверки: {len(tx_data)} транзакций, "
+                  f"с их связными компонентами - {len(component_data)} из {len(index)}")
+        else:
+            print(f"Анализируем {len(messages)} сообщений...")
+            tx_data = parse_transactions(messages)
+            component_data = None
+        
+        options = {
+            'max_time_diff_hours': args.hours,
+            'workers': args.workers,
+            'top_k': args.top or None,
+            'risk': load_risk(args.risk) if args.risk else None,
+            'entity_resolution': not args.no_entity_resolution and not args.index,
+            'component_data': component_data,
+            'stored_components': bool(args.index),
+            'amount_tolerance': args.amount_tolerance,
+            'amount_tolerance_pct': args.amount_tolerance_pct,
+        }
+        if args.format == 'jsonl':
+            # Группы записываются по мере выполнения детекторов, в памяти остаются лучшие по оценке
+            with RelatedWriter(output, component_data or tx_data) as writer:
+                related_groups = find_related_in_tx_data(tx_data, writer=writer, **options)
+        else:
+            related_groups = find_related_in_tx_data(tx_data, **options)
             if related_groups:
-                with open('related_transactions.json', 'w', encoding='utf-8') as out_file:
+                with open(output, 'w', encoding='utf-8') as out_file:
                     json.dump(related_groups, out_file, ensure_ascii=False, indent=2)
-                print("\nРезультаты сохранены в файл 'related_transactions.json'")
+        
+        # Выводим результаты
+        print_related_transactions(related_groups)
+        if related_groups:
+            print(f"\nРезультаты сохранены в файл '{output}'")
     
     except FileNotFoundError:
         print("Файл с сообщениями не найден")
     except json.JSONDecodeError as e:
         print(f"Ошибка при декодировании JSON: {e}")
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
     except Exception as e:
         print(f"Произошла ошибка: {e}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,189 @@
+import sqlite3
+import argparse
+from datetime import datetime
+
+# Индекс дубликатов для IS_ABR_DUBLICATE: ключ (TRUNC(OPER_TRANS_DATE), CFM_MAINCODE, OPER_NUMBER,
+# ИИН/БИН Плательщика 1, ИИН/БИН Плательщика 2) -> количество сообщений с этим ключом.
+# NULL в ключе хранится как пустая строка и совпадает только с NULL (в пакете пустое поле снимало фильтр).
+# Для каждого сообщения запоминается счетчик на момент его поступления (1 - первое сообщение с этим ключом),
+# чтобы при повторном ранжировании результат не зависел от дубликатов, поступивших позже.
+
+DUPLICATES_DDL = """
+CREATE TABLE IF NOT EXISTS SIM_DUP_INDEX (
+    OPER_DATE TEXT NOT NULL,
+    CFM_MAINCODE TEXT NOT NULL,
+    OPER_NUMBER TEXT NOT NULL,
+    MAINCODE_PL1 TEXT NOT NULL,
+    MAINCODE_PL2 TEXT NOT NULL,
+    MESS_COUNT INTEGER NOT NULL,
+    PRIMARY KEY (OPER_DATE, CFM_MAINCODE, OPER_NUMBER, MAINCODE_PL1, MAINCODE_PL2)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS SIM_DUP_MESS (
+    MESS_ID INTEGER PRIMARY KEY,
+    MESS_COUNT INTEGER
+);
+"""
+
+DWH_KEYS_SQL = """
+SELECT MI.MESS_ID, OP.OPER_TRANS_DATE, SB.CFM_MAINCODE, OP.OPER_NUMBER, PL1.MEMBER_MAINCODE, PL2.MEMBER_MAINCODE
+FROM EXP_MESSINFO MI
+JOIN EXP_OPERATION OP ON OP.MESS_ID = MI.MESS_ID
+JOIN EXP_SUBJ SB ON SB.MESS_ID = MI.MESS_ID
+LEFT JOIN EXP_MEMBERS PL1 ON PL1.MESS_ID = MI.MESS_ID AND PL1.SIM_MEMBER_MEMBERCODE = 210131 AND PL1.MEMBER_ID = 1
+LEFT JOIN EXP_MEMBERS PL2 ON PL2.MESS_ID = MI.MESS_ID AND PL2.SIM_MEMBER_MEMBERCODE = 210131 AND PL2.MEMBER_ID = 2
+"""
+
+
+def _trunc_date(value):
+    """TRUNC(даты) в виде строки YYYY-MM-DD"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    try:
+        return datetime.fromisoformat(value).date().isoformat()
+    except ValueError:
+        return str(value)[:10]
+
+
+def _key_part(value):
+    """Значение части ключа (NULL -> пустая строка)"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def duplicate_key(p):
+    """Ключ дубликата для параметров сообщения"""
+    return (_trunc_date(p.get('goper_trans_date')),
+            _key_part(p.get('gcfm_maincode')),
+            _key_part(p.get('goper_number')),
+            _key_part(p.get('gmember_maincode_pl1')),
+            _key_part(p.get('gmember_maincode_pl2')))
+
+
+class DuplicateIndex:
+    """Счетчики сообщений по ключу дубликата: в памяти или в таблице SIM_DUP_INDEX"""
+
+    def __init__(self, conn=None):
+        self.conn = conn
+        self.counts = {}
+        self.seen = {}  # MESS_ID -> счетчик на момент поступления
+        if conn is not None:
+            conn.executescript(DUPLICATES_DDL)
+
+    def add_batch(self, params_list):
+        """Учитывает порцию сообщений и возвращает их счетчики на момент поступления
+        (повторное добавление MESS_ID не учитывается и возвращает сохраненный счетчик)"""
+        if self.conn is None:
+            return self._add_batch_memory(params_list)
+        return self._add_batch_db(params_list)
+
+    def add(self, p):
+        """Учитывает одно сообщение и возвращает его счетчик на момент поступления"""
+        return self.add_batch([p])[p.get('gmess_id')]
+
+    def count(self, p):
+        """Возвращает количество учтенных сообщений с ключом данного сообщения"""
+        return self.count_key(duplicate_key(p))
+
+    def arrival_count(self, mess_id):
+        """Счетчик сообщения на момент поступления (None, если сообщение не учтено)"""
+        if self.conn is None:
+            return self.seen.get(mess_id)
+        row = self.conn.execute("SELECT MESS_COUNT FROM SIM_DUP_MESS WHERE MESS_ID = ?", (mess_id,)).fetchone()
+        return row[0] if row else None
+
+    def count_key(self, key):
+        """Возвращает счетчик по готовому ключу"""
+        if self.conn is None:
+            return self.counts.get(key, 0)
+        row = self.conn.execute("""
+            SELECT MESS_COUNT FROM SIM_DUP_INDEX WHERE OPER_DATE = ? AND CFM_MAINCODE = ? AND OPER_NUMBER = ?
+            AND MAINCODE_PL1 = ? AND MAINCODE_PL2 = ?
+        """, key).fetchone()
+        return row[0] if row else 0
+
+    def _add_batch_memory(self, params_list):
+        """add_batch для индекса в памяти"""
+        counts = {}
+        for p in params_list:
+            mess_id = p.get('gmess_id')
+            if mess_id not in self.seen:
+                key = duplicate_key(p)
+                self.counts[key] = self.counts.get(key, 0) + 1
+                self.seen[mess_id] = self.counts[key]
+            counts[mess_id] = self.seen[mess_id]
+        return counts
+
+    def _add_batch_db(self, params_list):
+        """add_batch для индекса в базе: счетчики обновляются в одной транзакции"""
+        conn = self.conn
+        keys = {p.get('gmess_id'): duplicate_key(p) for p in params_list}
+        counts = {}
+        own_transaction = not conn.in_transaction
+        if own_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            for mess_id, key in keys.items():
+                row = conn.execute("SELECT MESS_COUNT FROM SIM_DUP_MESS WHERE MESS_ID = ?", (mess_id,)).fetchone()
+                if row is not None:
+                    counts[mess_id] = row[0]
+                    continue
+                counts[mess_id] = conn.execute("""
+                    INSERT INTO SIM_DUP_INDEX (OPER_DATE, CFM_MAINCODE, OPER_NUMBER, MAINCODE_PL1, MAINCODE_PL2, MESS_COUNT)
+                    VALUES (?, ?, ?, ?, ?, 1)
+                    ON CONFLICT DO UPDATE SET MESS_COUNT = MESS_COUNT + 1
+                    RETURNING MESS_COUNT
+                """, key).fetchone()[0]
+                conn.execute("INSERT INTO SIM_DUP_MESS (MESS_ID, MESS_COUNT) VALUES (?, ?)", (mess_id, counts[mess_id]))
+            if own_transaction:
+                conn.execute("COMMIT")
+        except BaseException:
+            if own_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return counts
+
+
+def rebuild_from_dwh(conn, index, batch_size=10000):
+    """Заполняет индекс по всем сообщениям из таблиц DWH_KFM"""
+    total = 0
+    cursor = conn.execute(DWH_KEYS_SQL)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        index.add_batch([{
+            'gmess_id': mess_id,
+            'goper_trans_date': trans_date,
+            'gcfm_maincode': cfm_maincode,
+            'goper_number': oper_number,
+            'gmember_maincode_pl1': maincode_pl1,
+            'gmember_maincode_pl2': maincode_pl2,
+        } for mess_id, trans_date, cfm_maincode, oper_number, maincode_pl1, maincode_pl2 in rows])
+        total += len(rows)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Построение индекса дубликатов (Перевод за рубеж)')
+    parser.add_argument('--db', '-d', default='sim_range.db', help='Путь к базе SQLite')
+
+    args = parser.parse_args()
+
+    try:
+        from sim_params import connect
+        conn = connect(args.db)
+        index = DuplicateIndex(conn)
+        # Курсор по DWH и запись индекса используют разные соединения, чтобы не держать транзакцию на чтении
+        total = rebuild_from_dwh(connect(args.db), index)
+        duplicates = conn.execute("SELECT COUNT(*), COALESCE(SUM(MESS_COUNT), 0) FROM SIM_DUP_INDEX WHERE MESS_COUNT > 1").fetchone()
+        print(f"Проиндексировано {total} сообщений, ключей с дубликатами: {duplicates[0]} ({duplicates[1]} сообщений)")
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import re
+from bisect import bisect_left
+from functools import lru_cache
+
+# Компилятор шаблонов SQL LIKE: набор шаблонов превращается в один сопоставитель на поле.
+# Семантика как в PostgreSQL: '%' - любая последовательность, '_' - один символ, '\' экранирует
+# следующий символ, сравнение с учетом регистра (LOWER применяется до сопоставления), NULL не совпадает.
+
+
+def _split_pattern(pattern):
+    """Разбивает шаблон на части между '%'; возвращает (части, есть ли '_')"""
+    parts = ['']
+    has_underscore = False
+    chars = iter(pattern)
+    for char in chars:
+        if char == '\\':
+            parts[-1] += next(chars, '\\')
+        elif char == '%':
+            parts.append('')
+        elif char == '_':
+            has_underscore = True
+            parts[-1] += char
+        else:
+            parts[-1] += char
+    return parts, has_underscore
+
+
+@lru_cache(maxsize=None)
+def like_regex(pattern):
+    """Компилирует шаблон SQL LIKE в регулярное выражение для fullmatch"""
+    parts = []
+    chars = iter(pattern)
+    for char in chars:
+        if char == '\\':
+            parts.append(re.escape(next(chars, '\\')))
+        elif char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts), re.DOTALL)
+
+
+class LikeMatcher:
+    """Набор шаблонов LIKE, проверяемых за один проход по тексту; результат - битовая маска совпадений"""
+
+    def __init__(self, patterns):
+        self.patterns = list(dict.fromkeys(patterns))
+        self.bits = {pattern: 1 << i for i, pattern in enumerate(self.patterns)}
+        self.plans = []  # (бит, префикс, суффикс, средние части) или (бит, регулярное выражение) для '_'
+        middle_segments = set()
+
+        for pattern in self.patterns:
+            bit = self.bits[pattern]
+            parts, has_underscore = _split_pattern(pattern)
+            if has_underscore:
+                self.plans.append((bit, like_regex(pattern)))
+            elif len(parts) == 1:
+                self.plans.append((bit, parts[0], None, ()))
+            else:
+                middle = tuple(part for part in parts[1:-1] if part)
+                middle_segments.update(middle)
+                self.plans.append((bit, parts[0], parts[-1], middle))
+
+        # Альтернативы упорядочены по убыванию длины: в каждой позиции захватывается самая длинная,
+        # остальные совпадения в этой позиции - ее префиксы из того же набора
+        segments = sorted(middle_segments, key=lambda s: (-len(s), s))
+        self.scanner = re.compile('(?=(' + '|'.join(map(re.escape, segments)) + '))') if segments else None
+        self.prefixes = {s: [t for t in segments if s.startswith(t)] for s in segments}
+
+    def mask(self, patterns):
+        """Битовая маска для набора шаблонов"""
+        result = 0
+        for pattern in patterns:
+            result |= self.bits[pattern]
+        return result
+
+    def _occurrences(self, text):
+        """Позиции вхождений всех средних частей шаблонов за один проход по тексту"""
+        positions = {}
+        if self.scanner is None:
+            return positions
+        prefixes = self.prefixes
+        for found in self.scanner.finditer(text):
+            start = found.start()
+            for segment in prefixes[found.group(1)]:
+                positions.setdefault(segment, []).append(start)
+        return positions
+
+    def match(self, text):
+        """Возвращает битовую маску шаблонов, которым соответствует текст (None для NULL)"""
+        if text is None:
+            return None
+        positions = self._occurrences(text)
+        length = len(text)
+        hits = 0
+
+        for plan in self.plans:
+            if len(plan) == 2:
+                if plan[1].fullmatch(text) is not None:
+                    hits |= plan[0]
+                continue
+
+            bit, prefix, suffix, middle = plan
+            if suffix is None:
+                if text == prefix:
+                    hits |= bit
+                continue
+            if not (text.startswith(prefix) and text.endswith(suffix)):
+                continue
+            limit = length - len(suffix)
+            pos = len(prefix)
+            if pos > limit:
+                continue
+            # Жадный поиск самого левого вхождения каждой части после предыдущей
+            for segment in middle:
+                found = positions.get(segment)
+                if not found:
+                    break
+                i = bisect_left(found, pos)
+                if i == len(found) or found[i] + len(segment) > limit:
+                    break
+                pos = found[i] + len(segment)
+            else:
+                hits |= bit
+        return hits
+
+    def like(self, hits, pattern):
+        """value LIKE pattern по маске совпадений"""
+        return hits is not None and bool(hits & self.bits[pattern])
+
+    def not_like(self, hits, pattern):
+        """value NOT LIKE pattern по маске совпадений"""
+        return hits is not None and not hits & self.bits[pattern]
+
+    def any_like(self, hits, mask):
+        """value LIKE хотя бы одному шаблону из маски"""
+        return hits is not None and bool(hits & mask)
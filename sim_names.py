@@ -0,0 +1,93 @@
+import re
+from functools import lru_cache
+
+# Нормализация наименований участников для сверки со списками вместо UPPER(NAME) = UPPER(gMEMBER_NAME_*):
+# регистр, кавычки и пробелы, организационно-правовая форма, латинские буквы, похожие на кириллические.
+
+# Латинские буквы, совпадающие по начертанию с кириллическими (в верхнем регистре), после casefold
+HOMOGLYPHS = str.maketrans({
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к', 'm': 'м',
+    'o': 'о', 'p': 'р', 't': 'т', 'x': 'х', 'y': 'у', 'ё': 'е', 'i': 'і',
+})
+
+# Организационно-правовые формы: одна удаляется в начале наименования, в конце - все подряд ("Co Ltd")
+LEGAL_FORMS = (
+    'товарищество с ограниченной ответственностью', 'товарищество с дополнительной ответственностью',
+    'акционерное общество', 'публичное акционерное общество', 'открытое акционерное общество',
+    'закрытое акционерное общество', 'общество с ограниченной ответственностью',
+    'индивидуальный предприниматель', 'крестьянское хозяйство', 'фермерское хозяйство',
+    'limited liability partnership', 'limited liability company', 'joint stock company',
+    'тоо', 'тдо', 'ао', 'пао', 'оао', 'зао', 'ооо', 'ип', 'кх', 'фх', 'чп',
+    'llp', 'llc', 'ltd', 'limited', 'inc', 'corp', 'corporation', 'co', 'company',
+    'jsc', 'plc', 'gmbh', 'ag', 'sa', 'bv', 'nv', 'srl', 'spa', 'oy', 'ab', 'as', 'fze', 'fzco',
+)
+
+# Короткие формы, совпадающие с началом обычных наименований ("AB Co Holding"): удаляются только в конце
+TRAILING_ONLY_FORMS = ('co', 'ag', 'sa', 'bv', 'nv', 'oy', 'ab', 'as')
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def _fold(text):
+    """Регистр, пунктуация и кавычки, латинские двойники кириллических букв"""
+    return _NON_WORD.sub(' ', text.casefold()).translate(HOMOGLYPHS).split()
+
+
+# Формы в виде последовательностей слов, длинные проверяются первыми
+_LEGAL_FORM_TOKENS = sorted({tuple(_fold(form)) for form in LEGAL_FORMS}, key=len, reverse=True)
+_TRAILING_ONLY_TOKENS = {tuple(_fold(form)) for form in TRAILING_ONLY_FORMS}
+
+
+def _strip_legal_forms(tokens):
+    """Удаляет организационно-правовую форму в начале наименования и формы в его конце; формы внутри
+    наименования не трогаются, хотя бы одно слово всегда остается"""
+    for form in _LEGAL_FORM_TOKENS:
+        size = len(form)
+        if form not in _TRAILING_ONLY_TOKENS and len(tokens) > size and tuple(tokens[:size]) == form:
+            tokens = tokens[size:]
+            break
+
+    changed = True
+    while changed:
+        changed = False
+        for form in _LEGAL_FORM_TOKENS:
+            size = len(form)
+            if len(tokens) > size and tuple(tokens[-size:]) == form:
+                tokens = tokens[:-size]
+                changed = True
+                break
+    return tokens
+
+
+@lru_cache(maxsize=100000)
+def normalize_name(name):
+    """Ключ наименования для сверки со списками (None для NULL или пустого наименования)"""
+    if name is None:
+        return None
+    tokens = _strip_legal_forms(_fold(name))
+    return ' '.join(tokens) or None
+
+
+class NameIndex:
+    """Хеш-индекс строк списка по нормализованному наименованию и (необязательно) по БИН"""
+
+    def __init__(self, rows):
+        # rows: (идентификатор строки, БИН или None, наименование)
+        self.by_name = {}
+        self.by_bin = {}
+        for row_id, bin_code, name in rows:
+            key = normalize_name(name)
+            if key is not None:
+                self.by_name.setdefault(key, []).append(row_id)
+            if bin_code is not None:
+                self.by_bin.setdefault(str(bin_code), []).append(row_id)
+
+    def count(self, name, bin_code=None):
+        """Количество строк списка, совпавших по наименованию или БИН (аналог COUNT(*) по соединению)"""
+        by_name = self.by_name.get(normalize_name(name), ()) if name is not None else ()
+        by_bin = self.by_bin.get(str(bin_code), ()) if bin_code is not None else ()
+        if not by_bin:
+            return len(by_name)
+        if not by_name:
+            return len(by_bin)
+        return len(set(by_name).union(by_bin))
@@ -0,0 +1,340 @@
+import os
+import asyncio
+import base64
+import argparse
+from collections import deque
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import xml.etree.ElementTree as ET
+
+# Настройки подключения к входящему сервису SimBASE (аналог gURL и vAUTHDATA из pkg_sim_range)
+SIMBASE_SETTINGS = {
+    "url": os.environ.get("SIMBASE_URL", "http://eias-api-db.servers.int:8080"),
+    "user": os.environ.get("SIMBASE_USER", "eias"),
+    "password": os.environ.get("SIMBASE_PASSWORD", ""),
+    "local_host_ip": os.environ.get("SIMBASE_LOCAL_IP", "192.168.1.1"),
+    "max_in_flight": 16,  # Максимальное число одновременных запросов
+    "pool_size": 8,  # Максимальное число keep-alive соединений в пуле
+    "timeout": 10.0,  # Таймаут одного запроса, секунд
+}
+
+REQUEST_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<sbapi>
+    <header>
+        <interface id="201592835" version="8" />
+        <message ignore_id="yes" id="1" type="5000" created="{created}" />
+        <error id="0" />
+        <auth pwd="open">{auth}</auth>
+    </header>
+    <body>
+        <function name="f_opr">
+            <arg name="o_mess_id">{mess_id}</arg>
+            <arg name="o_action">{action}</arg>
+        </function>
+    </body>
+</sbapi>"""
+
+
+def build_auth(settings=SIMBASE_SETTINGS):
+    """Формирует блок авторизации authdata в base64"""
+    authdata = (f'<authdata msg_id="1" user="{settings["user"]}" password="{settings["password"]}" '
+                f'msg_type="5000" user_ip="{settings["local_host_ip"]}" />')
+    return base64.b64encode(authdata.encode('utf-8')).decode('ascii')
+
+
+def build_request(mess_id, action, auth=None, created=None):
+    """Формирует XML-запрос sbapi о поступлении сообщения (аналог SIM_SEND_MESS)"""
+    if created is None:
+        created = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    if auth is None:
+        auth = build_auth()
+    return REQUEST_TEMPLATE.format(created=created, auth=auth, mess_id=mess_id, action=action)
+
+
+def parse_error(response_text):
+    """Извлекает код и текст ошибки из ответа SimBASE (код None, если ответ не разобран)"""
+    try:
+        root = ET.fromstring(response_text)
+    except ET.ParseError as e:
+        return None, f"Некорректный XML в ответе: {e}"
+
+    error = root.find('header/error')
+    if error is None:
+        error = root.find('.//error')
+    if error is None:
+        return None, "В ответе нет элемента error"
+
+    error_text = ET.tostring(error, encoding='unicode').strip()
+    return error.get('id'), error_text
+
+
+class ConnectionPool:
+    """Пул keep-alive соединений к одному хосту"""
+
+    def __init__(self, host, port, size):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.idle = deque()
+
+    async def acquire(self):
+        """Возвращает свободное соединение и признак его повторного использования"""
+        while self.idle:
+            reader, writer = self.idle.popleft()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            # Соединение закрыто сервером: транспорт освобождается до открытия нового
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return reader, writer, False
+
+    def release(self, reader, writer, keep_alive):
+        """Возвращает соединение в пул или закрывает его"""
+        if keep_alive and len(self.idle) < self.size and not writer.is_closing():
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def close(self):
+        """Закрывает все свободные соединения"""
+        while self.idle:
+            _, writer = self.idle.popleft()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+async def read_http_response(reader):
+    """Читает HTTP/1.1 ответ: статус, заголовки и тело (Content-Length, chunked или до закрытия)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Соединение закрыто сервером")
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            body += await reader.readexactly(size)
+            await reader.readline()
+        body = bytes(body)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body = await reader.read()
+        headers['connection'] = 'close'
+
+    keep_alive = headers.get('connection', '').lower() != 'close'
+    return status, body, keep_alive
+
+
+class SimNotifier:
+    """Асинхронная отправка уведомлений в SimBASE с пулом соединений и ограничением параллелизма"""
+
+    def __init__(self, settings=SIMBASE_SETTINGS):
+        self.settings = settings
+        url = urlsplit(settings["url"])
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.path = url.path or '/'
+        self.timeout = settings["timeout"]
+        self.auth = build_auth(settings)
+        self.pool = ConnectionPool(self.host, self.port, settings["pool_size"])
+        self.semaphore = asyncio.Semaphore(settings["max_in_flight"])
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.pool.close()
+
+    async def _post(self, content):
+        """Отправляет POST-запрос; при обрыве переиспользованного соединения повторяет на новом"""
+        payload = content.encode('utf-8')
+        request = (f"POST {self.path} HTTP/1.1\r\n"
+                   f"Host: {self.host}:{self.port}\r\n"
+                   f"Content-Type: text/xml;charset=UTF-8\r\n"
+                   f"Content-Length: {len(payload)}\r\n"
+                   f"Connection: keep-alive\r\n\r\n").encode('latin-1') + payload
+
+        while True:
+            reader, writer, reused = await self.pool.acquire()
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, body, keep_alive = await read_http_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            self.pool.release(reader, writer, keep_alive)
+            return status, body.decode('utf-8', errors='replace')
+
+    async def send(self, mess_id, action, content=None):
+        """Отправляет одно уведомление и возвращает результат доставки"""
+        if content is None:
+            content = build_request(mess_id, action, auth=self.auth)
+        result = {"mess_id": mess_id, "action": action, "content": content,
+                  "error_code": None, "error_text": None}
+
+        async with self.semaphore:
+            try:
+                status, response = await asyncio.wait_for(self._post(content), self.timeout)
+            except asyncio.TimeoutError:
+                result["error_text"] = f"Таймаут {self.timeout} с"
+                return result
+            except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                result["error_text"] = f"Ошибка соединения: {e}"
+                return result
+
+        if status != 200:
+            result["error_text"] = f"HTTP {status}"
+            return result
+
+        result["error_code"], result["error_text"] = parse_error(response)
+        return result
+
+    async def send_many(self, actions):
+        """Отправляет набор уведомлений (mess_id, action) параллельно"""
+        return await asyncio.gather(*(self.send(mess_id, action) for mess_id, action in actions))
+
+
+def is_delivered(result):
+    """Проверяет, что SimBASE принял уведомление (error id = 0)"""
+    return result["error_code"] == '0'
+
+
+def notify(actions, settings=SIMBASE_SETTINGS):
+    """Синхронная обертка: отправляет уведомления и возвращает результаты"""
+    async def run():
+        async with SimNotifier(settings) as notifier:
+            return await notifier.send_many(actions)
+    return asyncio.run(run())
+
+
+# ============= Локальная заглушка SimBASE для отладки =============
+
+STUB_RESPONSE_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<sbapi>
+    <header>
+        <interface id="201592835" version="8" />
+        <message id="1" type="5001" />
+        <error id="{error_id}">{error_text}</error>
+    </header>
+    <body />
+</sbapi>"""
+
+
+async def handle_stub_connection(reader, writer, failing_ids, delay):
+    """Обрабатывает запросы одного keep-alive соединения заглушки"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            if delay:
+                await asyncio.sleep(delay)
+
+            mess_id = None
+            try:
+                arg = ET.fromstring(body).find(".//arg[@name='o_mess_id']")
+                mess_id = arg.text if arg is not None else None
+            except ET.ParseError:
+                pass
+
+            if mess_id in failing_ids:
+                response = STUB_RESPONSE_TEMPLATE.format(error_id=1, error_text="Сообщение не найдено")
+            else:
+                response = STUB_RESPONSE_TEMPLATE.format(error_id=0, error_text="")
+            payload = response.encode('utf-8')
+            writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: text/xml;charset=UTF-8\r\n"
+                          f"Content-Length: {len(payload)}\r\nConnection: keep-alive\r\n\r\n").encode('latin-1') + payload)
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_stub_server(host='127.0.0.1', port=0, failing_ids=(), delay=0.0):
+    """Запускает заглушку SimBASE; для MESS_ID из failing_ids возвращает error id = 1"""
+    failing_ids = {str(mess_id) for mess_id in failing_ids}
+    return await asyncio.start_server(
+        lambda r, w: handle_stub_connection(r, w, failing_ids, delay), host, port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Отправка уведомлений в SimBASE')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    send_parser = subparsers.add_parser('send', help='Отправить уведомления')
+    send_parser.add_argument('--url', '-u', default=SIMBASE_SETTINGS["url"], help='Адрес сервиса SimBASE')
+    send_parser.add_argument('--max-in-flight', '-m', type=int, default=SIMBASE_SETTINGS["max_in_flight"],
+                             help='Максимальное число одновременных запросов')
+    send_parser.add_argument('actions', nargs='+', help='Пары MESS_ID:ACTION, например 67810568:5')
+
+    serve_parser = subparsers.add_parser('serve', help='Запустить локальную заглушку SimBASE')
+    serve_parser.add_argument('--port', '-p', type=int, default=8080, help='Порт заглушки')
+    serve_parser.add_argument('--delay', type=float, default=0.0, help='Задержка ответа, секунд')
+    serve_parser.add_argument('--fail', nargs='*', default=[], help='MESS_ID, для которых вернуть ошибку')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        async def serve():
+            server = await start_stub_server('127.0.0.1', args.port, args.fail, args.delay)
+            print(f"Заглушка SimBASE запущена на порту {args.port}")
+            async with server:
+                await server.serve_forever()
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    try:
+        actions = []
+        for item in args.actions:
+            mess_id, _, action = item.partition(':')
+            actions.append((int(mess_id), int(action)))
+    except ValueError:
+        print("Ошибка: ожидаются пары MESS_ID:ACTION")
+        return
+
+    settings = dict(SIMBASE_SETTINGS, url=args.url, max_in_flight=args.max_in_flight)
+    for result in notify(actions, settings):
+        status = "доставлено" if is_delivered(result) else f"ошибка ({result['error_text']})"
+        print(f"Сообщение {result['mess_id']}, действие {result['action']}: {status}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+import uuid
+import hashlib
+import sqlite3
+import argparse
+from pprint import pprint
+from collections import OrderedDict
+
+from sim_names import NameIndex
+
+# Локальная копия таблиц DWH_KFM и SIMDATA (SQLite) для отладки ранжирования без доступа к БД
+SCHEMA_DDL = """
+CREATE TABLE IF NOT EXISTS EXP_MESSINFO (
+    MESS_ID INTEGER PRIMARY KEY,
+    MESS_OPER_STATUS INTEGER,
+    MESS_REASON_CODE INTEGER
+);
+CREATE TABLE IF NOT EXISTS EXP_OPERATION (
+    MESS_ID INTEGER PRIMARY KEY,
+    OPER_NUMBER TEXT,
+    OPER_TRANS_DATE TEXT,
+    OPER_TENGE_AMOUNT REAL,
+    OPER_CURRENCY_AMOUNT REAL,
+    OPER_IDVIEW INTEGER,
+    OPER_IDTYPE INTEGER,
+    OPER_SUSP_FIRST INTEGER,
+    OPER_SUSP_SECOND INTEGER,
+    OPER_SUSP_THIRD INTEGER,
+    OPER_DOPINFO TEXT,
+    OPER_DIFFICULTIES TEXT
+);
+CREATE TABLE IF NOT EXISTS EXP_SUBJ (
+    MESS_ID INTEGER PRIMARY KEY,
+    CFM_MAINCODE TEXT,
+    CFM_CODE INTEGER
+);
+CREATE TABLE IF NOT EXISTS MESS_OFM (
+    MESS_OFM_ID INTEGER PRIMARY KEY,
+    RECEIVE_DATE TEXT
+);
+CREATE TABLE IF NOT EXISTS EXP_MEMBERS (
+    MESS_ID INTEGER,
+    SIM_MEMBER_MEMBERCODE INTEGER,
+    MEMBER_ID INTEGER,
+    MEMBER_MAINCODE TEXT,
+    MEMBER_RESIDENCE_COUNTRYCODE INTEGER,
+    MEMBER_BANK_ADDRESS TEXT,
+    MEMBER_TYPE INTEGER,
+    MEMBER_UR_NAME TEXT,
+    MEMBER_AC_SECONDNAME TEXT,
+    MEMBER_AC_FIRSTNAME TEXT,
+    MEMBER_AC_MIDDLENAME TEXT,
+    MONEY_TRANS_SYS INTEGER,
+    MEMBER_COMMENTS TEXT
+);
+CREATE INDEX IF NOT EXISTS EXP_MEMBERS_MESS_ID ON EXP_MEMBERS (MESS_ID, MEMBER_ID);
+
+CREATE TABLE IF NOT EXISTS LIST_ABROAD_GREEN_1 (BIN TEXT, NAME TEXT);
+CREATE TABLE IF NOT EXISTS LIST_ABROAD_GREEN_2 (BIN TEXT, NAME TEXT);
+CREATE TABLE IF NOT EXISTS LIST_ABROAD_SUBSOIL_USERS (BIN TEXT, NAME TEXT);
+CREATE TABLE IF NOT EXISTS LIST_ABROAD_RED_1 (BIN TEXT);
+CREATE TABLE IF NOT EXISTS LIST_ABROAD_RED_2 (BIN TEXT);
+CREATE TABLE IF NOT EXISTS LIST_ABROAD_RED_3 (BIN TEXT);
+CREATE TABLE IF NOT EXISTS LIST_ABROAD_RED_4 (NAME TEXT);
+CREATE TABLE IF NOT EXISTS LIST_ABROAD_RED_5 (NAME TEXT);
+CREATE TABLE IF NOT EXISTS LIST_ABROAD_FATF (CODE INTEGER);
+CREATE TABLE IF NOT EXISTS LIST_OD_50_FORBS (IIN TEXT);
+CREATE TABLE IF NOT EXISTS LIST_OD_FL_POST_BT (IIN TEXT);
+CREATE TABLE IF NOT EXISTS LIST_OD_NP_MON (BIN TEXT);
+CREATE TABLE IF NOT EXISTS LIST_OD_UCH_PLAT (IINBIN TEXT);
+CREATE TABLE IF NOT EXISTS LIST_OD_UL_POST_BT (BIN TEXT);
+CREATE TABLE IF NOT EXISTS LIST_FT_ISKL (IIN TEXT, LASTNAME TEXT, FIRSTNAME TEXT, PATRONYMIC TEXT);
+CREATE TABLE IF NOT EXISTS LIST_FT_MGR (LASTNAME TEXT, FIRSTNAME TEXT, PATRONYMIC TEXT);
+CREATE TABLE IF NOT EXISTS LIST_FT_DRT (IIN TEXT, LASTNAME TEXT, FIRSTNAME TEXT, PATRONYMIC TEXT);
+CREATE TABLE IF NOT EXISTS LIST_DMFT_FT_RELATED_FL (IIN TEXT, LASTNAME TEXT, FIRSTNAME TEXT, PATRONYMIC TEXT);
+CREATE TABLE IF NOT EXISTS LIST_DMFT_FT_RELATED_UL (NAME TEXT);
+CREATE TABLE IF NOT EXISTS LIST_DMFT_POS_INVOLV (LASTNAME TEXT, FIRSTNAME TEXT, PATRONYMIC TEXT);
+CREATE TABLE IF NOT EXISTS LIST_DMFT_PDL (IIN TEXT, LASTNAME TEXT, FIRSTNAME TEXT, PATRONYMIC TEXT);
+
+CREATE TABLE IF NOT EXISTS SIM_CHECK_MESS (
+    MESS_ID INTEGER PRIMARY KEY,
+    MESS_ADDED TEXT
+);
+CREATE TABLE IF NOT EXISTS SIM_RANK (
+    MESS_ID INTEGER PRIMARY KEY,
+    MESS_RANK INTEGER,
+    MESS_CRITERIA INTEGER
+);
+-- Журнал уведомлений SIM_SEND_MESS (действие o_action по сообщению), выгружается вместе с SIM_RANK
+CREATE TABLE IF NOT EXISTS SIM_SENT_MESS (
+    MESS_ID INTEGER NOT NULL,
+    ACTION INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS SIM_ERROR_MESS (
+    MESS_ID INTEGER PRIMARY KEY,
+    ERROR_TEXT TEXT,
+    ERROR_DATE TEXT
+);
+"""
+
+# Коды ролей участников в EXP_MEMBERS
+PAYER_MEMBERCODE = 210131
+RECIPIENT_MEMBERCODE = 210132
+
+# Заголовок сообщения: одна строка на MESS_ID плюс строки участников 1 и 2 (пивот выполняется в Python за один проход)
+BATCH_PARAMS_SQL = """
+SELECT MI.MESS_ID, MO.RECEIVE_DATE, OP.OPER_NUMBER, OP.OPER_TRANS_DATE, MI.MESS_OPER_STATUS,
+    MI.MESS_REASON_CODE, OP.OPER_TENGE_AMOUNT, OP.OPER_CURRENCY_AMOUNT, OP.OPER_IDVIEW, OP.OPER_IDTYPE,
+    OP.OPER_SUSP_FIRST, OP.OPER_SUSP_SECOND, OP.OPER_SUSP_THIRD,
+    SB.CFM_MAINCODE, SB.CFM_CODE, OP.OPER_DOPINFO, OP.OPER_DIFFICULTIES,
+    M.SIM_MEMBER_MEMBERCODE, M.MEMBER_ID, M.MEMBER_MAINCODE, M.MEMBER_RESIDENCE_COUNTRYCODE,
+    M.MEMBER_BANK_ADDRESS, M.MEMBER_TYPE, M.MEMBER_UR_NAME, M.MEMBER_AC_SECONDNAME,
+    M.MEMBER_AC_FIRSTNAME, M.MEMBER_AC_MIDDLENAME, M.MONEY_TRANS_SYS, M.MEMBER_COMMENTS
+FROM temp.BATCH_MESS B
+JOIN EXP_MESSINFO MI ON MI.MESS_ID = B.MESS_ID
+JOIN EXP_OPERATION OP ON OP.MESS_ID = MI.MESS_ID
+JOIN EXP_SUBJ SB ON SB.MESS_ID = MI.MESS_ID
+JOIN MESS_OFM MO ON MO.MESS_OFM_ID = MI.MESS_ID
+LEFT JOIN EXP_MEMBERS M ON M.MESS_ID = MI.MESS_ID AND M.MEMBER_ID IN (1, 2)
+ORDER BY MI.MESS_ID, M.rowid
+"""
+
+HEADER_FIELDS = [
+    'gmess_id', 'greceive_date', 'goper_number', 'goper_trans_date', 'gmess_oper_status',
+    'gmess_reason_code', 'goper_tenge_amount', 'goper_currency_amount', 'goper_idview', 'goper_idtype',
+    'goper_susp_first', 'goper_susp_second', 'goper_susp_third',
+    'gcfm_maincode', 'gcfm_code', 'goper_dopinfo', 'goper_difficulties'
+]
+
+# Слоты плательщиков/получателей: (суффикс, код роли, MEMBER_ID)
+PARTY_SLOTS = [
+    ('pl1', PAYER_MEMBERCODE, 1),
+    ('pl2', PAYER_MEMBERCODE, 2),
+    ('pol1', RECIPIENT_MEMBERCODE, 1),
+    ('pol2', RECIPIENT_MEMBERCODE, 2),
+]
+
+# Проверки вхождения в списки по наименованию: (шаблон флага, таблица, колонка БИН, слоты,
+# шаблон ключа БИН, шаблон ключа наименования). Наименования сравниваются по normalize_name вместо UPPER.
+# Для LIST_ABROAD_GREEN_1 БИН не используется: в SET_PARAMS условие "BIN != NULL" всегда ложно
+NAME_LIST_CHECKS = [
+    ('gis_green_1_{slot}', 'LIST_ABROAD_GREEN_1', None, ('pol1', 'pol2', 'pl1', 'pl2'), None, 'gmember_name_{slot}'),
+    ('gis_green_2_{slot}', 'LIST_ABROAD_GREEN_2', 'BIN', ('pl1', 'pl2'), 'gmember_maincode_{slot}', 'gmember_name_{slot}'),
+    ('gis_subsoil_users_{slot}', 'LIST_ABROAD_SUBSOIL_USERS', 'BIN', ('pl1', 'pl2'),
+     'gmember_maincode_{slot}', 'gmember_name_{slot}'),
+    ('gis_red_4_{slot}', 'LIST_ABROAD_RED_4', None, ('pol1', 'pol2'), None, 'gmember_name_{slot}'),
+    ('gis_red_5_{slot}', 'LIST_ABROAD_RED_5', None, ('pol1', 'pol2'), None, 'gmember_name_{slot}'),
+    ('gis_member{slot}_dmft_list2', 'LIST_DMFT_FT_RELATED_UL', None, ('1', '2'), None, 'gmember{slot}_ur_name'),
+]
+
+# Проверки вхождения в списки по кодам и ФИО: (шаблон флага, таблица, условие соединения, слоты, шаблоны ключей)
+# Условия повторяют SET_PARAMS
+LIST_CHECKS = [
+    ('gis_red_1_{slot}', 'LIST_ABROAD_RED_1', "L.BIN = K.K1", ('pl1', 'pl2'), ('gmember_maincode_{slot}',)),
+    ('gis_red_2_{slot}', 'LIST_ABROAD_RED_2', "L.BIN = K.K1", ('pl1', 'pl2'), ('gmember_maincode_{slot}',)),
+    ('gis_red_3_{slot}', 'LIST_ABROAD_RED_3', "L.BIN = K.K1", ('pl1', 'pl2'), ('gmember_maincode_{slot}',)),
+    ('gis_fatf_{slot}', 'LIST_ABROAD_FATF', "L.CODE = K.K1 OR L.CODE = K.K2",
+     ('pol1', 'pol2'), ('gmember_residence_{slot}', 'gmember_bank_address_{slot}')),
+
+    ('gis_member{slot}_od_list1', 'LIST_OD_50_FORBS', "L.IIN = K.K1", ('1', '2'), ('gmember{slot}_maincode',)),
+    ('gis_member{slot}_od_list2', 'LIST_OD_FL_POST_BT', "L.IIN = K.K1", ('1', '2'), ('gmember{slot}_maincode',)),
+    ('gis_member{slot}_od_list3', 'LIST_OD_NP_MON', "L.BIN = K.K1", ('1', '2'), ('gmember{slot}_maincode',)),
+    ('gis_member{slot}_od_list4', 'LIST_OD_UCH_PLAT', "L.IINBIN = K.K1", ('1', '2'), ('gmember{slot}_maincode',)),
+    ('gis_member{slot}_od_list5', 'LIST_OD_UL_POST_BT', "L.BIN = K.K1", ('1', '2'), ('gmember{slot}_maincode',)),
+    ('gis_member{slot}_ft_list2', 'LIST_FT_ISKL',
+     "L.IIN = K.K1 OR (L.LASTNAME = K.K2 AND L.FIRSTNAME = K.K3 AND L.PATRONYMIC = K.K4)",
+     ('1', '2'), ('gmember{slot}_maincode', 'gmember{slot}_ac_secondname', 'gmember{slot}_ac_firstname', 'gmember{slot}_ac_middlename')),
+    ('gis_member{slot}_ft_list3', 'LIST_FT_MGR',
+     "L.LASTNAME = K.K1 AND L.FIRSTNAME = K.K2 AND L.PATRONYMIC = K.K3",
+     ('1', '2'), ('gmember{slot}_ac_secondname', 'gmember{slot}_ac_firstname', 'gmember{slot}_ac_middlename')),
+    ('gis_member{slot}_ft_list4', 'LIST_FT_DRT',
+     "L.IIN = K.K1 OR (L.LASTNAME = K.K2 AND L.FIRSTNAME = K.K3 AND L.PATRONYMIC = K.K4)",
+     ('1', '2'), ('gmember{slot}_maincode', 'gmember{slot}_ac_secondname', 'gmember{slot}_ac_firstname', 'gmember{slot}_ac_middlename')),
+
+    ('gis_member{slot}_dmft_list1', 'LIST_DMFT_FT_RELATED_FL',
+     "L.IIN = K.K1 OR (L.LASTNAME = K.K2 AND L.FIRSTNAME = K.K3 AND L.PATRONYMIC = K.K4)",
+     ('1', '2'), ('gmember{slot}_maincode', 'gmember{slot}_ac_secondname', 'gmember{slot}_ac_firstname', 'gmember{slot}_ac_middlename')),
+    ('gis_member{slot}_dmft_list3', 'LIST_DMFT_POS_INVOLV',
+     "L.LASTNAME = K.K1 AND L.FIRSTNAME = K.K2 AND L.PATRONYMIC = K.K3",
+     ('1', '2'), ('gmember{slot}_ac_secondname', 'gmember{slot}_ac_firstname', 'gmember{slot}_ac_middlename')),
+    ('gis_member{slot}_dmft_list4', 'LIST_DMFT_PDL',
+     "(L.IIN = K.K1 AND L.IIN IS NOT NULL) OR (L.LASTNAME = K.K2 AND L.FIRSTNAME = K.K3 AND L.PATRONYMIC = K.K4)",
+     ('1', '2'), ('gmember{slot}_maincode', 'gmember{slot}_ac_secondname', 'gmember{slot}_ac_firstname', 'gmember{slot}_ac_middlename')),
+]
+
+
+def _sql_upper(value):
+    """UPPER с поддержкой кириллицы (встроенный UPPER в SQLite работает только с ASCII)"""
+    return value.upper() if isinstance(value, str) else value
+
+
+def _sql_lower(value):
+    """LOWER с поддержкой кириллицы"""
+    return value.lower() if isinstance(value, str) else value
+
+
+def connect(db_path):
+    """Открывает локальную базу SQLite и создает таблицы, если их нет"""
+    conn = sqlite3.connect(db_path)
+    conn.create_function('UPPER', 1, _sql_upper, deterministic=True)
+    conn.create_function('LOWER', 1, _sql_lower, deterministic=True)
+    conn.executescript(SCHEMA_DDL)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS BATCH_MESS (MESS_ID INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS BATCH_KEYS (MESS_ID INTEGER, SLOT TEXT, K1, K2, K3, K4)")
+    return conn
+
+
+def member_name(ur_name, secondname, firstname, middlename):
+    """COALESCE(UR_NAME, SECONDNAME || ' ' || FIRSTNAME || ' ' || MIDDLENAME) с NULL-семантикой PostgreSQL"""
+    if ur_name is not None:
+        return ur_name
+    if secondname is None or firstname is None or middlename is None:
+        return None
+    return f"{secondname} {firstname} {middlename}"
+
+
+def _empty_params(header):
+    """Создает словарь параметров сообщения с пустыми полями участников"""
+    params = dict(zip(HEADER_FIELDS, header))
+    for slot, _, _ in PARTY_SLOTS:
+        params[f'gmember_id_{slot}'] = None
+        params[f'gmember_maincode_{slot}'] = None
+        params[f'gmember_residence_{slot}'] = None
+        params[f'gmember_bank_address_{slot}'] = None
+        params[f'gmember_name_{slot}'] = None
+        if slot.startswith('pl'):
+            params[f'gmember_type_{slot}'] = None
+    for n in ('1', '2'):
+        for field in ('maincode', 'member_type', 'money_trans_sys', 'bank_address', 'member_comments',
+                      'ac_secondname', 'ac_firstname', 'ac_middlename', 'ur_name'):
+            params[f'gmember{n}_{field}'] = None
+    return params
+
+
+def _apply_member(params, filled, member):
+    """Раскладывает строку EXP_MEMBERS по слотам PL1/PL2/POL1/POL2 и MB1/MB2"""
+    (membercode, member_id, maincode, residence, bank_address, member_type,
+     ur_name, secondname, firstname, middlename, money_trans_sys, comments) = member
+
+    for slot, slot_code, slot_id in PARTY_SLOTS:
+        if membercode == slot_code and member_id == slot_id and slot not in filled:
+            filled.add(slot)
+            params[f'gmember_id_{slot}'] = member_id
+            params[f'gmember_maincode_{slot}'] = maincode
+            params[f'gmember_residence_{slot}'] = residence
+            params[f'gmember_bank_address_{slot}'] = bank_address
+            params[f'gmember_name_{slot}'] = member_name(ur_name, secondname, firstname, middlename)
+            if slot.startswith('pl'):
+                params[f'gmember_type_{slot}'] = member_type
+
+    # Участники 1 и 2 без учета роли (MB1/MB2), ФИО и наименование в верхнем регистре
+    n = str(member_id)
+    if f'mb{n}' not in filled:
+        filled.add(f'mb{n}')
+        params[f'gmember{n}_maincode'] = maincode
+        params[f'gmember{n}_member_type'] = member_type
+        params[f'gmember{n}_money_trans_sys'] = money_trans_sys
+        params[f'gmember{n}_bank_address'] = bank_address
+        params[f'gmember{n}_member_comments'] = comments
+        params[f'gmember{n}_ac_secondname'] = _sql_upper(secondname)
+        params[f'gmember{n}_ac_firstname'] = _sql_upper(firstname)
+        params[f'gmember{n}_ac_middlename'] = _sql_upper(middlename)
+        params[f'gmember{n}_ur_name'] = _sql_upper(ur_name)
+
+
+def _load_batch_ids(conn, mess_ids):
+    """Загружает идентификаторы порции во временную таблицу"""
+    conn.execute("DELETE FROM temp.BATCH_MESS")
+    conn.executemany("INSERT OR IGNORE INTO temp.BATCH_MESS (MESS_ID) VALUES (?)",
+                     [(mess_id,) for mess_id in mess_ids])
+
+
+def fetch_list_flags(conn, params_by_id):
+    """Проставляет флаги вхождения участников в списки для всей порции (один запрос на список)"""
+    for flag_tmpl, table, condition, slots, key_tmpls in LIST_CHECKS:
+        rows = []
+        for mess_id, params in params_by_id.items():
+            for slot in slots:
+                params[flag_tmpl.format(slot=slot)] = 0
+                keys = [params.get(tmpl.format(slot=slot)) for tmpl in key_tmpls]
+                if any(key is not None for key in keys):
+                    rows.append((mess_id, slot, *keys, *([None] * (4 - len(keys)))))
+
+        if not rows:
+            continue
+
+        conn.execute("DELETE FROM temp.BATCH_KEYS")
+        conn.executemany("INSERT INTO temp.BATCH_KEYS (MESS_ID, SLOT, K1, K2, K3, K4) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        query = (f"SELECT K.MESS_ID, K.SLOT, COUNT(*) FROM temp.BATCH_KEYS K "
+                 f"JOIN {table} L ON {condition} GROUP BY K.MESS_ID, K.SLOT")
+        for mess_id, slot, count in conn.execute(query):
+            params_by_id[mess_id][flag_tmpl.format(slot=slot)] = count
+
+    return params_by_id
+
+
+# Индексы списков по наименованию: (соединение, таблица) -> (состояние базы, хеш содержимого, NameIndex),
+# последние использованные - в конце
+_NAME_INDEXES = OrderedDict()
+NAME_INDEX_CACHE_SIZE = 64
+
+
+def _connection_token(conn):
+    """Идентификатор соединения для кэша индексов: хранится во временном представлении соединения, поэтому
+    у каждого соединения (в том числе к разным базам ':memory:') он свой. Представление создается без
+    изменения данных, чтобы не открывать транзакцию вызывающего кода"""
+    exists = conn.execute("SELECT 1 FROM temp.sqlite_master WHERE type = 'view' AND name = 'NAME_INDEX_CONN'").fetchone()
+    if exists is None:
+        conn.execute(f"CREATE TEMP VIEW NAME_INDEX_CONN AS SELECT '{uuid.uuid4().hex}' AS TOKEN")
+    return conn.execute("SELECT TOKEN FROM temp.NAME_INDEX_CONN").fetchone()[0]
+
+
+def name_index(conn, table, bin_column):
+    """Возвращает индекс списка по наименованию. Пока в базе ничего не менялось (PRAGMA data_version для
+    других соединений, total_changes для этого), индекс берется из кэша; иначе список перечитывается
+    и индекс перестраивается, только если изменилось его содержимое (хеш строк)"""
+    key = (_connection_token(conn), table)
+    state = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+    cached = _NAME_INDEXES.get(key)
+    if cached is not None and cached[0] == state:
+        _NAME_INDEXES.move_to_end(key)
+        return cached[2]
+
+    bin_expr = f"L.{bin_column}" if bin_column else "NULL"
+    rows = conn.execute(f"SELECT L.rowid, {bin_expr}, L.NAME FROM {table} L ORDER BY L.rowid").fetchall()
+    content_hash = hashlib.blake2b(repr(rows).encode('utf-8'), digest_size=16).digest()
+    if cached is not None and cached[1] == content_hash:
+        index = cached[2]
+    else:
+        index = NameIndex(rows)
+
+    _NAME_INDEXES[key] = (state, content_hash, index)
+    _NAME_INDEXES.move_to_end(key)
+    while len(_NAME_INDEXES) > NAME_INDEX_CACHE_SIZE:
+        _NAME_INDEXES.popitem(last=False)
+    return index
+
+
+def fetch_name_flags(conn, params_by_id):
+    """Проставляет флаги вхождения в списки по наименованию через хеш-индексы списков"""
+    for flag_tmpl, table, bin_column, slots, bin_tmpl, name_tmpl in NAME_LIST_CHECKS:
+        index = name_index(conn, table, bin_column)
+        for params in params_by_id.values():
+            for slot in slots:
+                bin_code = params.get(bin_tmpl.format(slot=slot)) if bin_tmpl else None
+                params[flag_tmpl.format(slot=slot)] = index.count(params.get(name_tmpl.format(slot=slot)), bin_code)
+    return params_by_id
+
+
+def fetch_params_batch(conn, mess_ids, with_lists=True):
+    """Загружает параметры порции сообщений одним запросом (пакетный аналог SET_PARAMS)"""
+    params_by_id = {}
+    if not mess_ids:
+        return params_by_id
+
+    _load_batch_ids(conn, mess_ids)
+
+    header_len = len(HEADER_FIELDS)
+    filled = set()
+    for row in conn.execute(BATCH_PARAMS_SQL):
+        mess_id = row[0]
+        params = params_by_id.get(mess_id)
+        if params is None:
+            params = _empty_params(row[:header_len])
+            params_by_id[mess_id] = params
+            filled = set()
+        if row[header_len + 1] is not None:
+            _apply_member(params, filled, row[header_len:])
+
+    if with_lists:
+        fetch_list_flags(conn, params_by_id)
+        fetch_name_flags(conn, params_by_id)
+
+    return params_by_id
+
+
+def fetch_params(conn, mess_id):
+    """Загружает параметры одного сообщения (None, если сообщение не найдено)"""
+    return fetch_params_batch(conn, [mess_id]).get(mess_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пакетная загрузка параметров сообщений из локальной копии DWH_KFM')
+    parser.add_argument('--db', '-d', default='sim_range.db', help='Путь к базе SQLite')
+    parser.add_argument('mess_ids', nargs='+', type=int, help='Идентификаторы сообщений')
+
+    args = parser.parse_args()
+
+    try:
+        conn = connect(args.db)
+        params_by_id = fetch_params_batch(conn, args.mess_ids)
+
+        print(f"Загружено {len(params_by_id)} из {len(set(args.mess_ids))} сообщений")
+        for mess_id in args.mess_ids:
+            if mess_id in params_by_id:
+                print(f"\n{'='*80}")
+                pprint(params_by_id[mess_id])
+            else:
+                print(f"\nСообщение {mess_id} не найдено")
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+    except Exception as e:
+        print(f"Произошла ошибка: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,709 @@
+from datetime import datetime
+from functools import lru_cache
+
+from sim_like import LikeMatcher, like_regex
+
+# Порт pkg_sim_range.DO_RANGE: правила принимают словарь параметров сообщения (ключи как в row_to_json,
+# см. sim_params.fetch_params_batch) и возвращают True/False. NULL в сравнениях дает False, как в SQL.
+
+# Действия SIM_SEND_MESS
+ACTION_SUSPENDED = 1
+ACTION_OD_HIGH = 3
+ACTION_FT_HIGH = 4
+ACTION_ABR_HIGH = 5
+ACTION_PIRAMID_HIGH = 6
+ACTION_DMFT_FT1 = 7
+ACTION_DMFT_FT2 = 8
+ACTION_DMFT_PDL = 9
+ACTION_DMFT_OD = 10
+
+OD_IDVIEWS = (311, 321, 511, 530)
+OD_IDTYPES = (119, 321, 322, 340, 341, 342, 343, 346, 561, 661, 710, 711, 780, 790, 814, 816, 818, 819,
+              821, 822, 851, 852, 854, 858, 859, 880)
+OD_REASON_CODES = (1, 8, 10, 12, 13, 14, 2)
+OD_SUSP_CODES = (1017, 1019, 1050, 1054, 1055, 1057, 1058, 1064, 1067, 1072, 4013, 7006, 7013)
+FT_BANK_COUNTRIES = (4, 368, 566, 760, 706, 887, 586, 356, 180, 608, 466, 854, 120, 818, 508, 434, 140, 792, 170, 144)
+DMFT_OD_CFM_MAINCODES = ('920140000084', '980640000093', '940140000385', '061140003010', '210440009516',
+                         '091240012920', '050740002486')
+
+
+# ============= Операции с NULL-семантикой SQL =============
+
+def _in(value, values):
+    """value IN (...)"""
+    return value is not None and value in values
+
+
+def _not_in(value, values):
+    """value NOT IN (...)"""
+    return value is not None and value not in values
+
+
+def _in_or_null(value, values):
+    """(value IN (...) OR value IS NULL)"""
+    return value is None or value in values
+
+
+def _eq(a, b):
+    """a = b"""
+    return a is not None and b is not None and a == b
+
+
+def _ne(a, b):
+    """a != b"""
+    return a is not None and b is not None and a != b
+
+
+def _ge(value, bound):
+    """value >= bound"""
+    return value is not None and value >= bound
+
+
+def _gt(value, bound):
+    """value > bound"""
+    return value is not None and value > bound
+
+
+def _between(value, low, high):
+    """value BETWEEN low AND high"""
+    return value is not None and low <= value <= high
+
+
+def _flag(p, name):
+    """Значение флага вхождения в список (отсутствующий флаг считается нулем)"""
+    return p.get(name) or 0
+
+
+def _sql_number(value):
+    """Числовое значение, как при неявном приведении строки к числу в SQL (TEXT-колонки, например
+    MEMBER_BANK_ADDRESS, сравниваются с числовыми кодами); нечисловая строка - None"""
+    if isinstance(value, str):
+        try:
+            value = float(value.strip())
+        except ValueError:
+            return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _sql_text(value):
+    """Текстовое представление значения, как при неявном приведении числа к строке в SQL"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def like(value, pattern):
+    """value LIKE pattern"""
+    if value is None:
+        return False
+    return like_regex(pattern).fullmatch(_sql_text(value)) is not None
+
+
+def not_like(value, pattern):
+    """value NOT LIKE pattern"""
+    if value is None:
+        return False
+    return like_regex(pattern).fullmatch(_sql_text(value)) is None
+
+
+def _any_like(hits_list, mask):
+    """Хотя бы одно поле соответствует хотя бы одному шаблону из маски TEXT_LIKE"""
+    return any(TEXT_LIKE.any_like(hits, mask) for hits in hits_list)
+
+
+@lru_cache(maxsize=65536)
+def _parse_datetime(value):
+    """Парсит дату из строки ISO (или возвращает datetime как есть)"""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+# ============= Текстовые условия =============
+
+ABR_LOAN_PATTERNS = ('%займ%', '%беспроцент%', '%без процент%')
+ABR_ADVANCE_PATTERNS = ('%avans%', '%предоплат%', '%predoplat%', '%аванс%')
+ABR_NOT_RANGE_PATTERNS = ('клиент%', '%подписал договор%', '%неисполненные обязательства%', '%не совершено%',
+                          '%лкбк%', '%задолженност%', '%неисполнением обязательств%', 'принят%', '%репатриац%',
+                          '%договор%', '%контракт%', '%банком направлено уведомление о нарушен%',
+                          '%банком были направлены уведомления о нарушен%',
+                          '%банком направлены уведомления о нарушен%',
+                          '%в поле 3.7 сумма в тенге указана на дату заключения договора%', '%исходящ%', '%входящ%',
+                          'продление срока репатриации%', 'увеличение срока репатриации%', '%поле 3.7%')
+ABR_NOT_RANGE_PAYMENT_WORDS = ('%opl%', '%payment%', '%purch%', '%transfer%', '%назначение платежа%', '%pmnt%',
+                               '%заявка на международный платеж%', '%platej%', '%inv%',
+                               '%международный иходящий платеж%')
+PIRAMID_PATTERNS = ('%пирамид%',)
+DMFT_FT1_PATTERNS = ('%террор%', '%нко%', '%экстреми%', '%оружи%', '%массово%', '%благотворительн%',
+                     '%религиозн%', '%внешни%признак%', '%социальн%сет%', '%митинг%', '%сбор%')
+DMFT_FT2_PATTERNS = ('%нарко%',)
+
+# Все шаблоны текстовых условий: каждое поле сопоставляется со всем набором за один проход
+TEXT_LIKE = LikeMatcher(ABR_LOAN_PATTERNS + ABR_ADVANCE_PATTERNS + ABR_NOT_RANGE_PATTERNS
+                        + ABR_NOT_RANGE_PAYMENT_WORDS + PIRAMID_PATTERNS + DMFT_FT1_PATTERNS + DMFT_FT2_PATTERNS)
+ABR_LOAN_MASK = TEXT_LIKE.mask(ABR_LOAN_PATTERNS)
+ABR_ADVANCE_MASK = TEXT_LIKE.mask(ABR_ADVANCE_PATTERNS)
+DMFT_FT1_MASK = TEXT_LIKE.mask(DMFT_FT1_PATTERNS)
+DMFT_FT2_MASK = TEXT_LIKE.mask(DMFT_FT2_PATTERNS)
+
+
+# Маски совпадений по значениям текстовых полей; do_range_batch заполняет их для всей порции заранее
+TEXT_HITS_CACHE_SIZE = 4096
+_TEXT_HITS = {}
+
+
+def _text_hits(value):
+    """Маска совпадений LOWER(value) с шаблонами TEXT_LIKE (None для NULL); поле приводится к нижнему
+    регистру и просматривается один раз на все правила"""
+    if value is None:
+        return None
+    hits = _TEXT_HITS.get(value)
+    if hits is None:
+        if len(_TEXT_HITS) >= TEXT_HITS_CACHE_SIZE:
+            _TEXT_HITS.clear()
+        hits = _TEXT_HITS[value] = TEXT_LIKE.match(_sql_text(value).lower())
+    return hits
+
+
+def _hit(hits, pattern):
+    """LOWER(value) LIKE pattern по маске совпадений поля"""
+    return TEXT_LIKE.like(hits, pattern)
+
+
+def _no_hit(hits, pattern):
+    """LOWER(value) NOT LIKE pattern по маске совпадений поля"""
+    return TEXT_LIKE.not_like(hits, pattern)
+
+
+# ============= Общие условия =============
+
+def _no_subsoil_green(p):
+    """Плательщики не входят в списки Недропользователи и Зеленый 1"""
+    return (_flag(p, 'gis_subsoil_users_pl1') == 0 and _flag(p, 'gis_subsoil_users_pl2') == 0
+            and _flag(p, 'gis_green_1_pl1') == 0 and _flag(p, 'gis_green_1_pl2') == 0)
+
+
+def _any_subsoil_green(p):
+    """Хотя бы один плательщик входит в списки Недропользователи или Зеленый 1"""
+    return (_flag(p, 'gis_subsoil_users_pl1') != 0 or _flag(p, 'gis_subsoil_users_pl2') != 0
+            or _flag(p, 'gis_green_1_pl1') != 0 or _flag(p, 'gis_green_1_pl2') != 0)
+
+
+def _texts(p):
+    """Маски совпадений LOWER(gOPER_DOPINFO), LOWER(gOPER_DIFFICULTIES)"""
+    return _text_hits(p.get('goper_dopinfo')), _text_hits(p.get('goper_difficulties'))
+
+
+def _abr_loan_condition(p):
+    """Условие по займам для критерия 1 (Перевод за рубеж)"""
+    idtype = p.get('goper_idtype')
+    susp_first = p.get('goper_susp_first')
+    return (_in(idtype, (119, 413, 561, 661))
+            or _eq(p.get('goper_idview'), 911)
+            or _in(susp_first, (1057, 1066, 3002))
+            or (_eq(susp_first, 1058) and _not_in(idtype, (423, 421)))
+            or _any_like(_texts(p), ABR_LOAN_MASK))
+
+
+def _abr_advance_condition(p):
+    """Условие по авансам для критерия 3 (Перевод за рубеж)"""
+    return (((_flag(p, 'gis_red_3_pl1') != 0 or _flag(p, 'gis_red_3_pl2') != 0)
+             and _any_like(_texts(p), ABR_ADVANCE_MASK))
+            or _eq(p.get('goper_susp_first'), 1112))
+
+
+def _abr_mid_amount(p):
+    """Сумма для среднего риска: 100-200 млн или от 100 млн у недропользователей/Зеленый 1"""
+    amount = p.get('goper_tenge_amount')
+    return _between(amount, 100000000, 199999999) or (_ge(amount, 100000000) and _any_subsoil_green(p))
+
+
+def _abr_type_condition(p):
+    """Условие по ЕКНП/КВО для критерия 7 (Перевод за рубеж)"""
+    idtype = p.get('goper_idtype')
+    return (like(idtype, '5%') or like(idtype, '6%')
+            or _in(idtype, (343, 413))
+            or _in(p.get('goper_idview'), (1911, 2020)))
+
+
+def _od_common(p):
+    """Общие условия ОД по КВО, ЕКНП, основанию и КППО"""
+    idtype = p.get('goper_idtype')
+    return (_in(p.get('goper_idview'), OD_IDVIEWS)
+            and (idtype is None or idtype in OD_IDTYPES)
+            and _in(p.get('gmess_reason_code'), OD_REASON_CODES)
+            and _in_or_null(p.get('goper_susp_first'), OD_SUSP_CODES)
+            and _in_or_null(p.get('goper_susp_second'), OD_SUSP_CODES)
+            and _in_or_null(p.get('goper_susp_third'), OD_SUSP_CODES))
+
+
+def _ft_susp_condition(p):
+    """Условие ФТ по КППО и стране банка участников"""
+    susp_first = p.get('goper_susp_first')
+    return (_in(susp_first, (3004, 3002, 8002))
+            or (_eq(susp_first, 3001)
+                and (_in(_sql_number(p.get('gmember1_bank_address')), FT_BANK_COUNTRIES)
+                     or _in(_sql_number(p.get('gmember2_bank_address')), FT_BANK_COUNTRIES))))
+
+
+def _ft_lists(p, lists):
+    """Хотя бы один участник входит в один из списков ФТ"""
+    return any(_flag(p, f'gis_member{n}_ft_list{i}') != 0 for i in lists for n in (1, 2))
+
+
+def _dmft_lists(p, lists):
+    """Хотя бы один участник входит в один из списков ДМФТ"""
+    return any(_flag(p, f'gis_member{n}_dmft_list{i}') != 0 for i in lists for n in (1, 2))
+
+
+# ============= ОД =============
+
+def is_od_operation(p):
+    """Проверка по условиям ОД"""
+    status = p.get('gmess_oper_status')
+    return (((_eq(status, 3) and _not_in(p.get('gmess_reason_code'), (2, 8))) or _ne(status, 3))
+            and all(_flag(p, f'gis_member{n}_od_list{i}') == 0 for i in range(1, 6) for n in (1, 2)))
+
+
+def is_od_high_risk(p):
+    """Проверка операции ОД на высокий риск"""
+    return _gt(p.get('goper_tenge_amount'), 300000000) and _od_common(p)
+
+
+def is_od_mid_risk(p):
+    """Проверка операции ОД на средний риск"""
+    return _between(p.get('goper_tenge_amount'), 212255001, 300000000) and _od_common(p)
+
+
+def is_od_low_risk(p):
+    """Проверка операции ОД на низкий риск"""
+    return _between(p.get('goper_tenge_amount'), 169678080, 212255000) and _od_common(p)
+
+
+# ============= ФТ =============
+
+def is_ft_operation(p):
+    """Проверка по условиям ФТ"""
+    return _ne(p.get('gmess_oper_status'), 3)
+
+
+def is_ft_high_risk(p):
+    """Проверка операции ФТ на высокий риск"""
+    return (_in(p.get('gmess_reason_code'), (2, 8, 4))
+            and _ft_susp_condition(p)
+            and (_in(p.get('gmember1_member_type'), (2, 3)) or _in(p.get('gmember2_member_type'), (2, 3)))
+            and (p.get('gmember1_money_trans_sys') is not None or p.get('gmember2_money_trans_sys') is not None)
+            and _ft_lists(p, (2, 3, 4)))
+
+
+def is_ft_mid_risk(p):
+    """Проверка операции ФТ на средний риск"""
+    return _eq(p.get('gmess_reason_code'), 4) and _ft_susp_condition(p) and _ft_lists(p, (2, 3))
+
+
+def is_ft_low_risk(p):
+    """Проверка операции ФТ на низкий риск"""
+    return _in(p.get('gmess_reason_code'), (2, 8)) and _ft_susp_condition(p) and _ft_lists(p, (2, 3, 4))
+
+
+# ============= Перевод за рубеж =============
+
+def is_abr_range(p):
+    """Проверка по условиям, при которых сообщение является ранжируемым (Перевод за рубеж)"""
+    if not (_eq(p.get('gmess_oper_status'), 1)
+            and _in(p.get('gmess_reason_code'), (1, 2, 8, 10))
+            and _eq(p.get('gcfm_code'), 11)):
+        return False
+
+    def present(slot):
+        return p.get(f'gmember_id_{slot}') is not None
+
+    if not ((present('pl1') and _eq(p.get('gmember_residence_pl1'), 398))
+            or (present('pl2') and _eq(p.get('gmember_residence_pl2'), 398))):
+        return False
+    if not ((present('pol1') and _ne(_sql_text_or_none(p.get('gmember_bank_address_pol1')), '398'))
+            or (present('pol2') and _ne(_sql_text_or_none(p.get('gmember_bank_address_pol2')), '398'))):
+        return False
+    if not ((present('pl1') and _eq(_sql_text_or_none(p.get('gmember_bank_address_pl1')), '398'))
+            or (present('pl2') and _eq(_sql_text_or_none(p.get('gmember_bank_address_pl2')), '398'))):
+        return False
+
+    receive_date = _parse_datetime(p.get('greceive_date'))
+    trans_date = _parse_datetime(p.get('goper_trans_date'))
+    if receive_date is None or trans_date is None:
+        return False
+    return (receive_date - trans_date).total_seconds() / 86400 < 15
+
+
+def _sql_text_or_none(value):
+    """Приведение кода страны к строке для сравнения числа с varchar"""
+    return _sql_text(value) if value is not None else None
+
+
+def _abr_not_range_text(hits):
+    """Текстовые условия неранжируемого сообщения для одного поля (по маске совпадений)"""
+    return ((_hit(hits, 'клиент%') and _hit(hits, '%подписал договор%'))
+            or _hit(hits, '%неисполненные обязательства%')
+            or _hit(hits, '%не совершено%')
+            or (_hit(hits, '%лкбк%') and (_hit(hits, '%задолженност%') or _hit(hits, '%неисполнением обязательств%')))
+            or (_hit(hits, 'принят%') and _hit(hits, '%репатриац%')
+                and (_hit(hits, '%договор%') or _hit(hits, '%контракт%')))
+            or _hit(hits, '%банком направлено уведомление о нарушен%')
+            or _hit(hits, '%банком были направлены уведомления о нарушен%')
+            or _hit(hits, '%банком направлены уведомления о нарушен%')
+            or (_hit(hits, '%в поле 3.7 сумма в тенге указана на дату заключения договора%')
+                and (_hit(hits, '%исходящ%') or _hit(hits, '%входящ%')))
+            or _hit(hits, 'продление срока репатриации%')
+            or _hit(hits, 'увеличение срока репатриации%')
+            or ((_hit(hits, '%репатриац%') or _hit(hits, '%поле 3.7%'))
+                and any(_no_hit(hits, pattern) for pattern in ABR_NOT_RANGE_PAYMENT_WORDS)))
+
+
+def is_abr_not_range(p):
+    """Проверка по условиям, при которых сообщение является неранжируемым (Перевод за рубеж)"""
+    dopinfo, difficulties = _texts(p)
+    if (_abr_not_range_text(dopinfo) or _abr_not_range_text(difficulties)
+            or _eq(p.get('goper_susp_first'), 1069)):
+        return True
+
+    # Деление выполняется только если предыдущие условия ложны; при делении на ноль пакет возвращает 0
+    tenge = p.get('goper_tenge_amount')
+    currency = p.get('goper_currency_amount')
+    if tenge is not None and currency is not None:
+        if currency == 0:
+            return False
+        if tenge / currency >= 1000:
+            return True
+
+    return (_flag(p, 'gis_green_1_pol1') != 0 or _flag(p, 'gis_green_1_pol2') != 0
+            or _flag(p, 'gis_green_2_pl1') != 0 or _flag(p, 'gis_green_2_pl2') != 0)
+
+
+def is_abr_dublicate(p):
+    """Количество сообщений с теми же датой, СФМ, номером операции и плательщиками (1 - дубликатов нет).
+    Значение gabr_dublicates заполняет индекс sim_duplicates; без индекса проверка не выполняется"""
+    return p.get('gabr_dublicates', 1)
+
+
+def is_abr_high_risk_1(p):
+    """Высокий риск, 1 критерий (Перевод за рубеж)"""
+    return ((_flag(p, 'gis_red_1_pl1') != 0 or _flag(p, 'gis_red_1_pl2') != 0)
+            and _abr_loan_condition(p)
+            and _ge(p.get('goper_tenge_amount'), 200000000)
+            and _no_subsoil_green(p))
+
+
+def is_abr_high_risk_2(p):
+    """Высокий риск, 2 критерий (Перевод за рубеж)"""
+    return ((_flag(p, 'gis_red_2_pl1') != 0 or _flag(p, 'gis_red_2_pl2') != 0 or _eq(p.get('goper_susp_first'), 1113))
+            and _ge(p.get('goper_tenge_amount'), 200000000)
+            and _no_subsoil_green(p))
+
+
+def is_abr_high_risk_3(p):
+    """Высокий риск, 3 критерий (Перевод за рубеж)"""
+    return _no_subsoil_green(p) and _ge(p.get('goper_tenge_amount'), 200000000) and _abr_advance_condition(p)
+
+
+def is_abr_high_risk_4(p):
+    """Высокий риск, 4 критерий (Перевод за рубеж)"""
+    return ((_flag(p, 'gis_red_4_pol1') != 0 or _flag(p, 'gis_red_4_pol2') != 0)
+            and _ge(p.get('goper_tenge_amount'), 200000000)
+            and _no_subsoil_green(p))
+
+
+def is_abr_high_risk_5(p):
+    """Высокий риск, 5 критерий (Перевод за рубеж)"""
+    if not (_ge(p.get('goper_tenge_amount'), 200000000)
+            and (_flag(p, 'gis_fatf_pol1') != 0 or _flag(p, 'gis_fatf_pol2') != 0)
+            and _not_in(p.get('goper_idtype'), (871, 872))
+            and _no_subsoil_green(p)):
+        return False
+    if _in(p.get('gmess_reason_code'), (1, 10)):
+        return (_ne(_sql_text_or_none(p.get('gmember_bank_address_pol1')),
+                    _sql_text_or_none(p.get('gmember_residence_pol1')))
+                and _ne(_sql_text_or_none(p.get('gmember_bank_address_pol2')),
+                        _sql_text_or_none(p.get('gmember_residence_pol2'))))
+    return True
+
+
+def is_abr_high_risk_6(p):
+    """Высокий риск, 6 критерий (Перевод за рубеж)"""
+    return ((_flag(p, 'gis_red_5_pol1') != 0 or _flag(p, 'gis_red_5_pol2') != 0)
+            and _ge(p.get('goper_tenge_amount'), 200000000)
+            and _no_subsoil_green(p))
+
+
+def is_abr_high_risk_7(p):
+    """Высокий риск, 7 критерий (Перевод за рубеж)"""
+    amount = p.get('goper_tenge_amount')
+    reason_code = p.get('gmess_reason_code')
+    return (_no_subsoil_green(p)
+            and ((_ge(amount, 500000000) and _in(reason_code, (2, 8)))
+                 or ((_eq(p.get('gmember_type_pl1'), 2) or _eq(p.get('gmember_type_pl2'), 2))
+                     and _ge(amount, 500000000)
+                     and _in(reason_code, (1, 10))
+                     and _abr_type_condition(p))))
+
+
+def is_abr_mid_risk_1(p):
+    """Средний риск, 1 критерий (Перевод за рубеж)"""
+    return ((_flag(p, 'gis_red_1_pl1') != 0 or _flag(p, 'gis_red_1_pl2') != 0)
+            and _abr_loan_condition(p)
+            and _abr_mid_amount(p))
+
+
+def is_abr_mid_risk_2(p):
+    """Средний риск, 2 критерий (Перевод за рубеж)"""
+    return ((_flag(p, 'gis_red_2_pl1') != 0 or _flag(p, 'gis_red_2_pl2') != 0 or _eq(p.get('goper_susp_first'), 1113))
+            and _abr_mid_amount(p))
+
+
+def is_abr_mid_risk_3(p):
+    """Средний риск, 3 критерий (Перевод за рубеж)"""
+    return _abr_mid_amount(p) and _abr_advance_condition(p)
+
+
+def is_abr_mid_risk_4(p):
+    """Средний риск, 4 критерий (Перевод за рубеж)"""
+    return (_flag(p, 'gis_red_4_pol1') != 0 or _flag(p, 'gis_red_4_pol2') != 0) and _abr_mid_amount(p)
+
+
+def is_abr_mid_risk_5(p):
+    """Средний риск, 5 критерий (Перевод за рубеж)"""
+    amount = p.get('goper_tenge_amount')
+    return ((_between(amount, 100000000, 199999999)
+             or (_ge(amount, 100000000) and (_any_subsoil_green(p) or _in(p.get('gmess_reason_code'), (1, 10)))))
+            and (_flag(p, 'gis_fatf_pol1') != 0 or _flag(p, 'gis_fatf_pol2') != 0)
+            and _not_in(p.get('goper_idtype'), (871, 872)))
+
+
+def is_abr_mid_risk_6(p):
+    """Средний риск, 6 критерий (Перевод за рубеж)"""
+    return (_flag(p, 'gis_red_5_pol1') != 0 or _flag(p, 'gis_red_5_pol2') != 0) and _abr_mid_amount(p)
+
+
+def is_abr_mid_risk_7(p):
+    """Средний риск, 7 критерий (Перевод за рубеж)"""
+    reason_code = p.get('gmess_reason_code')
+    return (_ge(p.get('goper_tenge_amount'), 500000000)
+            and ((_in(reason_code, (2, 8)) and _any_subsoil_green(p))
+                 or (_in(reason_code, (1, 10))
+                     and _abr_type_condition(p)
+                     and (_in(p.get('gmember_type_pl1'), (1, 3)) or _in(p.get('gmember_type_pl2'), (1, 3))))))
+
+
+def _abr_low_amount(p):
+    """Сумма для низкого риска: 50-100 млн"""
+    return _between(p.get('goper_tenge_amount'), 50000000, 99999999)
+
+
+def is_abr_low_risk_1(p):
+    """Низкий риск, 1 критерий (Перевод за рубеж)"""
+    return ((_flag(p, 'gis_red_1_pl1') != 0 or _flag(p, 'gis_red_1_pl2') != 0)
+            and _abr_loan_condition(p)
+            and _abr_low_amount(p))
+
+
+def is_abr_low_risk_2(p):
+    """Низкий риск, 2 критерий (Перевод за рубеж)"""
+    return ((_flag(p, 'gis_red_2_pl1') != 0 or _flag(p, 'gis_red_2_pl2') != 0 or _eq(p.get('goper_susp_first'), 1113))
+            and _abr_low_amount(p))
+
+
+def is_abr_low_risk_3(p):
+    """Низкий риск, 3 критерий (Перевод за рубеж)"""
+    return _abr_low_amount(p) and _abr_advance_condition(p)
+
+
+def is_abr_low_risk_4(p):
+    """Низкий риск, 4 критерий (Перевод за рубеж)"""
+    return (_flag(p, 'gis_red_4_pol1') != 0 or _flag(p, 'gis_red_4_pol2') != 0) and _abr_low_amount(p)
+
+
+def is_abr_low_risk_5(p):
+    """Низкий риск, 5 критерий (Перевод за рубеж)"""
+    return (_abr_low_amount(p)
+            and (_flag(p, 'gis_fatf_pol1') != 0 or _flag(p, 'gis_fatf_pol2') != 0)
+            and _not_in(p.get('goper_idtype'), (871, 872)))
+
+
+def is_abr_low_risk_6(p):
+    """Низкий риск, 6 критерий (Перевод за рубеж)"""
+    return _abr_low_amount(p) and (_flag(p, 'gis_red_5_pol1') != 0 or _flag(p, 'gis_red_5_pol2') != 0)
+
+
+# Критерии Перевода за рубеж в порядке проверки: (функция, ранг, критерий, действие)
+ABR_CRITERIA = [
+    (is_abr_high_risk_1, 9, 1, ACTION_ABR_HIGH),
+    (is_abr_high_risk_2, 9, 2, ACTION_ABR_HIGH),
+    (is_abr_high_risk_3, 9, 3, ACTION_ABR_HIGH),
+    (is_abr_high_risk_4, 9, 4, ACTION_ABR_HIGH),
+    (is_abr_high_risk_5, 9, 5, ACTION_ABR_HIGH),
+    (is_abr_high_risk_6, 9, 6, ACTION_ABR_HIGH),
+    (is_abr_high_risk_7, 9, 7, ACTION_ABR_HIGH),
+    (is_abr_mid_risk_1, 5, 1, None),
+    (is_abr_mid_risk_2, 5, 2, None),
+    (is_abr_mid_risk_3, 5, 3, None),
+    (is_abr_mid_risk_4, 5, 4, None),
+    (is_abr_mid_risk_5, 5, 5, None),
+    (is_abr_mid_risk_6, 5, 6, None),
+    (is_abr_mid_risk_7, 5, 7, None),
+    (is_abr_low_risk_1, 2, 1, None),
+    (is_abr_low_risk_2, 2, 2, None),
+    (is_abr_low_risk_3, 2, 3, None),
+    (is_abr_low_risk_4, 2, 4, None),
+    (is_abr_low_risk_5, 2, 5, None),
+    (is_abr_low_risk_6, 2, 6, None),
+]
+
+
+# ============= Финансовая пирамида =============
+
+def is_piramid_range(p):
+    """Проверка по условиям, при которых сообщение является ранжируемым (Финансовая пирамида)"""
+    return _eq(p.get('gmess_oper_status'), 1) and _in(p.get('gmess_reason_code'), (2, 8))
+
+
+def is_piramid_high_risk(p):
+    """Высокий риск (Финансовая пирамида)"""
+    return _in(p.get('goper_susp_first'), (1056, 1062)) and _hit(_text_hits(p.get('goper_dopinfo')), '%пирамид%')
+
+
+def is_piramid_mid_risk(p):
+    """Средний риск (Финансовая пирамида)"""
+    return _in(p.get('goper_susp_first'), (1056, 1062))
+
+
+# ============= ДМФТ =============
+
+def _dmft_texts(p):
+    """Маски совпадений LOWER доп. информации по операции и комментариев участников 1 и 2"""
+    return (_text_hits(p.get('goper_dopinfo')), _text_hits(p.get('gmember1_member_comments')),
+            _text_hits(p.get('gmember2_member_comments')))
+
+
+def is_dmft_operation(p):
+    """Проверка на вхождение в списки ДМФТ"""
+    return _in(p.get('gmess_reason_code'), (8, 9, 10))
+
+
+def is_dmft_ft1(p):
+    """Проверка на вхождение в списки ДМФТ для ФТ1"""
+    return _dmft_lists(p, (1, 2, 3)) and _any_like(_dmft_texts(p), DMFT_FT1_MASK)
+
+
+def is_dmft_ft2(p):
+    """Проверка на вхождение в списки ДМФТ для ФТ2"""
+    return _dmft_lists(p, (1, 2, 3)) and _any_like(_dmft_texts(p), DMFT_FT2_MASK)
+
+
+def is_dmft_pdl(p):
+    """Проверка на вхождение в списки ДМФТ для ПДЛ"""
+    return _dmft_lists(p, (4,))
+
+
+def is_dmft_od(p):
+    """Проверка на вхождение в списки ДМФТ для ОД"""
+    reason_code = p.get('gmess_reason_code')
+    return ((_in(reason_code, (9, 10)) and not _dmft_lists(p, (1, 2, 3, 4)))
+            or (_eq(reason_code, 8) and _in(p.get('gcfm_maincode'), DMFT_OD_CFM_MAINCODES)))
+
+
+# ============= Ранжирование =============
+
+def is_suspended(p):
+    """Проверка приостановленной операции (условие OP_SUSPENDED)"""
+    return _eq(p.get('gmess_oper_status'), 3) and _in(p.get('gmess_reason_code'), (2, 8, 4, 10))
+
+
+def do_range(p):
+    """Ранжирует сообщение (аналог DO_RANGE): возвращает итоговые ранг, критерий и действия SimBASE"""
+    ranks = []  # Последовательные вызовы SET_RANK: в SIM_RANK остается последний
+    actions = []
+
+    if is_od_operation(p):
+        if is_od_high_risk(p):
+            ranks.append((8, None))
+            actions.append(ACTION_OD_HIGH)
+        elif is_od_mid_risk(p):
+            ranks.append((4, None))
+        elif is_od_low_risk(p):
+            ranks.append((1, None))
+
+    if is_ft_operation(p):
+        if is_ft_high_risk(p):
+            ranks.append((10, None))
+            actions.append(ACTION_FT_HIGH)
+        elif is_ft_mid_risk(p):
+            ranks.append((6, None))
+        elif is_ft_low_risk(p):
+            ranks.append((3, None))
+
+    if is_abr_dublicate(p) == 1 and not is_abr_not_range(p) and is_abr_range(p):
+        for check, rank, criteria, action in ABR_CRITERIA:
+            if check(p):
+                ranks.append((rank, criteria))
+                if action is not None:
+                    actions.append(action)
+                break
+
+    if is_piramid_range(p):
+        if is_piramid_high_risk(p):
+            ranks.append((11, None))
+            actions.append(ACTION_PIRAMID_HIGH)
+        elif is_piramid_mid_risk(p):
+            ranks.append((7, None))
+
+    if is_dmft_operation(p):
+        if is_dmft_ft1(p):
+            actions.append(ACTION_DMFT_FT1)
+        elif is_dmft_ft2(p):
+            actions.append(ACTION_DMFT_FT2)
+        elif is_dmft_pdl(p):
+            actions.append(ACTION_DMFT_PDL)
+        elif is_dmft_od(p):
+            actions.append(ACTION_DMFT_OD)
+
+    rank, criteria = ranks[-1] if ranks else (None, None)
+    return {
+        'mess_id': p.get('gmess_id'),
+        'rank': rank,
+        'criteria': criteria,
+        'actions': actions,
+    }
+
+
+TEXT_FIELDS = ('goper_dopinfo', 'goper_difficulties', 'gmember1_member_comments', 'gmember2_member_comments')
+
+
+def clear_caches():
+    """Сбрасывает кэши масок текстовых полей и разобранных дат (между независимыми прогонами)"""
+    _TEXT_HITS.clear()
+    _parse_datetime.cache_clear()
+
+
+def prepare_batch(params_list):
+    """Колоночная подготовка порции: маски текстовых полей для уникальных значений порции и разбор дат"""
+    _TEXT_HITS.clear()
+    for field in TEXT_FIELDS:
+        for value in {p.get(field) for p in params_list}:
+            if value is not None and value not in _TEXT_HITS:
+                _TEXT_HITS[value] = TEXT_LIKE.match(_sql_text(value).lower())
+    for field in ('greceive_date', 'goper_trans_date'):
+        for value in {p.get(field) for p in params_list}:
+            _parse_datetime(value)
+
+
+def do_range_batch(params_list):
+    """Ранжирует порцию сообщений: сначала подготовка по колонкам, затем правила по сообщениям.
+    Результаты совпадают с do_range"""
+    prepare_batch(params_list)
+    results = [do_range(p) for p in params_list]
+    _TEXT_HITS.clear()
+    return results
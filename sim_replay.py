@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import multiprocessing
+
+from sim_range import ABR_CRITERIA, clear_caches, do_range, do_range_batch
+
+# Прогон записанных сообщений через do_range: сверка с рангами и уведомлениями и замер скорости в последовательном,
+# многопроцессном и порционном режимах. Формат записи:
+# {"reference": "db" | "snapshot", "messages": [{"params": {...}, "expected": {"rank": .., "criteria": .., "actions": [..]}}]}.
+# Эталон "db" - SIM_RANK и журнал отправленных уведомлений SIM_SENT_MESS базы, ранжированной исходным DO_RANGE:
+# расхождения с ним - сверка (parity). "snapshot" - снимок результатов текущего do_range: расхождения с ним - только
+# регрессия относительно момента записи, эквивалентность исходному DO_RANGE он не подтверждает.
+# "actions": null - в базе нет журнала уведомлений, действия не сверяются.
+
+MODES = ('serial', 'process', 'batch')
+REFERENCES = ('db', 'snapshot')
+
+# Правила, которые выставляют ранг без критерия
+RANK_RULES = {
+    8: 'is_od_high_risk', 4: 'is_od_mid_risk', 1: 'is_od_low_risk',
+    10: 'is_ft_high_risk', 6: 'is_ft_mid_risk', 3: 'is_ft_low_risk',
+    11: 'is_piramid_high_risk', 7: 'is_piramid_mid_risk',
+}
+
+
+def rank_rule(rank, criteria):
+    """Имя правила, которое выставляет данные ранг и критерий"""
+    if rank is None:
+        return None
+    for check, check_rank, check_criteria, _ in ABR_CRITERIA:
+        if (check_rank, check_criteria) == (rank, criteria):
+            return check.__name__
+    return RANK_RULES.get(rank)
+
+
+def load_recording(path):
+    """Загружает запись сообщений: (сообщения, вид эталона)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        recording = json.load(f)
+    reference = recording['reference']
+    if reference not in REFERENCES:
+        raise KeyError(f"неизвестный вид эталона {reference!r}")
+    return recording['messages'], reference
+
+
+def record_from_db(db_path, output_path, reference='db'):
+    """Записывает сообщения из локальной базы. Эталон db - SIM_RANK и SIM_SENT_MESS (действия не сверяются,
+    если журнал пуст), snapshot - результаты текущего do_range"""
+    from sim_params import connect, fetch_params_batch
+    from sim_duplicates import DuplicateIndex
+
+    conn = connect(db_path)
+    duplicates = DuplicateIndex(conn)
+    mess_ids = [row[0] for row in conn.execute("SELECT MESS_ID FROM EXP_MESSINFO ORDER BY MESS_ID")]
+    ranks = {mess_id: (rank, criteria) for mess_id, rank, criteria in
+             conn.execute("SELECT MESS_ID, MESS_RANK, MESS_CRITERIA FROM SIM_RANK")}
+    sent = {}
+    for mess_id, action in conn.execute("SELECT MESS_ID, ACTION FROM SIM_SENT_MESS"):
+        sent.setdefault(mess_id, []).append(action)
+    has_journal = conn.execute("SELECT 1 FROM SIM_SENT_MESS LIMIT 1").fetchone() is not None
+
+    messages = []
+    for start in range(0, len(mess_ids), 1000):
+        for mess_id, params in fetch_params_batch(conn, mess_ids[start:start + 1000]).items():
+            # Признак дубликата на момент поступления, как его видел обработчик очереди
+            params['gabr_dublicates'] = duplicates.arrival_count(mess_id) or 1
+            if reference == 'snapshot':
+                result = do_range(params)
+                expected = {'rank': result['rank'], 'criteria': result['criteria'],
+                            'actions': sorted(result['actions'])}
+            else:
+                rank, criteria = ranks.get(mess_id, (None, None))
+                expected = {'rank': rank, 'criteria': criteria,
+                            'actions': sorted(sent.get(mess_id, [])) if has_journal else None}
+            messages.append({'params': params, 'expected': expected})
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({'reference': reference, 'messages': messages}, f, ensure_ascii=False)
+    return len(messages)
+
+
+def compare(expected, result):
+    """Расхождение результата с ожиданием по рангу (вместе с критерием) и по действиям; None, если совпадают.
+    Действия сравниваются без учета порядка отправки"""
+    rank_mismatch = (expected.get('rank'), expected.get('criteria')) != (result['rank'], result['criteria'])
+    action_mismatch = expected.get('actions') is not None and sorted(expected['actions']) != sorted(result['actions'])
+    if not rank_mismatch and not action_mismatch:
+        return None
+    return {
+        'mess_id': result['mess_id'],
+        'rank_mismatch': rank_mismatch,
+        'action_mismatch': action_mismatch,
+        'expected_rank': expected.get('rank'),
+        'expected_criteria': expected.get('criteria'),
+        'expected_rule': rank_rule(expected.get('rank'), expected.get('criteria')),
+        'actual_rank': result['rank'],
+        'actual_criteria': result['criteria'],
+        'actual_rule': rank_rule(result['rank'], result['criteria']),
+        'expected_actions': expected.get('actions'),
+        'actual_actions': sorted(result['actions']),
+    }
+
+
+def _replay_serial(params_list):
+    """Последовательный прогон: (результаты, задержки в секундах)"""
+    results = []
+    latencies = []
+    for params in params_list:
+        started = time.perf_counter()
+        results.append(do_range(params))
+        latencies.append(time.perf_counter() - started)
+    return results, latencies
+
+
+def _replay_batch(params_list, batch_size=1000):
+    """Порционный прогон через do_range_batch: подготовка текстовых полей и дат выполняется один раз на порцию,
+    правила по-прежнему проверяются по сообщениям. Задержка сообщения - время порции, деленное на ее размер"""
+    results = []
+    latencies = []
+    for start in range(0, len(params_list), batch_size):
+        batch = params_list[start:start + batch_size]
+        started = time.perf_counter()
+        results.extend(do_range_batch(batch))
+        latencies.extend([(time.perf_counter() - started) / len(batch)] * len(batch))
+    return results, latencies
+
+
+def _replay_process(params_list, workers):
+    """Многопроцессный прогон: порции распределяются между процессами"""
+    chunk_size = max(1, len(params_list) // (workers * 4))
+    chunks = [params_list[i:i + chunk_size] for i in range(0, len(params_list), chunk_size)]
+    results = []
+    latencies = []
+    with multiprocessing.Pool(workers) as pool:
+        for chunk_results, chunk_latencies in pool.map(_replay_serial, chunks):
+            results.extend(chunk_results)
+            latencies.extend(chunk_latencies)
+    return results, latencies
+
+
+def percentile(sorted_values, q):
+    """Перцентиль по ближайшему рангу"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_mode(mode, messages, workers, max_examples=20):
+    """Прогоняет запись в одном режиме и возвращает отчет"""
+    params_list = [message['params'] for message in messages]
+    # Режимы не должны получать кэши, заполненные предыдущим режимом
+    clear_caches()
+    started = time.perf_counter()
+    if mode == 'serial':
+        results, latencies = _replay_serial(params_list)
+    elif mode == 'batch':
+        results, latencies = _replay_batch(params_list)
+    else:
+        results, latencies = _replay_process(params_list, workers)
+    wall = time.perf_counter() - started
+
+    mismatches = [diff for diff in (compare(message['expected'], result)
+                                    for message, result in zip(messages, results)) if diff is not None]
+    latencies.sort()
+    return {
+        'messages': len(results),
+        'wall_seconds': round(wall, 4),
+        'messages_per_sec': round(len(results) / wall, 1) if wall else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 4) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 4) if latencies else None,
+        'workers': workers if mode == 'process' else 1,
+        'mismatches': len(mismatches),
+        'rank_mismatches': sum(diff['rank_mismatch'] for diff in mismatches),
+        'action_mismatches': sum(diff['action_mismatch'] for diff in mismatches),
+        'mismatch_examples': mismatches[:max_examples],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сверка и замер скорости Python-порта DO_RANGE на записанных сообщениях')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='Записать сообщения из локальной базы')
+    record_parser.add_argument('--db', '-d', default='sim_range.db', help='Путь к базе SQLite')
+    record_parser.add_argument('--output', '-o', default='sim_replay.json', help='Файл записи')
+    record_parser.add_argument('--reference', choices=REFERENCES, default='db',
+                               help='Эталон: db - SIM_RANK и журнал уведомлений SIM_SENT_MESS (сверка), '
+                                    'snapshot - снимок текущего do_range (регрессионная проверка)')
+
+    run_parser = subparsers.add_parser('run', help='Прогнать запись')
+    run_parser.add_argument('recording', help='Файл записи')
+    run_parser.add_argument('--modes', '-m', nargs='+', choices=MODES, default=list(MODES), help='Режимы прогона')
+    run_parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1, help='Число процессов')
+    run_parser.add_argument('--report', '-r', help='Файл отчета JSON (по умолчанию вывод в консоль)')
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        try:
+            count = record_from_db(args.db, args.output, args.reference)
+        except sqlite3.Error as e:
+            print(f"Ошибка базы данных: {e}")
+            sys.exit(1)
+        print(f"Записано {count} сообщений в {args.output}")
+        return
+
+    try:
+        messages, reference = load_recording(args.recording)
+    except (OSError, json.JSONDecodeError, KeyError) as e:
+        print(f"Ошибка при чтении записи: {e}")
+        sys.exit(1)
+
+    report = {
+        'recording': args.recording,
+        'messages': len(messages),
+        'reference': reference,
+        'modes': {mode: run_mode(mode, messages, args.workers) for mode in args.modes},
+    }
+    passed = all(mode_report['mismatches'] == 0 for mode_report in report['modes'].values())
+    if reference == 'db':
+        report['parity'] = passed
+        if any(message['expected'].get('actions') is None for message in messages):
+            report['parity_note'] = 'Действия не сверялись: в базе нет журнала уведомлений SIM_SENT_MESS'
+    else:
+        # Снимок записан этим же движком: совпадение означает только отсутствие регрессий
+        report['parity'] = None
+        report['regression'] = passed
+        report['parity_note'] = 'Снимок текущего do_range: эквивалентность DO_RANGE не проверялась'
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    if not passed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import sqlite3
+import argparse
+
+from sim_params import connect, fetch_params_batch, member_name
+from sim_names import normalize_name
+from sim_range import do_range
+from sim_duplicates import DuplicateIndex
+from sim_results import ResultsWriter
+
+# Точечное переранжирование при изменении списков: обратный индекс ключ участника -> MESS_ID
+# и снимок ключей списков; изменившиеся ключи определяют сообщения, которые нужно переранжировать.
+# Типы ключей: code - БИН/ИИН, name - нормализованное наименование, fio - фамилия|имя|отчество,
+# country - код страны (резидентство или страна банка).
+
+REVERSE_INDEX_DDL = """
+CREATE TABLE IF NOT EXISTS SIM_PARTICIPANT_INDEX (
+    KEY_TYPE TEXT NOT NULL,
+    KEY TEXT NOT NULL,
+    MESS_ID INTEGER NOT NULL,
+    PRIMARY KEY (KEY_TYPE, KEY, MESS_ID)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS SIM_PARTICIPANT_INDEXED (
+    MESS_ID INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS SIM_LIST_KEYS (
+    TABLE_NAME TEXT NOT NULL,
+    KEY_TYPE TEXT NOT NULL,
+    KEY TEXT NOT NULL,
+    PRIMARY KEY (TABLE_NAME, KEY_TYPE, KEY)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS SIM_LIST_SNAPSHOTS (
+    TABLE_NAME TEXT PRIMARY KEY
+);
+"""
+
+# Ключи строк списков: таблица -> [(тип ключа, колонки)]
+LIST_KEYS = {
+    'LIST_ABROAD_GREEN_1': [('name', ('NAME',))],
+    'LIST_ABROAD_GREEN_2': [('code', ('BIN',)), ('name', ('NAME',))],
+    'LIST_ABROAD_SUBSOIL_USERS': [('code', ('BIN',)), ('name', ('NAME',))],
+    'LIST_ABROAD_RED_1': [('code', ('BIN',))],
+    'LIST_ABROAD_RED_2': [('code', ('BIN',))],
+    'LIST_ABROAD_RED_3': [('code', ('BIN',))],
+    'LIST_ABROAD_RED_4': [('name', ('NAME',))],
+    'LIST_ABROAD_RED_5': [('name', ('NAME',))],
+    'LIST_ABROAD_FATF': [('country', ('CODE',))],
+    'LIST_OD_50_FORBS': [('code', ('IIN',))],
+    'LIST_OD_FL_POST_BT': [('code', ('IIN',))],
+    'LIST_OD_NP_MON': [('code', ('BIN',))],
+    'LIST_OD_UCH_PLAT': [('code', ('IINBIN',))],
+    'LIST_OD_UL_POST_BT': [('code', ('BIN',))],
+    'LIST_FT_ISKL': [('code', ('IIN',)), ('fio', ('LASTNAME', 'FIRSTNAME', 'PATRONYMIC'))],
+    'LIST_FT_MGR': [('fio', ('LASTNAME', 'FIRSTNAME', 'PATRONYMIC'))],
+    'LIST_FT_DRT': [('code', ('IIN',)), ('fio', ('LASTNAME', 'FIRSTNAME', 'PATRONYMIC'))],
+    'LIST_DMFT_FT_RELATED_FL': [('code', ('IIN',)), ('fio', ('LASTNAME', 'FIRSTNAME', 'PATRONYMIC'))],
+    'LIST_DMFT_FT_RELATED_UL': [('name', ('NAME',))],
+    'LIST_DMFT_POS_INVOLV': [('fio', ('LASTNAME', 'FIRSTNAME', 'PATRONYMIC'))],
+    'LIST_DMFT_PDL': [('code', ('IIN',)), ('fio', ('LASTNAME', 'FIRSTNAME', 'PATRONYMIC'))],
+}
+
+
+def _code_key(value):
+    """Ключ кода (БИН/ИИН/страна) в текстовом виде"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _fio_key(secondname, firstname, middlename):
+    """Ключ ФИО; как и в SET_PARAMS, сравнение идет только при заполненных фамилии, имени и отчестве"""
+    if secondname is None or firstname is None or middlename is None:
+        return None
+    return f"{secondname}|{firstname}|{middlename}"
+
+
+def member_keys(member):
+    """Ключи участника по строке EXP_MEMBERS (MAINCODE, страна, банк, наименование, ФИО)"""
+    maincode, residence, bank_address, ur_name, secondname, firstname, middlename = member
+    upper = [value.upper() if value is not None else None for value in (secondname, firstname, middlename)]
+    keys = {
+        ('code', _code_key(maincode)),
+        ('country', _code_key(residence)),
+        ('country', _code_key(bank_address)),
+        ('name', normalize_name(member_name(ur_name, secondname, firstname, middlename))),
+        ('name', normalize_name(ur_name)),
+        ('fio', _fio_key(*upper)),
+    }
+    return {(key_type, key) for key_type, key in keys if key is not None}
+
+
+def list_keys(conn, table):
+    """Ключи всех строк списка"""
+    keys = set()
+    for key_type, columns in LIST_KEYS[table]:
+        for row in conn.execute(f"SELECT {', '.join(columns)} FROM {table}"):
+            if key_type == 'name':
+                key = normalize_name(row[0])
+            elif key_type == 'fio':
+                key = _fio_key(*row)
+            else:
+                key = _code_key(row[0])
+            if key is not None:
+                keys.add((key_type, key))
+    return keys
+
+
+def ensure_reverse_index(conn):
+    """Создает таблицы обратного индекса и снимка списков"""
+    conn.executescript(REVERSE_INDEX_DDL)
+
+
+def update_reverse_index(conn, batch_size=10000):
+    """Добавляет в обратный индекс участников сообщений, которые еще не проиндексированы"""
+    ensure_reverse_index(conn)
+    mess_ids = [row[0] for row in conn.execute("""
+        SELECT DISTINCT M.MESS_ID FROM EXP_MEMBERS M
+        WHERE NOT EXISTS (SELECT 1 FROM SIM_PARTICIPANT_INDEXED I WHERE I.MESS_ID = M.MESS_ID)
+    """)]
+
+    for start in range(0, len(mess_ids), batch_size):
+        chunk = mess_ids[start:start + batch_size]
+        placeholders = ', '.join('?' * len(chunk))
+        rows = set()
+        for member in conn.execute(f"""
+            SELECT MESS_ID, MEMBER_MAINCODE, MEMBER_RESIDENCE_COUNTRYCODE, MEMBER_BANK_ADDRESS, MEMBER_UR_NAME,
+                MEMBER_AC_SECONDNAME, MEMBER_AC_FIRSTNAME, MEMBER_AC_MIDDLENAME
+            FROM EXP_MEMBERS WHERE MESS_ID IN ({placeholders}) AND MEMBER_ID IN (1, 2)
+        """, chunk):
+            rows.update((key_type, key, member[0]) for key_type, key in member_keys(member[1:]))
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO SIM_PARTICIPANT_INDEX (KEY_TYPE, KEY, MESS_ID) VALUES (?, ?, ?)",
+                             rows)
+            conn.executemany("INSERT OR IGNORE INTO SIM_PARTICIPANT_INDEXED (MESS_ID) VALUES (?)",
+                             [(mess_id,) for mess_id in chunk])
+    return len(mess_ids)
+
+
+def diff_lists(conn, tables=None):
+    """Сравнивает текущие ключи списков со снимком, обновляет снимок и возвращает изменившиеся ключи.
+    Для списка без снимка снимок только создается: при первом запуске изменений нет"""
+    ensure_reverse_index(conn)
+    snapshots = {row[0] for row in conn.execute("SELECT TABLE_NAME FROM SIM_LIST_SNAPSHOTS")}
+    changed = {}
+    for table in tables or LIST_KEYS:
+        current = list_keys(conn, table)
+        previous = {(key_type, key) for key_type, key in conn.execute(
+            "SELECT KEY_TYPE, KEY FROM SIM_LIST_KEYS WHERE TABLE_NAME = ?", (table,))}
+        if table not in snapshots and not previous:
+            with conn:
+                conn.executemany("INSERT INTO SIM_LIST_KEYS (TABLE_NAME, KEY_TYPE, KEY) VALUES (?, ?, ?)",
+                                 [(table, *key) for key in current])
+                conn.execute("INSERT INTO SIM_LIST_SNAPSHOTS (TABLE_NAME) VALUES (?)", (table,))
+            continue
+        added = current - previous
+        removed = previous - current
+        if not added and not removed:
+            continue
+        changed[table] = (added, removed)
+        with conn:
+            conn.executemany("INSERT INTO SIM_LIST_KEYS (TABLE_NAME, KEY_TYPE, KEY) VALUES (?, ?, ?)",
+                             [(table, *key) for key in added])
+            conn.executemany("DELETE FROM SIM_LIST_KEYS WHERE TABLE_NAME = ? AND KEY_TYPE = ? AND KEY = ?",
+                             [(table, *key) for key in removed])
+            conn.execute("INSERT OR IGNORE INTO SIM_LIST_SNAPSHOTS (TABLE_NAME) VALUES (?)", (table,))
+    return changed
+
+
+def affected_messages(conn, keys):
+    """MESS_ID сообщений, в которых участвует хотя бы один из ключей"""
+    mess_ids = set()
+    for key_type, key in keys:
+        mess_ids.update(row[0] for row in conn.execute(
+            "SELECT MESS_ID FROM SIM_PARTICIPANT_INDEX WHERE KEY_TYPE = ? AND KEY = ?", (key_type, key)))
+    return sorted(mess_ids)
+
+
+def rerank(conn, mess_ids, batch_size=1000, writer=None, delivery=None):
+    """Переранжирует сообщения, сохраняет изменившиеся ранги через writer (sim_results) и отправляет
+    уведомления SimBASE по ним через delivery (sim_scheduler.ActionDelivery), если он задан.
+    Как и SET_RANK, сообщение без нового ранга сохраняет прежний ранг: строка SIM_RANK не удаляется и не
+    понижается, даже если ранг был получен по снятой отметке в списке. Такие сообщения попадают в список
+    изменений с новым рангом None, чтобы их можно было разобрать вручную. Возвращает список изменений
+    (MESS_ID, старый ранг, старый критерий, новый ранг, новый критерий)"""
+    if writer is None:
+        writer = ResultsWriter(conn)
+    duplicates = DuplicateIndex(conn)
+    changes = []
+    for start in range(0, len(mess_ids), batch_size):
+        chunk = mess_ids[start:start + batch_size]
+        params_by_id = fetch_params_batch(conn, chunk)
+        placeholders = ', '.join('?' * len(chunk))
+        old = {mess_id: (rank, criteria) for mess_id, rank, criteria in conn.execute(
+            f"SELECT MESS_ID, MESS_RANK, MESS_CRITERIA FROM SIM_RANK WHERE MESS_ID IN ({placeholders})", chunk)}
+
+        results = []
+        actions = []
+        for mess_id, params in params_by_id.items():
+            # Признак дубликата берется на момент поступления сообщения; неучтенные сообщения считаются уникальными
+            params['gabr_dublicates'] = duplicates.arrival_count(mess_id) or 1
+            result = do_range(params)
+            before = old.get(mess_id, (None, None))
+            after = (result['rank'], result['criteria'])
+            if before == after:
+                continue
+            changes.append((mess_id, *before, *after))
+            if result['rank'] is None:
+                continue
+            results.append(result)
+            actions.extend((mess_id, action) for action in result['actions'])
+
+        writer.write(results, [])
+        if delivery is not None:
+            delivery.send(actions)
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Переранжирование сообщений, затронутых изменением списков')
+    parser.add_argument('--db', '-d', default='sim_range.db', help='Путь к базе SQLite')
+    parser.add_argument('--tables', '-t', nargs='*', help='Проверяемые списки (по умолчанию все)')
+    parser.add_argument('--snapshot-only', action='store_true',
+                        help='Только обновить индекс и снимок списков, без переранжирования')
+    parser.add_argument('--url', '-u', help='Адрес SimBASE для отправки уведомлений по изменившимся рангам')
+
+    args = parser.parse_args()
+
+    try:
+        conn = connect(args.db)
+        indexed = update_reverse_index(conn)
+        print(f"Проиндексировано новых сообщений: {indexed}")
+
+        changed = diff_lists(conn, args.tables)
+        keys = set()
+        for table, (added, removed) in changed.items():
+            print(f"{table}: добавлено ключей {len(added)}, удалено {len(removed)}")
+            keys |= added | removed
+        if args.snapshot_only or not keys:
+            print("Переранжирование не требуется")
+            return
+
+        mess_ids = affected_messages(conn, keys)
+        delivery = None
+        if args.url:
+            from sim_scheduler import SCHEDULER_SETTINGS, ActionDelivery
+            delivery = ActionDelivery(dict(SCHEDULER_SETTINGS, simbase_url=args.url))
+        try:
+            changes = rerank(conn, mess_ids, delivery=delivery)
+        finally:
+            if delivery is not None:
+                delivery.close()
+        updated = [change for change in changes if change[3] is not None]
+        kept = [change for change in changes if change[3] is None]
+        print(f"Переранжировано сообщений: {len(mess_ids)}, изменился ранг: {len(updated)}")
+        for mess_id, old_rank, old_criteria, new_rank, new_criteria in updated:
+            print(f"  MESS_ID = {mess_id}: ранг {old_rank} (критерий {old_criteria}) -> {new_rank} (критерий {new_criteria})")
+        if kept:
+            print(f"Ранг больше не присваивается, но сохранен в SIM_RANK (как в SET_RANK): {len(kept)}")
+            for mess_id, old_rank, old_criteria, _, _ in kept:
+                print(f"  MESS_ID = {mess_id}: ранг {old_rank} (критерий {old_criteria})")
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import time
+
+# Запись результатов ранжирования порцией: одна массовая вставка в SIM_RANK и удаление обработанных
+# сообщений из очереди SIM_CHECK_MESS в одной транзакции (вместо MERGE INTO SIM_RANK на каждый SET_RANK).
+
+OWNED_CHUNK = 500  # MESS_ID в одном запросе проверки аренды
+
+
+def collect_ranks(results):
+    """Итоговые (MESS_ID, ранг, критерий) по результатам do_range; для повторов MESS_ID остается последний"""
+    ranks = {}
+    for result in results:
+        if result['rank'] is None:
+            ranks.pop(result['mess_id'], None)
+        else:
+            ranks[result['mess_id']] = (result['mess_id'], result['rank'], result['criteria'])
+    return list(ranks.values())
+
+
+class ResultsWriter:
+    """Запись результатов через DB-API соединение; диалект задается плейсхолдером и началом транзакции"""
+
+    placeholder = '?'
+    begin_sql = None
+
+    def __init__(self, conn):
+        self.conn = conn
+        ph = self.placeholder
+        self.upsert_sql = f"""
+            INSERT INTO SIM_RANK (MESS_ID, MESS_RANK, MESS_CRITERIA) VALUES ({ph}, {ph}, {ph})
+            ON CONFLICT (MESS_ID) DO UPDATE SET MESS_RANK = excluded.MESS_RANK, MESS_CRITERIA = excluded.MESS_CRITERIA
+        """
+        self.delete_sql = f"DELETE FROM SIM_CHECK_MESS WHERE MESS_ID = {ph}"
+
+    def _begin(self, cursor):
+        if self.begin_sql:
+            cursor.execute(self.begin_sql)
+
+    def _commit(self, cursor):
+        self.conn.commit()
+
+    def _rollback(self, cursor):
+        self.conn.rollback()
+
+    def _delete_owned(self, cursor, processed_ids, owner, now):
+        """Удаляет из очереди сообщения, аренда которых у owner еще действует, и возвращает их MESS_ID"""
+        ph = self.placeholder
+        owned = set()
+        for start in range(0, len(processed_ids), OWNED_CHUNK):
+            chunk = list(processed_ids[start:start + OWNED_CHUNK])
+            cursor.execute(f"""
+                DELETE FROM SIM_CHECK_MESS
+                WHERE LEASE_OWNER = {ph} AND LEASE_UNTIL > {ph} AND MESS_ID IN ({', '.join([ph] * len(chunk))})
+                RETURNING MESS_ID
+            """, [owner, now] + chunk)
+            owned.update(row[0] for row in cursor.fetchall())
+        return owned
+
+    def write(self, results, processed_ids, owner=None, now=None):
+        """Сохраняет ранги порции и удаляет обработанные сообщения из очереди. Если задан owner, сохраняются
+        только сообщения из processed_ids, аренда которых у owner не истекла (проверка в той же транзакции).
+        Возвращает множество MESS_ID, результаты которых сохранены"""
+        ranks = collect_ranks(results)
+        processed_ids = list(processed_ids)
+        if not ranks and not processed_ids:
+            return set()
+        if now is None:
+            now = time.time()
+
+        cursor = self.conn.cursor()
+        self._begin(cursor)
+        try:
+            if owner is None:
+                saved_ids = set(processed_ids) | {result['mess_id'] for result in results}
+                if processed_ids:
+                    cursor.executemany(self.delete_sql, [(mess_id,) for mess_id in processed_ids])
+            else:
+                saved_ids = self._delete_owned(cursor, processed_ids, owner, now)
+                ranks = [rank for rank in ranks if rank[0] in saved_ids]
+            if ranks:
+                cursor.executemany(self.upsert_sql, ranks)
+            self._commit(cursor)
+        except BaseException:
+            self._rollback(cursor)
+            raise
+        return saved_ids
+
+
+class SqliteResultsWriter(ResultsWriter):
+    """Запись в локальную базу SQLite; транзакция управляется явно (соединение с isolation_level = None)"""
+
+    begin_sql = "BEGIN IMMEDIATE"
+
+    def _commit(self, cursor):
+        cursor.execute("COMMIT")
+
+    def _rollback(self, cursor):
+        cursor.execute("ROLLBACK")
+
+
+class PostgresResultsWriter(ResultsWriter):
+    """Запись в PostgreSQL через соединение psycopg (SIM_RANK с первичным ключом MESS_ID)"""
+
+    placeholder = '%s'
@@ -0,0 +1,171 @@
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+
+from sim_notifier import SIMBASE_SETTINGS, SimNotifier, is_delivered
+
+# Настройки повторной отправки
+RETRY_SETTINGS = {
+    "base_delay": 5.0,  # Базовая задержка: верхняя граница первой задержки - base_delay * 2, секунд
+    "max_delay": 3600.0,  # Максимальная задержка перед повтором, секунд
+    "max_attempts": 20,  # После стольких неудачных попыток запись больше не отправляется
+    "batch_size": 200,  # Размер порции повторной отправки
+}
+
+QUEUE_DDL = """
+CREATE TABLE IF NOT EXISTS SIM_RETRY_QUEUE (
+    MESS_ID INTEGER NOT NULL,
+    ACTION INTEGER NOT NULL,
+    CONTENT TEXT NOT NULL,
+    ATTEMPTS INTEGER NOT NULL DEFAULT 0,
+    NEXT_ATTEMPT_AT REAL,
+    LAST_ERROR TEXT,
+    CREATED_AT REAL NOT NULL,
+    PRIMARY KEY (MESS_ID, ACTION)
+);
+CREATE INDEX IF NOT EXISTS SIM_RETRY_QUEUE_NEXT ON SIM_RETRY_QUEUE (NEXT_ATTEMPT_AT);
+"""
+
+
+def connect_queue(db_path):
+    """Открывает базу очереди повторной отправки"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(QUEUE_DDL)
+    return conn
+
+
+def backoff_delay(attempts, settings=RETRY_SETTINGS):
+    """Экспоненциальная задержка с полным джиттером для заданного числа неудачных попыток:
+    случайная величина от 0 до min(max_delay, base_delay * 2 ** attempts)"""
+    ceiling = min(settings["max_delay"], settings["base_delay"] * (2 ** attempts))
+    return random.uniform(0, ceiling)
+
+
+def enqueue_failed(conn, results, now=None, settings=RETRY_SETTINGS):
+    """Сохраняет неотправленные уведомления вместе с уже сформированным запросом и удаляет из очереди
+    уведомления, доставленные основной отправкой (как удаление из SIM_ERROR_MESS при успехе).
+    Новая неудача начинает отсчет попыток заново, в том числе для записи, исчерпавшей попытки"""
+    if now is None:
+        now = time.time()
+
+    delivered = [(r["mess_id"], r["action"]) for r in results if is_delivered(r)]
+    failed = [r for r in results if not is_delivered(r)]
+    with conn:
+        conn.executemany("DELETE FROM SIM_RETRY_QUEUE WHERE MESS_ID = ? AND ACTION = ?", delivered)
+        conn.executemany("""
+            INSERT INTO SIM_RETRY_QUEUE (MESS_ID, ACTION, CONTENT, ATTEMPTS, NEXT_ATTEMPT_AT, LAST_ERROR, CREATED_AT)
+            VALUES (?, ?, ?, 1, ?, ?, ?)
+            ON CONFLICT (MESS_ID, ACTION) DO UPDATE SET
+                CONTENT = excluded.CONTENT, LAST_ERROR = excluded.LAST_ERROR,
+                ATTEMPTS = 1, NEXT_ATTEMPT_AT = excluded.NEXT_ATTEMPT_AT
+        """, [(r["mess_id"], r["action"], r["content"], now + backoff_delay(1, settings), r["error_text"], now)
+              for r in failed])
+    return len(failed)
+
+
+def due_batch(conn, limit, now=None):
+    """Возвращает порцию записей, для которых наступило время повторной отправки"""
+    if now is None:
+        now = time.time()
+    return conn.execute("""
+        SELECT MESS_ID, ACTION, CONTENT, ATTEMPTS FROM SIM_RETRY_QUEUE
+        WHERE NEXT_ATTEMPT_AT IS NOT NULL AND NEXT_ATTEMPT_AT <= ?
+        ORDER BY NEXT_ATTEMPT_AT LIMIT ?
+    """, (now, limit)).fetchall()
+
+
+def record_results(conn, batch, results, now=None, settings=RETRY_SETTINGS):
+    """Удаляет доставленные записи, остальным увеличивает счетчик попыток и назначает новое время"""
+    if now is None:
+        now = time.time()
+
+    attempts_by_key = {(mess_id, action): attempts for mess_id, action, _, attempts in batch}
+    delivered = []
+    rescheduled = []
+    for result in results:
+        key = (result["mess_id"], result["action"])
+        if is_delivered(result):
+            delivered.append(key)
+            continue
+        attempts = attempts_by_key[key] + 1
+        # После max_attempts запись остается в очереди без времени отправки (для ручного разбора)
+        next_attempt = None if attempts >= settings["max_attempts"] else now + backoff_delay(attempts, settings)
+        rescheduled.append((attempts, next_attempt, result["error_text"], *key))
+
+    with conn:
+        conn.executemany("DELETE FROM SIM_RETRY_QUEUE WHERE MESS_ID = ? AND ACTION = ?", delivered)
+        conn.executemany("""
+            UPDATE SIM_RETRY_QUEUE SET ATTEMPTS = ?, NEXT_ATTEMPT_AT = ?, LAST_ERROR = ?
+            WHERE MESS_ID = ? AND ACTION = ?
+        """, rescheduled)
+    return len(delivered), len(rescheduled)
+
+
+async def redeliver(conn, notifier, settings=RETRY_SETTINGS):
+    """Повторно отправляет все записи с наступившим временем, порциями; ранги не пересчитываются"""
+    total_delivered = 0
+    total_failed = 0
+    while True:
+        batch = due_batch(conn, settings["batch_size"])
+        if not batch:
+            break
+        results = await asyncio.gather(*(notifier.send(mess_id, action, content)
+                                         for mess_id, action, content, _ in batch))
+        delivered, failed = record_results(conn, batch, results, settings=settings)
+        total_delivered += delivered
+        total_failed += failed
+    return total_delivered, total_failed
+
+
+async def send_with_retry(conn, notifier, actions):
+    """Отправляет уведомления (mess_id, action); неотправленные ставит в очередь повторов,
+    доставленные убирает из нее"""
+    results = await notifier.send_many(actions)
+    enqueue_failed(conn, results)
+    return results
+
+
+def queue_stats(conn):
+    """Возвращает количество ожидающих и исчерпавших попытки записей"""
+    pending, dead = conn.execute("""
+        SELECT COUNT(NEXT_ATTEMPT_AT), COUNT(*) - COUNT(NEXT_ATTEMPT_AT) FROM SIM_RETRY_QUEUE
+    """).fetchone()
+    return pending, dead
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Повторная отправка неотправленных уведомлений SimBASE')
+    parser.add_argument('--db', '-d', default='sim_retry_queue.db', help='Путь к базе очереди')
+    parser.add_argument('--url', '-u', default=SIMBASE_SETTINGS["url"], help='Адрес сервиса SimBASE')
+    parser.add_argument('--batch', '-b', type=int, default=RETRY_SETTINGS["batch_size"], help='Размер порции')
+    parser.add_argument('--interval', '-i', type=float, default=0,
+                        help='Интервал между проходами, секунд (0 - один проход)')
+
+    args = parser.parse_args()
+
+    settings = dict(RETRY_SETTINGS, batch_size=args.batch)
+    notifier_settings = dict(SIMBASE_SETTINGS, url=args.url)
+
+    async def run():
+        conn = connect_queue(args.db)
+        async with SimNotifier(notifier_settings) as notifier:
+            while True:
+                delivered, failed = await redeliver(conn, notifier, settings)
+                pending, dead = queue_stats(conn)
+                print(f"Доставлено: {delivered}, отложено: {failed}, в очереди: {pending}, исчерпали попытки: {dead}")
+                if not args.interval:
+                    break
+                await asyncio.sleep(args.interval)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+
+if __name__ == "__main__":
+    main()
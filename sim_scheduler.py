@@ -0,0 +1,223 @@
+import os
+import time
+import uuid
+import sqlite3
+import asyncio
+import argparse
+import multiprocessing
+
+from sim_params import connect, fetch_params_batch
+from sim_range import do_range
+from sim_duplicates import DuplicateIndex
+from sim_results import SqliteResultsWriter
+
+# Настройки обработчика очереди SIM_CHECK_MESS
+SCHEDULER_SETTINGS = {
+    "workers": os.cpu_count() or 1,  # Число параллельных обработчиков
+    "lease_seconds": 120.0,  # Срок аренды порции; после истечения порцию забирает другой обработчик
+    "min_batch": 10,  # Минимальный размер порции
+    "max_batch": 1000,  # Максимальный размер порции
+    "target_batch_seconds": 2.0,  # Целевое время обработки одной порции
+    "idle_sleep": 0.5,  # Начальная пауза при пустой очереди, секунд
+    "max_idle_sleep": 10.0,  # Максимальная пауза при пустой очереди, секунд
+    "simbase_url": None,  # Адрес SimBASE; если не задан, уведомления не отправляются
+    "retry_queue_db": "sim_retry_queue.db",  # База очереди повторной отправки уведомлений
+    "check_duplicates": True,  # Учитывать дубликаты (IS_ABR_DUBLICATE) по индексу SIM_DUP_INDEX
+}
+
+
+def ensure_lease_columns(conn):
+    """Добавляет в SIM_CHECK_MESS колонки аренды, если их еще нет"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(SIM_CHECK_MESS)")}
+    with conn:
+        if 'LEASE_OWNER' not in columns:
+            conn.execute("ALTER TABLE SIM_CHECK_MESS ADD COLUMN LEASE_OWNER TEXT")
+        if 'LEASE_UNTIL' not in columns:
+            conn.execute("ALTER TABLE SIM_CHECK_MESS ADD COLUMN LEASE_UNTIL REAL")
+        conn.execute("CREATE INDEX IF NOT EXISTS SIM_CHECK_MESS_LEASE ON SIM_CHECK_MESS (LEASE_UNTIL, MESS_ADDED)")
+
+
+def open_queue_db(db_path):
+    """Открывает базу очереди для обработчика (WAL, ожидание блокировок)"""
+    conn = connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.isolation_level = None  # Транзакции управляются явно
+    return conn
+
+
+def claim_batch(conn, owner, size, lease_seconds, now=None):
+    """Забирает в аренду порцию сообщений, у которых нет действующей аренды"""
+    if now is None:
+        now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute("""
+            UPDATE SIM_CHECK_MESS SET LEASE_OWNER = ?, LEASE_UNTIL = ?
+            WHERE MESS_ID IN (
+                SELECT MESS_ID FROM SIM_CHECK_MESS
+                WHERE LEASE_UNTIL IS NULL OR LEASE_UNTIL < ?
+                ORDER BY MESS_ADDED LIMIT ?
+            )
+            RETURNING MESS_ID
+        """, (owner, now + lease_seconds, now, size)).fetchall()
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return [row[0] for row in rows]
+
+
+def next_batch_size(size, elapsed, settings):
+    """Адаптирует размер порции к наблюдаемому времени обработки (AIMD)"""
+    target = settings["target_batch_seconds"]
+    if elapsed > target:
+        # Обработка не укладывается в целевое время: сокращаем порцию пропорционально
+        size = int(size * max(0.5, target / elapsed))
+    else:
+        size += max(1, size // 10)
+    return max(settings["min_batch"], min(settings["max_batch"], size))
+
+
+class ActionDelivery:
+    """Отправка уведомлений SimBASE обработчиком: один цикл событий, SimNotifier (с пулом соединений)
+    и база очереди повторов на весь процесс; неотправленные уведомления ставятся в очередь повторов"""
+
+    def __init__(self, settings):
+        from sim_notifier import SIMBASE_SETTINGS, SimNotifier
+        from sim_retry_queue import connect_queue
+
+        self.runner = asyncio.Runner()
+        self.queue_conn = connect_queue(settings["retry_queue_db"])
+
+        async def create_notifier():
+            return SimNotifier(dict(SIMBASE_SETTINGS, url=settings["simbase_url"]))
+
+        self.notifier = self.runner.run(create_notifier())
+
+    def send(self, actions):
+        """Отправляет уведомления (mess_id, action) в цикле событий обработчика"""
+        from sim_retry_queue import send_with_retry
+
+        if actions:
+            self.runner.run(send_with_retry(self.queue_conn, self.notifier, actions))
+
+    def close(self):
+        try:
+            self.runner.run(self.notifier.__aexit__(None, None, None))
+        finally:
+            self.runner.close()
+            self.queue_conn.close()
+
+
+def process_batch(conn, owner, mess_ids, settings, duplicates=None, writer=None, delivery=None):
+    """Ранжирует порцию сообщений, сохраняет ранги одной транзакцией и возвращает число обработанных.
+    Ранги сохраняются и уведомления отправляются только для сообщений, аренда которых у owner еще действует"""
+    if writer is None:
+        writer = SqliteResultsWriter(conn)
+    params_by_id = fetch_params_batch(conn, mess_ids)
+    # Сообщения, которых нет в DWH, удаляются из очереди вместе с обработанными (аналог NO_DATA_FOUND -> CONTINUE)
+    done_ids = [mess_id for mess_id in mess_ids if mess_id not in params_by_id]
+
+    if duplicates is not None and params_by_id:
+        # Сообщения учитываются в индексе по мере поступления: первое с данным ключом ранжируется, повторы - нет
+        for mess_id, count in duplicates.add_batch(params_by_id.values()).items():
+            params_by_id[mess_id]['gabr_dublicates'] = count
+
+    results = []
+    actions = []
+    for mess_id in mess_ids:
+        params = params_by_id.get(mess_id)
+        if params is None:
+            continue
+        try:
+            result = do_range(params)
+        except Exception as e:
+            # Сообщение остается в очереди и будет взято снова после истечения аренды
+            print(f"Ошибка DO_RANGE для MESS_ID = {mess_id}: {e}")
+            continue
+        results.append(result)
+        done_ids.append(mess_id)
+        actions.extend((mess_id, action) for action in result['actions'])
+
+    # Аренда могла истечь во время ранжирования: тогда сообщение уже забрал другой обработчик
+    saved_ids = writer.write(results, done_ids, owner)
+    if delivery is not None:
+        delivery.send([(mess_id, action) for mess_id, action in actions if mess_id in saved_ids])
+    return sum(1 for result in results if result['mess_id'] in saved_ids)
+
+
+def worker_loop(worker_id, db_path, settings, stop_event, drain=False):
+    """Цикл обработчика: аренда порции, ранжирование, сохранение, адаптация размера порции"""
+    owner = f"{os.getpid()}-{worker_id}-{uuid.uuid4().hex[:8]}"
+    conn = open_queue_db(db_path)
+    duplicates = DuplicateIndex(conn) if settings["check_duplicates"] else None
+    writer = SqliteResultsWriter(conn)
+    delivery = ActionDelivery(settings) if settings["simbase_url"] else None
+    batch_size = settings["min_batch"]
+    idle_sleep = settings["idle_sleep"]
+    total = 0
+
+    try:
+        while not stop_event.is_set():
+            mess_ids = claim_batch(conn, owner, batch_size, settings["lease_seconds"])
+            if not mess_ids:
+                if drain:
+                    break
+                # Очередь пуста: увеличиваем паузу, чтобы не нагружать базу опросами
+                stop_event.wait(idle_sleep)
+                idle_sleep = min(settings["max_idle_sleep"], idle_sleep * 2)
+                continue
+
+            idle_sleep = settings["idle_sleep"]
+            started = time.perf_counter()
+            total += process_batch(conn, owner, mess_ids, settings, duplicates, writer, delivery)
+            batch_size = next_batch_size(batch_size, time.perf_counter() - started, settings)
+    except sqlite3.Error as e:
+        print(f"Обработчик {owner}: ошибка базы данных: {e}")
+    finally:
+        conn.close()
+        if delivery is not None:
+            delivery.close()
+
+    print(f"Обработчик {owner}: обработано {total} сообщений")
+
+
+def run_scheduler(db_path, settings=SCHEDULER_SETTINGS, drain=False):
+    """Запускает пул обработчиков очереди SIM_CHECK_MESS"""
+    conn = open_queue_db(db_path)
+    ensure_lease_columns(conn)
+    conn.close()
+
+    stop_event = multiprocessing.Event()
+    workers = [multiprocessing.Process(target=worker_loop, args=(i, db_path, settings, stop_event, drain))
+               for i in range(settings["workers"])]
+    for worker in workers:
+        worker.start()
+
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Непрерывное ранжирование сообщений из очереди SIM_CHECK_MESS')
+    parser.add_argument('--db', '-d', default='sim_range.db', help='Путь к базе SQLite')
+    parser.add_argument('--workers', '-w', type=int, default=SCHEDULER_SETTINGS["workers"], help='Число обработчиков')
+    parser.add_argument('--lease', type=float, default=SCHEDULER_SETTINGS["lease_seconds"], help='Срок аренды порции, секунд')
+    parser.add_argument('--url', '-u', help='Адрес SimBASE для отправки уведомлений')
+    parser.add_argument('--drain', action='store_true', help='Завершить работу, когда очередь опустеет')
+
+    args = parser.parse_args()
+
+    settings = dict(SCHEDULER_SETTINGS, workers=args.workers, lease_seconds=args.lease, simbase_url=args.url)
+    started = time.time()
+    run_scheduler(args.db, settings, drain=args.drain)
+    print(f"Работа завершена за {time.time() - started:.1f} с")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from find_related_tx import find_related_in_tx_data, parse_transactions, unique_items
+from tx_output import RelatedWriter, iter_groups
+
+
+def message(mess_id, payer, recipient, hour, amount=1000000.0):
+    return {'row_to_json': {
+        'gmess_id': mess_id, 'goper_trans_date': f'2024-01-01T{hour:02d}:00:00', 'goper_tenge_amount': amount,
+        'gmember_name_pl1': f'Участник {payer}', 'gmember_maincode_pl1': payer,
+        'gmember_name_pol1': f'Участник {recipient}', 'gmember_maincode_pol1': recipient,
+    }}
+
+
+def indexed_transactions():
+    """Все транзакции индекса и затронутые новой порцией: A-B-C-D связаны через старые транзакции 1 и 2,
+    проверяются только новые транзакции 3 и 5 (C -> D)"""
+    messages = [message(1, '111', '222', 1), message(2, '222', '333', 2), message(3, '333', '444', 3),
+                message(4, '555', '666', 4), message(5, '333', '444', 5)]
+    component_data = parse_transactions(messages)
+    return component_data, {tx_id: component_data[tx_id] for tx_id in (3, 5)}
+
+
+def components_by_id(related_groups):
+    for group_info in related_groups:
+        if group_info['type'] == 'connected_components':
+            return {group['component_id']: group for group in group_info['groups']}
+    return {}
+
+
+def test_components_use_all_transactions_when_detectors_see_a_part():
+    component_data, tx_data = indexed_transactions()
+    related_groups = find_related_in_tx_data(tx_data, component_data=component_data, entity_resolution=False)
+
+    components = components_by_id(related_groups)
+    assert list(components) == [1]
+    assert components[1]['size'] == 4
+    assert sorted(components[1]['tx_ids']) == [1, 2, 3, 5]
+    assert component_data[4]['component_id'] == 2
+
+
+@pytest.mark.parametrize('partial', [False, True])
+def test_component_id_is_known_when_transactions_are_written(tmp_path, partial):
+    component_data, tx_data = indexed_transactions()
+    if not partial:
+        tx_data, component_data = component_data, None
+    output = tmp_path / 'related.jsonl'
+
+    with RelatedWriter(str(output), component_data or tx_data) as writer:
+        find_related_in_tx_data(tx_data, writer=writer, component_data=component_data, entity_resolution=False)
+
+    records = [json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()]
+    transactions = {record['tx_id']: record['component_id'] for record in records if record['record'] == 'transaction'}
+    assert transactions
+    assert all(transactions[tx_id] == (2 if tx_id == 4 else 1) for tx_id in transactions)
+    assert any(group_type == 'multiple_tx_between_same_persons' for group_type, _, _ in iter_groups(str(output)))
+
+
+def test_unique_items_keeps_all_distinct_chains():
+    seen = set()
+    chains = [[{'tx_id': i}, {'tx_id': i + 1}] for i in range(150000)]
+    assert len(unique_items('chains', chains, seen)) == 150000
+    # Цепочки, найденные повторно в другой части, отбрасываются
+    assert unique_items('chains', chains[:10] + [[{'tx_id': -1}, {'tx_id': 0}]], seen) == [[{'tx_id': -1}, {'tx_id': 0}]]
+    cycles = [{'transactions': chain} for chain in chains[:3]]
+    assert unique_items('round_trips', cycles + cycles, set()) == cycles
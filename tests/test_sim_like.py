@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from sim_like import LikeMatcher, like_regex
+
+PATTERNS = ['%ооо%', 'ип %', '%банк', 'ао _азпочта%', '%a%b%c%', '%ab%abc%', 'точно', '100\\%%', '%\\_%', '%']
+
+
+@pytest.mark.parametrize('text, pattern, expected', [
+    ('тоо ооо ромашка', '%ооо%', True),
+    ('ип иванов', 'ип %', True),
+    ('иван ип', 'ип %', False),
+    ('народный банк', '%банк', True),
+    ('банк народный', '%банк', False),
+    ('ао казпочта', 'ао _азпочта%', True),
+    ('ао азпочта', 'ао _азпочта%', False),
+    ('xaybzc', '%a%b%c%', True),
+    ('cba', '%a%b%c%', False),
+    ('abc', '%ab%abc%', False),
+    ('ab-abc', '%ab%abc%', True),
+    ('точно', 'точно', True),
+    ('точно ', 'точно', False),
+    ('100%', '100\\%%', True),
+    ('1000', '100\\%%', False),
+    ('a_b', '%\\_%', True),
+    ('ab', '%\\_%', False),
+    ('', '%', True),
+])
+def test_like(text, pattern, expected):
+    matcher = LikeMatcher(PATTERNS)
+    hits = matcher.match(text)
+    assert matcher.like(hits, pattern) is expected
+    assert matcher.not_like(hits, pattern) is not expected
+
+
+def test_null_matches_nothing():
+    matcher = LikeMatcher(PATTERNS)
+    hits = matcher.match(None)
+    assert hits is None
+    assert not matcher.like(hits, '%')
+    assert not matcher.not_like(hits, '%')
+    assert not matcher.any_like(hits, matcher.mask(PATTERNS))
+
+
+def test_any_like():
+    matcher = LikeMatcher(PATTERNS)
+    hits = matcher.match('ип банк')
+    assert matcher.any_like(hits, matcher.mask(['%ооо%', '%банк']))
+    assert not matcher.any_like(hits, matcher.mask(['%ооо%', 'точно']))
+
+
+def test_matches_regex_on_random_texts():
+    rng = random.Random(7)
+    alphabet = 'ab_%'
+    patterns = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 6))) for _ in range(60)]
+    matcher = LikeMatcher(patterns)
+    for _ in range(500):
+        text = ''.join(rng.choice('abc_') for _ in range(rng.randint(0, 10)))
+        hits = matcher.match(text)
+        for pattern in patterns:
+            assert matcher.like(hits, pattern) == (like_regex(pattern).fullmatch(text) is not None), (text, pattern)
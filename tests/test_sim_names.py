@@ -0,0 +1,37 @@
+import pytest
+
+from sim_names import NameIndex, normalize_name
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('ТОО "Ромашка"', 'ромашка'),
+    ('Ромашка ТОО', 'ромашка'),
+    ('ИП Иванов', 'иванов'),
+    ('Volvo AB', normalize_name('Volvo')),
+    ('X Co., Ltd.', normalize_name('X')),
+    ('Товарищество с ограниченной ответственностью «Ромашка»', 'ромашка'),
+])
+def test_legal_forms_are_stripped_at_the_edges(name, expected):
+    assert normalize_name(name) == expected
+
+
+@pytest.mark.parametrize('name', ['AB Co Holding', 'AS Trade', 'SA Group', 'Нур Ас Трейд', 'Алма Ип Сервис'])
+def test_short_forms_are_kept_at_the_start_and_inside(name):
+    assert len(normalize_name(name).split()) == len(name.split())
+
+
+def test_name_is_never_stripped_to_nothing():
+    assert normalize_name('ТОО') == 'тоо'
+    assert normalize_name(None) is None
+    assert normalize_name(' " ') is None
+
+
+def test_homoglyphs_and_punctuation():
+    assert normalize_name('TOO «KAZ-TRANS»') == normalize_name('ТОО "КАZ TRANS"')
+
+
+def test_name_index_counts_by_name_or_bin():
+    index = NameIndex([(1, '111', 'ТОО Ромашка'), (2, None, 'Ромашка LLP'), (3, '222', 'Василек')])
+    assert index.count('Ромашка') == 2
+    assert index.count('Ромашка', '222') == 3
+    assert index.count('AB Co Holding') == 0
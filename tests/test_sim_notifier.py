@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+from sim_notifier import SIMBASE_SETTINGS, SimNotifier, handle_stub_connection, is_delivered, start_stub_server
+
+
+def settings_for(server, **overrides):
+    port = server.sockets[0].getsockname()[1]
+    return dict(SIMBASE_SETTINGS, url=f'http://127.0.0.1:{port}', **overrides)
+
+
+async def counting_stub(failing_ids=(), delay=0.0):
+    """Заглушка SimBASE, считающая открытые к ней соединения"""
+    failing_ids = {str(mess_id) for mess_id in failing_ids}
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        await handle_stub_connection(reader, writer, failing_ids, delay)
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, connections
+
+
+def test_send_many_returns_result_per_action():
+    async def run():
+        server = await start_stub_server(failing_ids=(2,))
+        async with server:
+            async with SimNotifier(settings_for(server)) as notifier:
+                return await notifier.send_many([(1, 5), (2, 5), (3, 7)])
+
+    results = asyncio.run(run())
+    assert [(r['mess_id'], r['action']) for r in results] == [(1, 5), (2, 5), (3, 7)]
+    assert [is_delivered(r) for r in results] == [True, False, True]
+    assert results[1]['error_code'] == '1'
+    assert 'Сообщение не найдено' in results[1]['error_text']
+    assert '<arg name="o_mess_id">3</arg>' in results[2]['content']
+
+
+def test_send_many_respects_max_in_flight():
+    async def run(max_in_flight):
+        server = await start_stub_server(delay=0.1)
+        async with server:
+            async with SimNotifier(settings_for(server, max_in_flight=max_in_flight, pool_size=8)) as notifier:
+                started = time.perf_counter()
+                results = await notifier.send_many([(mess_id, 5) for mess_id in range(8)])
+                return time.perf_counter() - started, results
+
+    parallel, results = asyncio.run(run(8))
+    assert all(is_delivered(r) for r in results)
+    limited, _ = asyncio.run(run(2))
+    assert parallel < 0.35
+    assert limited >= 0.4
+
+
+def test_timeout_and_connection_error():
+    async def run():
+        server = await start_stub_server(delay=0.5)
+        settings = settings_for(server, timeout=0.1)
+        async with server:
+            async with SimNotifier(settings) as notifier:
+                timed_out = await notifier.send(1, 5)
+        async with SimNotifier(dict(settings, timeout=1.0)) as notifier:
+            refused = await notifier.send(2, 5)  # Сервер уже остановлен
+        return timed_out, refused
+
+    timed_out, refused = asyncio.run(run())
+    assert timed_out['error_code'] is None and timed_out['error_text'].startswith('Таймаут')
+    assert refused['error_code'] is None and refused['error_text'].startswith('Ошибка соединения')
+
+
+def test_keep_alive_connections_are_reused():
+    async def run():
+        server, connections = await counting_stub()
+        async with server:
+            async with SimNotifier(settings_for(server, max_in_flight=4, pool_size=4)) as notifier:
+                await notifier.send_many([(mess_id, 5) for mess_id in range(4)])
+                after_first = (len(connections), len(notifier.pool.idle))
+                await notifier.send_many([(mess_id, 5) for mess_id in range(4, 8)])
+                after_second = (len(connections), len(notifier.pool.idle))
+        return after_first, after_second
+
+    (opened_first, idle_first), (opened_second, idle_second) = asyncio.run(run())
+    assert opened_first == idle_first == 4
+    assert opened_second == 4  # Вторая порция идет по тем же соединениям
+    assert idle_second == 4
+
+
+def test_stale_connection_is_replaced():
+    async def run():
+        server, connections = await counting_stub()
+        async with server:
+            async with SimNotifier(settings_for(server, max_in_flight=1, pool_size=1)) as notifier:
+                await notifier.send(1, 5)
+                connections[0].close()  # Сервер закрывает простаивающее соединение
+                await asyncio.sleep(0.05)
+                result = await notifier.send(2, 5)
+                return result, len(connections), len(notifier.pool.idle)
+
+    result, opened, idle = asyncio.run(run())
+    assert is_delivered(result)
+    assert opened == 2
+    assert idle == 1
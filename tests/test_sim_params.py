@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+from sim_params import name_index
+
+
+def list_db(rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE LIST_ABROAD_GREEN_2 (NAME TEXT, BIN TEXT)")
+    conn.executemany("INSERT INTO LIST_ABROAD_GREEN_2 (NAME, BIN) VALUES (?, ?)", rows)
+    conn.commit()
+    return conn
+
+
+@pytest.fixture
+def conn():
+    conn = list_db([('ТОО "Ромашка"', '111'), ('Volvo AB', '222')])
+    yield conn
+    conn.close()
+
+
+def test_index_is_cached_while_list_is_unchanged(conn):
+    assert name_index(conn, 'LIST_ABROAD_GREEN_2', 'BIN') is name_index(conn, 'LIST_ABROAD_GREEN_2', 'BIN')
+
+
+def test_bin_update_rebuilds_index(conn):
+    assert name_index(conn, 'LIST_ABROAD_GREEN_2', 'BIN').count(None, '111') == 1
+    conn.execute("UPDATE LIST_ABROAD_GREEN_2 SET BIN = '333' WHERE BIN = '111'")
+    conn.commit()
+    index = name_index(conn, 'LIST_ABROAD_GREEN_2', 'BIN')
+    assert index.count(None, '111') == 0
+    assert index.count(None, '333') == 1
+
+
+def test_same_length_name_edit_rebuilds_index(conn):
+    assert name_index(conn, 'LIST_ABROAD_GREEN_2', 'BIN').count('Ромашка') == 1
+    conn.execute("UPDATE LIST_ABROAD_GREEN_2 SET NAME = ? WHERE BIN = '111'", ('ТОО "Василек"',))
+    conn.commit()
+    index = name_index(conn, 'LIST_ABROAD_GREEN_2', 'BIN')
+    assert index.count('Ромашка') == 0
+    assert index.count('ТОО Василек') == 1
+
+
+def test_change_from_other_connection_rebuilds_index(tmp_path):
+    path = str(tmp_path / 'lists.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE LIST_ABROAD_GREEN_2 (NAME TEXT, BIN TEXT)")
+    conn.execute("INSERT INTO LIST_ABROAD_GREEN_2 VALUES ('Ромашка', '111')")
+    conn.commit()
+    assert name_index(conn, 'LIST_ABROAD_GREEN_2', 'BIN').count('Ромашка') == 1
+
+    other = sqlite3.connect(path)
+    other.execute("UPDATE LIST_ABROAD_GREEN_2 SET NAME = 'Василек'")
+    other.commit()
+    other.close()
+    assert name_index(conn, 'LIST_ABROAD_GREEN_2', 'BIN').count('Ромашка') == 0
+    conn.close()
+
+
+def test_memory_connections_do_not_share_cache():
+    first = list_db([('Ромашка', '111')])
+    second = list_db([('Василек', '222')])
+    assert name_index(first, 'LIST_ABROAD_GREEN_2', 'BIN').count('Ромашка') == 1
+    assert name_index(second, 'LIST_ABROAD_GREEN_2', 'BIN').count('Ромашка') == 0
+    assert name_index(second, 'LIST_ABROAD_GREEN_2', 'BIN').count('Василек') == 1
+    first.close()
+    second.close()
@@ -0,0 +1,37 @@
+import pytest
+
+from sim_range import do_range, is_ft_high_risk, is_ft_low_risk, is_ft_mid_risk
+
+
+def ft_message(reason_code, bank_address, ft_list, **extra):
+    """Сообщение ФТ с КППО 3001: условие по КППО выполняется только через страну банка участника 1.
+    MEMBER_BANK_ADDRESS приходит из sim_params текстом"""
+    params = {'gmess_id': 1, 'gmess_oper_status': 1, 'gmess_reason_code': reason_code,
+              'goper_susp_first': 3001, 'gmember1_bank_address': bank_address, f'gis_member1_ft_list{ft_list}': 1}
+    params.update(extra)
+    return params
+
+
+HIGH = dict(gmember1_member_type=2, gmember1_money_trans_sys=1)
+
+
+@pytest.mark.parametrize('params, check, rank', [
+    (ft_message(2, '4', 2, **HIGH), is_ft_high_risk, 10),
+    (ft_message(4, '368', 3), is_ft_mid_risk, 6),
+    (ft_message(8, '586', 4), is_ft_low_risk, 3),
+])
+def test_ft_risk_through_bank_country(params, check, rank):
+    assert check(params)
+    assert do_range(params)['rank'] == rank
+
+
+@pytest.mark.parametrize('bank_address', ['4', ' 4', '4.0', 4, 4.0])
+def test_bank_country_is_compared_as_number(bank_address):
+    assert is_ft_mid_risk(ft_message(4, bank_address, 2))
+
+
+@pytest.mark.parametrize('bank_address', ['398', 'абв', None])
+def test_other_bank_country_does_not_match(bank_address):
+    params = ft_message(4, bank_address, 2)
+    assert not is_ft_mid_risk(params)
+    assert do_range(params)['rank'] is None
@@ -0,0 +1,73 @@
+import pytest
+
+from sim_params import connect
+from sim_replay import compare, load_recording, record_from_db, run_mode
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Сообщение ФТ среднего риска (ранг 6, без уведомления): ИИН плательщика в LIST_FT_ISKL"""
+    path = str(tmp_path / 'sim.db')
+    conn = connect(path)
+    conn.execute("INSERT INTO EXP_MESSINFO VALUES (1, 1, 4)")
+    conn.execute("INSERT INTO EXP_OPERATION VALUES (1, 'N1', '2024-09-01T10:00:00', 6e7, 0, 311, NULL, 3001, "
+                 "NULL, NULL, NULL, NULL)")
+    conn.execute("INSERT INTO EXP_SUBJ VALUES (1, '123', 11)")
+    conn.execute("INSERT INTO MESS_OFM VALUES (1, '2024-09-02T10:00:00')")
+    conn.execute("INSERT INTO EXP_MEMBERS VALUES (1, 210131, 1, '870101300123', 398, '368', 1, NULL, "
+                 "'Иванов', 'Иван', 'Иванович', NULL, NULL)")
+    conn.execute("INSERT INTO EXP_MEMBERS VALUES (1, 210132, 2, 'R1', 840, '840', 1, NULL, "
+                 "'Петров', 'Петр', 'Петрович', 1, NULL)")
+    conn.execute("INSERT INTO LIST_FT_ISKL VALUES ('870101300123', NULL, NULL, NULL)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def record(db_path, tmp_path, reference='db', rows=()):
+    conn = connect(db_path)
+    for sql, values in rows:
+        conn.execute(sql, values)
+    conn.commit()
+    conn.close()
+    output = str(tmp_path / 'recording.json')
+    record_from_db(db_path, output, reference)
+    return load_recording(output)
+
+
+def test_db_reference_reports_rank_and_action_per_message(db_path, tmp_path):
+    messages, reference = record(db_path, tmp_path, rows=[
+        ("INSERT INTO SIM_RANK VALUES (?, ?, ?)", (1, 10, None)),
+        ("INSERT INTO SIM_SENT_MESS VALUES (?, ?)", (1, 4)),
+    ])
+    assert reference == 'db'
+    assert messages[0]['expected'] == {'rank': 10, 'criteria': None, 'actions': [4]}
+
+    report = run_mode('serial', messages, 1)
+    assert (report['mismatches'], report['rank_mismatches'], report['action_mismatches']) == (1, 1, 1)
+    diff = report['mismatch_examples'][0]
+    assert (diff['expected_rule'], diff['actual_rule']) == ('is_ft_high_risk', 'is_ft_mid_risk')
+    assert (diff['expected_actions'], diff['actual_actions']) == ([4], [])
+
+
+def test_db_reference_matches_sim_rank(db_path, tmp_path):
+    messages, _ = record(db_path, tmp_path, rows=[
+        ("INSERT INTO SIM_RANK VALUES (?, ?, ?)", (1, 6, None)),
+        ("INSERT INTO SIM_SENT_MESS VALUES (?, ?)", (2, 4)),
+    ])
+    assert messages[0]['expected']['actions'] == []
+    for mode in ('serial', 'batch'):
+        assert run_mode(mode, messages, 1)['mismatches'] == 0
+
+
+def test_actions_are_not_compared_without_journal(db_path, tmp_path):
+    messages, _ = record(db_path, tmp_path, rows=[("INSERT INTO SIM_RANK VALUES (?, ?, ?)", (1, 6, None))])
+    assert messages[0]['expected']['actions'] is None
+    assert compare(messages[0]['expected'], {'mess_id': 1, 'rank': 6, 'criteria': None, 'actions': [4]}) is None
+
+
+def test_snapshot_is_taken_from_engine(db_path, tmp_path):
+    messages, reference = record(db_path, tmp_path, 'snapshot')
+    assert reference == 'snapshot'
+    assert messages[0]['expected'] == {'rank': 6, 'criteria': None, 'actions': []}
+    assert run_mode('batch', messages, 1)['mismatches'] == 0
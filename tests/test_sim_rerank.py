@@ -0,0 +1,80 @@
+import pytest
+
+from sim_params import connect
+from sim_rerank import affected_messages, diff_lists, rerank, update_reverse_index
+
+
+@pytest.fixture
+def conn():
+    conn = connect(':memory:')
+    conn.execute("INSERT INTO LIST_ABROAD_RED_1 VALUES ('111')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_first_run_only_seeds_snapshot(conn):
+    assert diff_lists(conn, ['LIST_ABROAD_RED_1']) == {}
+    assert conn.execute("SELECT KEY_TYPE, KEY FROM SIM_LIST_KEYS").fetchall() == [('code', '111')]
+
+
+def test_changes_after_seeding(conn):
+    diff_lists(conn, ['LIST_ABROAD_RED_1'])
+    conn.execute("INSERT INTO LIST_ABROAD_RED_1 VALUES ('222')")
+    conn.execute("DELETE FROM LIST_ABROAD_RED_1 WHERE BIN = '111'")
+    conn.commit()
+    assert diff_lists(conn, ['LIST_ABROAD_RED_1']) == {
+        'LIST_ABROAD_RED_1': ({('code', '222')}, {('code', '111')})}
+    assert diff_lists(conn, ['LIST_ABROAD_RED_1']) == {}
+
+
+def test_list_emptied_and_refilled_is_not_reseeded(conn):
+    diff_lists(conn, ['LIST_ABROAD_RED_1'])
+    conn.execute("DELETE FROM LIST_ABROAD_RED_1")
+    conn.commit()
+    assert diff_lists(conn, ['LIST_ABROAD_RED_1']) == {'LIST_ABROAD_RED_1': (set(), {('code', '111')})}
+    conn.execute("INSERT INTO LIST_ABROAD_RED_1 VALUES ('111')")
+    conn.commit()
+    assert diff_lists(conn, ['LIST_ABROAD_RED_1']) == {'LIST_ABROAD_RED_1': ({('code', '111')}, set())}
+
+
+@pytest.fixture
+def ft_conn():
+    """Сообщение ФТ с КППО 3001 и страной банка 368: средний риск при ИИН плательщика в LIST_FT_ISKL"""
+    conn = connect(':memory:')
+    conn.execute("INSERT INTO EXP_MESSINFO VALUES (1, 1, 4)")
+    conn.execute("INSERT INTO EXP_OPERATION VALUES (1, 'N1', '2024-09-01T10:00:00', 6e7, 0, 311, NULL, 3001, "
+                 "NULL, NULL, NULL, NULL)")
+    conn.execute("INSERT INTO EXP_SUBJ VALUES (1, '123', 11)")
+    conn.execute("INSERT INTO MESS_OFM VALUES (1, '2024-09-02T10:00:00')")
+    conn.execute("INSERT INTO EXP_MEMBERS VALUES (1, 210131, 1, '870101300123', 398, '368', 1, NULL, "
+                 "'Иванов', 'Иван', 'Иванович', NULL, NULL)")
+    conn.execute("INSERT INTO EXP_MEMBERS VALUES (1, 210132, 2, 'R1', 840, '840', 1, NULL, "
+                 "'Петров', 'Петр', 'Петрович', 1, NULL)")
+    conn.commit()
+    update_reverse_index(conn)
+    diff_lists(conn, ['LIST_FT_ISKL'])
+    yield conn
+    conn.close()
+
+
+def rerank_changed_lists(conn):
+    keys = set()
+    for added, removed in diff_lists(conn, ['LIST_FT_ISKL']).values():
+        keys |= added | removed
+    return rerank(conn, affected_messages(conn, keys))
+
+
+def test_rerank_after_list_add_and_removal(ft_conn):
+    ft_conn.execute("INSERT INTO LIST_FT_ISKL VALUES ('870101300123', NULL, NULL, NULL)")
+    ft_conn.commit()
+    assert rerank_changed_lists(ft_conn) == [(1, None, None, 6, None)]
+    assert ft_conn.execute("SELECT MESS_ID, MESS_RANK FROM SIM_RANK").fetchall() == [(1, 6)]
+
+    # Снятие отметки: новый ранг не присваивается, прежний остается в SIM_RANK и попадает в отчет
+    ft_conn.execute("DELETE FROM LIST_FT_ISKL")
+    ft_conn.commit()
+    assert rerank_changed_lists(ft_conn) == [(1, 6, None, None, None)]
+    assert ft_conn.execute("SELECT MESS_ID, MESS_RANK FROM SIM_RANK").fetchall() == [(1, 6)]
+
+    assert rerank_changed_lists(ft_conn) == []
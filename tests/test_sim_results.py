@@ -0,0 +1,38 @@
+import sqlite3
+
+import pytest
+
+from sim_results import SqliteResultsWriter
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.isolation_level = None
+    conn.executescript("""
+        CREATE TABLE SIM_CHECK_MESS (MESS_ID INTEGER PRIMARY KEY, MESS_ADDED TEXT, LEASE_OWNER TEXT, LEASE_UNTIL REAL);
+        CREATE TABLE SIM_RANK (MESS_ID INTEGER PRIMARY KEY, MESS_RANK INTEGER, MESS_CRITERIA TEXT);
+    """)
+    yield conn
+    conn.close()
+
+
+def test_write_skips_messages_with_lost_lease(conn):
+    conn.executemany("INSERT INTO SIM_CHECK_MESS VALUES (?, NULL, ?, ?)",
+                     [(1, 'me', 200.0), (2, 'other', 200.0), (3, 'me', 50.0)])
+    results = [{'mess_id': mess_id, 'rank': 5, 'criteria': 'K1'} for mess_id in (1, 2, 3)]
+
+    saved = SqliteResultsWriter(conn).write(results, [1, 2, 3], owner='me', now=100.0)
+
+    assert saved == {1}
+    assert conn.execute("SELECT MESS_ID FROM SIM_RANK").fetchall() == [(1,)]
+    assert conn.execute("SELECT MESS_ID FROM SIM_CHECK_MESS ORDER BY MESS_ID").fetchall() == [(2,), (3,)]
+
+
+def test_write_without_owner_saves_all(conn):
+    conn.execute("INSERT INTO SIM_CHECK_MESS VALUES (1, NULL, NULL, NULL)")
+    results = [{'mess_id': 1, 'rank': 3, 'criteria': 'K2'}, {'mess_id': 2, 'rank': None, 'criteria': None}]
+
+    assert SqliteResultsWriter(conn).write(results, [1]) == {1, 2}
+    assert conn.execute("SELECT MESS_ID, MESS_RANK FROM SIM_RANK").fetchall() == [(1, 3)]
+    assert conn.execute("SELECT COUNT(*) FROM SIM_CHECK_MESS").fetchone()[0] == 0
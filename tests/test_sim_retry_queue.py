@@ -0,0 +1,81 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from sim_retry_queue import (QUEUE_DDL, RETRY_SETTINGS, backoff_delay, due_batch, enqueue_failed, record_results,
+                             send_with_retry)
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(QUEUE_DDL)
+    yield conn
+    conn.close()
+
+
+def result(mess_id, action, delivered, content='<request/>'):
+    return {"mess_id": mess_id, "action": action, "content": content,
+            "error_code": '0' if delivered else None, "error_text": None if delivered else "Таймаут"}
+
+
+def queue_rows(conn):
+    return conn.execute("SELECT MESS_ID, ACTION, ATTEMPTS, NEXT_ATTEMPT_AT FROM SIM_RETRY_QUEUE "
+                        "ORDER BY MESS_ID, ACTION").fetchall()
+
+
+class FakeNotifier:
+    def __init__(self, delivered):
+        self.delivered = delivered
+
+    async def send_many(self, actions):
+        return [result(mess_id, action, (mess_id, action) in self.delivered) for mess_id, action in actions]
+
+
+@pytest.mark.parametrize('attempts', [1, 3, 10, 30])
+def test_backoff_delay_is_full_jitter(attempts):
+    settings = dict(RETRY_SETTINGS, base_delay=5.0, max_delay=600.0)
+    ceiling = min(600.0, 5.0 * 2 ** attempts)
+    delays = [backoff_delay(attempts, settings) for _ in range(2000)]
+    assert all(0 <= delay <= ceiling for delay in delays)
+    # Полный джиттер: задержки распределены по всему интервалу [0, ceiling]
+    assert min(delays) < ceiling * 0.05
+    assert max(delays) > ceiling * 0.95
+
+
+def test_enqueue_failed_stores_only_failures(conn):
+    assert enqueue_failed(conn, [result(1, 1, False), result(2, 1, True)], now=1000.0) == 1
+    rows = queue_rows(conn)
+    assert [(mess_id, action, attempts) for mess_id, action, attempts, _ in rows] == [(1, 1, 1)]
+    assert 1000.0 <= rows[0][3] <= 1000.0 + 2 * RETRY_SETTINGS["base_delay"]
+
+
+def test_enqueue_failed_revives_dead_row(conn):
+    enqueue_failed(conn, [result(1, 1, False)], now=1000.0)
+    batch = due_batch(conn, 10, now=1e9)
+    settings = dict(RETRY_SETTINGS, max_attempts=2)
+    record_results(conn, batch, [result(1, 1, False)], now=2000.0, settings=settings)
+    assert queue_rows(conn) == [(1, 1, 2, None)]
+
+    enqueue_failed(conn, [result(1, 1, False)], now=3000.0)
+    (_, _, attempts, next_attempt), = queue_rows(conn)
+    assert attempts == 1
+    assert next_attempt is not None and 3000.0 <= next_attempt <= 3000.0 + 2 * RETRY_SETTINGS["base_delay"]
+
+
+def test_enqueue_failed_resets_backoff_of_live_row(conn):
+    enqueue_failed(conn, [result(1, 1, False)], now=1000.0)
+    conn.execute("UPDATE SIM_RETRY_QUEUE SET ATTEMPTS = 7, NEXT_ATTEMPT_AT = 99999.0")
+    enqueue_failed(conn, [result(1, 1, False, content='<new/>')], now=5000.0)
+    (_, _, attempts, next_attempt), = queue_rows(conn)
+    assert attempts == 1
+    assert next_attempt <= 5000.0 + RETRY_SETTINGS["max_delay"] and next_attempt != 99999.0
+    assert conn.execute("SELECT CONTENT FROM SIM_RETRY_QUEUE").fetchone()[0] == '<new/>'
+
+
+def test_send_with_retry_removes_delivered_keys(conn):
+    enqueue_failed(conn, [result(1, 1, False), result(2, 1, False)], now=1000.0)
+    notifier = FakeNotifier(delivered={(1, 1), (3, 1)})
+    asyncio.run(send_with_retry(conn, notifier, [(1, 1), (2, 1), (3, 1)]))
+    assert [(mess_id, action) for mess_id, action, _, _ in queue_rows(conn)] == [(2, 1)]
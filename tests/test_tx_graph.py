@@ -0,0 +1,40 @@
+from tx_graph import FlowGraph, find_chains
+
+HOUR = 3600
+
+
+def transfers(*edges):
+    """tx_data для FlowGraph: (плательщик, получатель, час) -> транзакции tx0, tx1, ..."""
+    return {f'tx{i}': {'tx_seconds': hour * HOUR, 'amount': 100.0,
+                       'payers': [{'id': payer}], 'recipients': [{'id': recipient}]}
+            for i, (payer, recipient, hour) in enumerate(edges)}
+
+
+def chain_ids(graph, chains):
+    return sorted([graph.tx_ids[index] for index in chain] for chain in chains)
+
+
+def test_chain_after_incoming_that_does_not_continue():
+    # B -> A не продолжается в A -> B (B уже в цепочке), поэтому A -> B -> C - самостоятельная цепочка
+    graph = FlowGraph(transfers(('B', 'A', 0), ('A', 'B', 1), ('B', 'C', 2)))
+    assert chain_ids(graph, find_chains(graph)) == [['tx1', 'tx2']]
+
+
+def test_chain_is_not_restarted_from_its_continuation():
+    graph = FlowGraph(transfers(('A', 'B', 0), ('B', 'C', 1), ('C', 'D', 2)))
+    assert chain_ids(graph, find_chains(graph)) == [['tx0', 'tx1', 'tx2']]
+
+
+def test_tail_after_max_depth_starts_new_chain():
+    graph = FlowGraph(transfers(('A', 'B', 0), ('B', 'C', 1), ('C', 'D', 2), ('D', 'E', 3), ('E', 'F', 4)))
+    assert chain_ids(graph, find_chains(graph, max_depth=3)) == [['tx0', 'tx1', 'tx2'], ['tx3', 'tx4']]
+
+
+def test_gap_limit():
+    graph = FlowGraph(transfers(('A', 'B', 0), ('B', 'C', 100)))
+    assert find_chains(graph, max_gap_seconds=72 * HOUR) == []
+
+
+def test_start_order_does_not_depend_on_input_order():
+    graph = FlowGraph(transfers(('B', 'C', 1), ('A', 'B', 0)))
+    assert chain_ids(graph, find_chains(graph)) == [['tx1', 'tx0']]
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from find_related_tx import find_connected_components, parse_transactions
+from tx_entities import resolve_entities
+from tx_index import TxIndex
+
+
+def message(mess_id, payer, recipient, payer_code=None, recipient_code=None, hour=1):
+    return {'row_to_json': {
+        'gmess_id': mess_id, 'goper_trans_date': f'2024-01-01T{hour:02d}:00:00', 'goper_tenge_amount': 1000000.0,
+        'gmember_name_pl1': payer, 'gmember_maincode_pl1': payer_code,
+        'gmember_name_pol1': recipient, 'gmember_maincode_pol1': recipient_code,
+    }}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = TxIndex(str(tmp_path / 'index.db'))
+    yield index
+    index.close()
+
+
+def partition(tx_data):
+    groups = {}
+    for tx_id, tx in tx_data.items():
+        groups.setdefault(tx['component_id'], set()).add(tx_id)
+    return {frozenset(tx_ids) for component_id, tx_ids in groups.items() if component_id is not None}
+
+
+def test_new_edge_merges_stored_components(index):
+    index.append(parse_transactions([message(1, 'ТОО А', 'ТОО Б', '111', '222'),
+                                     message(2, 'ТОО В', 'ТОО Г', '333', '444'),
+                                     message(3, 'ТОО Д', 'ТОО Е', '555', '666')]))
+    assert partition(index.load()) == {frozenset({1}), frozenset({2}), frozenset({3})}
+    assert set(index.load_components([2])) == {2}
+
+    index.append(parse_transactions([message(4, 'ТОО Б', 'ТОО В', '222', '333')]))
+    assert partition(index.load()) == {frozenset({1, 2, 4}), frozenset({3})}
+    loaded = index.load_components([4])
+    assert set(loaded) == {1, 2, 4}
+    assert {tx['component_id'] for tx in loaded.values()} == {index.load([1])[1]['component_id']}
+
+
+def test_new_profile_joins_stored_entity(index):
+    index.append(parse_transactions([message(1, 'ТОО Ромашка', 'ТОО Б', '111', '222')]))
+    new_data = parse_transactions([message(2, 'ТОО "Ромашка"', 'ТОО В', None, '333')])
+    index.append(new_data)
+
+    assert new_data[2]['payers'][0]['entity_id'] == '111'
+    assert index.load([2])[2]['payers'][0]['entity_id'] == '111'
+    assert partition(index.load()) == {frozenset({1, 2})}
+
+
+def test_incremental_index_matches_full_run(index):
+    random.seed(7)
+    names = [f'ТОО Компания {i}' for i in range(30)]
+    codes = {name: (str(100 + i) if i % 3 else None) for i, name in enumerate(names)}
+    messages = []
+    for mess_id in range(1, 201):
+        payer, recipient = random.sample(names, 2)
+        # Часть записей приходит без кода и с вариантом написания наименования
+        payer_code = codes[payer] if random.random() < 0.7 else None
+        messages.append(message(mess_id, payer if random.random() < 0.8 else payer.upper() + '.', recipient,
+                                payer_code, codes[recipient]))
+
+    for start in range(0, len(messages), 50):
+        index.append(parse_transactions(messages[start:start + 50]))
+
+    full = parse_transactions(messages)
+    resolve_entities(full)
+    find_connected_components(full)
+    loaded = index.load()
+    assert partition(loaded) == partition(full)
+    assert [participant.get('entity_id') for tx in loaded.values() for participant in tx['all_participants']] == \
+        [participant['entity_id'] for tx in full.values() for participant in tx['all_participants']]
+
+
+def test_components_are_rebuilt_when_entity_mode_changes(tmp_path):
+    path = str(tmp_path / 'index.db')
+    index = TxIndex(path)
+    index.append(parse_transactions([message(1, 'ТОО Ромашка', 'ТОО Б', '111', '222'),
+                                     message(2, 'ТОО Ромашка', 'ТОО В', None, '333')]))
+    assert partition(index.load()) == {frozenset({1, 2})}
+    index.close()
+
+    index = TxIndex(path, entity_resolution=False)
+    assert partition(index.load()) == {frozenset({1}), frozenset({2})}
+    index.close()
+
+    index = TxIndex(path)
+    assert not index.entity_resolution
+    index.close()
@@ -0,0 +1,26 @@
+import pytest
+
+from tx_rank import RISK_WEIGHT, group_score
+
+
+def tx_data(payer):
+    return {1: {'amount': 0, 'all_participants': [payer, {'name': 'ТОО Б', 'id': '222'}]}}
+
+
+def test_risk_of_entity_applies_to_participant_without_code():
+    data = tx_data({'name': 'ТОО Ромашка', 'id': None, 'entity_id': '111'})
+    group = {'transactions': [{'tx_id': 1}]}
+    assert group_score(group, data, {'111': 3.0}) - group_score(group, data) == pytest.approx(RISK_WEIGHT * 3.0)
+
+
+def test_risk_is_looked_up_by_entity_rather_than_raw_code():
+    # Риск задан по ИИН/БИН сущности, а не по коду записи участника
+    data = tx_data({'name': 'ТОО Ромашка', 'id': '111 ', 'entity_id': '111'})
+    group = {'members': data[1]['all_participants'], 'tx_ids': [1]}
+    assert group_score(group, data, {'111': 1.5}) == pytest.approx(group_score(group, data) + RISK_WEIGHT * 1.5)
+
+
+def test_risk_falls_back_to_code_without_entity_resolution():
+    data = tx_data({'name': 'ТОО Ромашка', 'id': 111})
+    assert group_score([{'tx_id': 1}], data, {'111': 2.0}) == pytest.approx(group_score([{'tx_id': 1}], data)
+                                                                             + RISK_WEIGHT * 2.0)
@@ -0,0 +1,183 @@
+import hashlib
+from difflib import SequenceMatcher
+from itertools import combinations
+
+from sim_names import normalize_name
+from tx_graph import UnionFind
+
+# Разрешение сущностей участников для find_related_tx: участники без ИИН/БИН и варианты написания
+# наименований сводятся к одной сущности. Сравниваются только записи с общим ключом блока
+# (токен наименования или начало наименования + резидентство + страна банка), а не все пары.
+# Записи с разными ИИН/БИН никогда не объединяются; у сущности с ИИН/БИН идентификатор - этот код,
+# у сущности без кода - "~" и хеш наименования, поэтому он не меняется между запусками.
+
+MATCH_THRESHOLD = 0.9   # Наименьшая похожесть наименований для объединения
+MAX_BLOCK_SIZE = 200    # Блоки частых токенов (больше записей) не сравниваются попарно
+PREFIX_LENGTH = 5       # Длина начала наименования (без пробелов) в ключе блока
+
+
+class Profile:
+    """Различная запись участника: (ИИН/БИН, нормализованное наименование, резидентство, страна банка)"""
+
+    __slots__ = ('person_id', 'name', 'raw_name', 'residence', 'bank_country', 'tokens', 'digits', 'compact')
+
+    def __init__(self, person_id, name, raw_name, residence, bank_country):
+        self.person_id = person_id
+        self.name = name
+        self.raw_name = raw_name
+        self.residence = residence
+        self.bank_country = bank_country
+        self.tokens = name.split() if name else []
+        self.digits = frozenset(token for token in self.tokens if token.isdigit())
+        self.compact = ''.join(self.tokens)
+
+    def blocking_keys(self):
+        """Ключи блоков записи: каждый токен наименования и начало наименования вместе с резидентством
+        и страной банка"""
+        if not self.name:
+            return []
+        keys = [('token', token, self.residence, self.bank_country) for token in set(self.tokens)]
+        keys.append(('prefix', self.compact[:PREFIX_LENGTH], self.residence, self.bank_country))
+        return keys
+
+
+def name_similarity(a, b):
+    """Похожесть наименований двух записей (0..1): наибольшая из похожести строк без пробелов
+    и строк с отсортированными токенами; записи с разными числами в наименовании не похожи"""
+    if a.name == b.name:
+        return 1.0
+    if a.digits != b.digits:
+        return 0.0
+    compact = SequenceMatcher(None, a.compact, b.compact).ratio()
+    ordered = SequenceMatcher(None, ' '.join(sorted(a.tokens)), ' '.join(sorted(b.tokens))).ratio()
+    return max(compact, ordered)
+
+
+def _code(value):
+    """Код (ИИН/БИН, страна) строкой: 398, 398.0 и "398" совпадают; пустое значение - None"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip() or None
+
+
+def profile_key(participant):
+    """Ключ различной записи участника: (ИИН/БИН, нормализованное наименование, резидентство, страна банка)"""
+    name = normalize_name(participant.get('name'))
+    return (_code(participant.get('id')), name if name is not None else participant.get('name'),
+            _code(participant.get('residence')), _code(participant.get('bank_country')))
+
+
+def make_profile(key, raw_name):
+    """Запись участника по ключу profile_key"""
+    return Profile(key[0], normalize_name(raw_name), raw_name or '', key[2], key[3])
+
+
+def resolve_entities(tx_data, threshold=MATCH_THRESHOLD, max_block_size=MAX_BLOCK_SIZE):
+    """Проставляет participant['entity_id'] всем участникам транзакций (результат parse_transactions).
+    Возвращает статистику: {'profiles', 'entities', 'resolved'} - число различных записей, сущностей
+    и записей без ИИН/БИН, отнесенных к сущности с ИИН/БИН"""
+    profiles = []
+    profile_index = {}
+    occurrences = []  # (участник, номер записи)
+    for tx in tx_data.values():
+        for participant in tx.get('all_participants', []):
+            key = profile_key(participant)
+            index = profile_index.get(key)
+            if index is None:
+                index = profile_index[key] = len(profiles)
+                profiles.append(make_profile(key, participant.get('name')))
+            occurrences.append((participant, index))
+
+    entity_ids, resolved = match_profiles(profiles, threshold, max_block_size)
+    for participant, index in occurrences:
+        participant['entity_id'] = entity_ids[index]
+
+    return {'profiles': len(profiles), 'entities': len(set(entity_ids)), 'resolved': resolved}
+
+
+def match_profiles(profiles, threshold=MATCH_THRESHOLD, max_block_size=MAX_BLOCK_SIZE, known=None, block_sizes=None):
+    """Идентификаторы сущностей записей (список по номерам записей) и число записей без ИИН/БИН, отнесенных
+    к сущности с ИИН/БИН. Для дописывания к постоянному индексу (tx_index) profiles - новые записи и записи
+    сущностей, с которыми они делят блоки: known - прежние идентификаторы сущностей (None - новая запись),
+    записи одной прежней сущности объединяются заранее и не разделяются; block_sizes - размеры блоков
+    по всем записям индекса"""
+    # Записи с одним ИИН/БИН - одна сущность
+    entities = UnionFind(len(profiles))
+    codes = {}  # корень -> ИИН/БИН сущности
+    first_by_id = {}
+    for index, profile in enumerate(profiles):
+        if profile.person_id is None:
+            continue
+        first = first_by_id.setdefault(profile.person_id, index)
+        entities.union(first, index)
+    first_by_known = {}
+    for index, entity_id in enumerate(known or []):
+        if entity_id is not None:
+            entities.union(first_by_known.setdefault(entity_id, index), index)
+    for person_id, index in first_by_id.items():
+        codes[entities.find(index)] = person_id
+    for entity_id, index in first_by_known.items():
+        if not entity_id.startswith('~'):
+            codes[entities.find(index)] = entity_id
+
+    # Кандидаты - пары внутри блоков; пары двух записей с ИИН/БИН решаются по коду
+    blocks = {}
+    for index, profile in enumerate(profiles):
+        for key in profile.blocking_keys():
+            blocks.setdefault(key, []).append(index)
+    candidates = {}
+    for key, members in blocks.items():
+        size = block_sizes.get(key, len(members)) if block_sizes is not None else len(members)
+        if len(members) < 2 or size > max_block_size:
+            continue
+        for a, b in combinations(members, 2):
+            if (a, b) in candidates or (profiles[a].person_id is not None and profiles[b].person_id is not None):
+                continue
+            candidates[(a, b)] = name_similarity(profiles[a], profiles[b])
+
+    # Запись без кода, одинаково похожая на записи с разными ИИН/БИН, к ним не относится
+    best = {}  # запись без кода -> (наибольшая похожесть на запись с кодом, коды с этой похожестью)
+    for (a, b), score in candidates.items():
+        if score < threshold:
+            continue
+        for item, other in ((a, b), (b, a)):
+            if profiles[item].person_id is None and profiles[other].person_id is not None:
+                best_score, best_codes = best.get(item, (score, set()))
+                if score > best_score:
+                    best_score, best_codes = score, set()
+                if score == best_score:
+                    best_codes.add(profiles[other].person_id)
+                best[item] = (best_score, best_codes)
+    ambiguous = {item for item, (_, best_codes) in best.items() if len(best_codes) > 1}
+
+    # Объединение от самых похожих пар; сущности с разными ИИН/БИН не сливаются
+    for (a, b), score in sorted(candidates.items(), key=lambda item: (-item[1], item[0])):
+        if score < threshold:
+            break
+        if (a in ambiguous and profiles[b].person_id is not None) or (b in ambiguous and profiles[a].person_id is not None):
+            continue
+        root_a, root_b = entities.find(a), entities.find(b)
+        if root_a == root_b:
+            continue
+        code_a, code_b = codes.get(root_a), codes.get(root_b)
+        if code_a is not None and code_b is not None and code_a != code_b:
+            continue
+        entities.union(a, b)
+        codes[entities.find(a)] = code_a if code_a is not None else code_b
+
+    # Идентификатор сущности без кода - хеш наименьшего из наименований ее записей (не зависит от порядка)
+    labels = entities.labels()
+    sources = {}
+    for index, root in enumerate(labels):
+        if codes.get(root) is None:
+            profile = profiles[index]
+            source = '|'.join((profile.name or profile.raw_name, profile.residence or '', profile.bank_country or ''))
+            sources[root] = min(sources.get(root, source), source)
+    entity_ids = {root: '~' + hashlib.sha1(source.encode('utf-8')).hexdigest()[:12] for root, source in sources.items()}
+    entity_ids.update((root, code) for root, code in codes.items() if entities.find(root) == root)
+    resolved = sum(1 for index, profile in enumerate(profiles)
+                   if profile.person_id is None and codes.get(labels[index]) is not None)
+
+    return [entity_ids[root] for root in labels], resolved
@@ -0,0 +1,490 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+# Граф денежных потоков между участниками для find_related_tx: участники кодируются целыми числами,
+# ребра (плательщик -> получатель) хранятся в формате CSR, внутри каждого узла отсортированы по времени.
+
+# Режимы группировки по времени: gap - соседние транзакции не дальше окна (группа может растянуться),
+# sliding - все транзакции группы укладываются в окно фиксированной ширины от первой
+WINDOW_MODES = ('gap', 'sliding')
+
+
+def participant_key(participant):
+    """Ключ участника в графе и индексах: сущность (tx_entities.resolve_entities), а без разрешения сущностей -
+    maincode; None - участник не учитывается"""
+    return participant.get('entity_id') or participant.get('id')
+
+
+class ParticipantEncoder:
+    """Словарное кодирование участников: ключ участника (participant_key) -> целочисленный код"""
+
+    def __init__(self):
+        self.codes = {}
+        self.participants = []  # Код -> первый встреченный словарь участника {"name", "id"}
+
+    def encode(self, participant):
+        """Возвращает код участника (добавляет нового)"""
+        person_id = participant_key(participant)
+        code = self.codes.get(person_id)
+        if code is None:
+            code = len(self.participants)
+            self.codes[person_id] = code
+            self.participants.append(participant)
+        return code
+
+    def __len__(self):
+        return len(self.participants)
+
+
+class CSR:
+    """Ребра, сгруппированные по узлу и отсортированные по времени внутри узла"""
+
+    def __init__(self, node, other, times, edge_ids, node_count):
+        order = np.lexsort((times, node))
+        self.indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(node, minlength=node_count), out=self.indptr[1:])
+        self.other = other[order]
+        self.times = times[order]
+        self.edge_ids = edge_ids[order]
+        # Списки для точечных бинарных поисков из Python (bisect быстрее searchsorted на одиночных значениях)
+        self.other_list = self.other.tolist()
+        self.times_list = self.times.tolist()
+        self.edge_list = self.edge_ids.tolist()
+
+    def window(self, node, start, end, include_start=False):
+        """Диапазон позиций ребер узла со временем в (start, end] (или [start, end])"""
+        lo, hi = int(self.indptr[node]), int(self.indptr[node + 1])
+        find = bisect_left if include_start else bisect_right
+        return find(self.times_list, start, lo, hi), bisect_right(self.times_list, end, lo, hi)
+
+
+class FlowGraph:
+    """Граф потоков: ребро на каждую пару (плательщик, получатель) транзакции с известным временем"""
+
+    def __init__(self, tx_data):
+        self.encoder = ParticipantEncoder()
+        self.tx_ids = []
+        src, dst, times, amounts, tx_index = [], [], [], [], []
+
+        for tx_id, tx in tx_data.items():
+            seconds = tx.get('tx_seconds')
+            if seconds is None:
+                continue
+            payers = [self.encoder.encode(p) for p in tx.get('payers', []) if participant_key(p)]
+            recipients = [self.encoder.encode(r) for r in tx.get('recipients', []) if participant_key(r)]
+            if not payers or not recipients:
+                continue
+            index = len(self.tx_ids)
+            self.tx_ids.append(tx_id)
+            amount = tx.get('amount') or 0.0
+            for payer in payers:
+                for recipient in recipients:
+                    if payer == recipient:
+                        continue
+                    src.append(payer)
+                    dst.append(recipient)
+                    times.append(seconds)
+                    amounts.append(amount)
+                    tx_index.append(index)
+
+        self.src = np.array(src, dtype=np.int64)
+        self.dst = np.array(dst, dtype=np.int64)
+        self.times = np.array(times, dtype=np.int64)
+        self.amounts = np.array(amounts, dtype=np.float64)
+        self.tx_index = np.array(tx_index, dtype=np.int64)
+        self.node_count = len(self.encoder)
+        self.edge_count = len(self.src)
+
+        edge_ids = np.arange(self.edge_count, dtype=np.int64)
+        self.out_edges = CSR(self.src, self.dst, self.times, edge_ids, self.node_count)
+        self.in_edges = CSR(self.dst, self.src, self.times, edge_ids, self.node_count)
+        self.tx_index_list = self.tx_index.tolist()
+
+
+def find_chains(graph, max_depth=6, max_gap_seconds=72 * 3600, min_length=2, max_chains=100000, start_edges=None):
+    """Многозвенные цепочки A -> B -> C -> ...: каждое следующее звено платит получатель предыдущего
+    в пределах max_gap_seconds после него. Начальные ребра перебираются по времени; ребро, до которого
+    дошел обход из более ранней цепочки, новую цепочку не начинает, остальные (в том числе продолжения
+    цепочек, оборванных на max_depth звеньях) - начинают. Цепочка продолжается, пока есть продолжение.
+    start_edges - начальные ребра для проверки (по умолчанию все); отметки пройденных ребер действуют только
+    внутри одного вызова, поэтому поиск не разбивается между процессами.
+    Возвращает списки индексов транзакций (graph.tx_ids), не больше max_chains"""
+    out_edges = graph.out_edges
+    times = out_edges.times_list
+    others = out_edges.other_list
+    edges = out_edges.edge_list
+    src_list = graph.src.tolist()
+    dst_list = graph.dst.tolist()
+    edge_times = graph.times.tolist()
+    tx_index = graph.tx_index_list
+    chains = []
+    seen = set()
+    reached = bytearray(graph.edge_count)  # Ребра, до которых дошел обход из более ранних цепочек
+
+    if start_edges is None:
+        start_order = np.argsort(graph.times, kind='stable').tolist()
+    else:
+        start_order = sorted(start_edges, key=lambda e: (edge_times[e], e))
+    for start in start_order:
+        if len(chains) >= max_chains:
+            break
+        if reached[start]:
+            continue  # Ребро продолжает более раннюю цепочку
+
+        # Итеративный обход в глубину: (последнее ребро, путь из ребер, посещенные участники)
+        stack = [(start, [start], {src_list[start], dst_list[start]})]
+        while stack and len(chains) < max_chains:
+            edge, path, nodes = stack.pop()
+            extended = False
+            if len(path) < max_depth:
+                node = dst_list[edge]
+                t = edge_times[edge]
+                lo, hi = out_edges.window(node, t, t + max_gap_seconds)
+                for pos in range(hi - 1, lo - 1, -1):
+                    next_node = others[pos]
+                    next_edge = edges[pos]
+                    if next_node in nodes or tx_index[next_edge] == tx_index[edge]:
+                        continue
+                    stack.append((next_edge, path + [next_edge], nodes | {next_node}))
+                    reached[next_edge] = 1
+                    extended = True
+            if not extended and len(path) >= min_length:
+                chain = tuple(tx_index[e] for e in path)
+                if chain not in seen:
+                    seen.add(chain)
+                    chains.append(list(chain))
+    return chains
+
+
+def onward_pairs(graph, max_delay_seconds, min_amount_ratio=None, max_amount_ratio=None):
+    """Пары (поступление, дальнейший перевод) через одного участника: B получил в момент t и заплатил
+    в момент t' при t < t' <= t + max_delay_seconds. Соединение векторизовано: входящие и исходящие ребра
+    отсортированы по (участник, время), границы окна для всех поступлений находятся одним searchsorted.
+    Возвращает массивы (участник, входящее ребро, исходящее ребро) без повторов по транзакциям"""
+    empty = np.array([], dtype=np.int64)
+    if graph.edge_count == 0:
+        return empty, empty, empty
+
+    in_csr = graph.in_edges
+    out_csr = graph.out_edges
+    nodes = np.arange(graph.node_count, dtype=np.int64)
+    in_nodes = np.repeat(nodes, np.diff(in_csr.indptr))
+    out_nodes = np.repeat(nodes, np.diff(out_csr.indptr))
+
+    # Составной ключ участник * span + время: окно поступления не выходит за пределы своего участника
+    t_min = int(graph.times.min())
+    span = int(graph.times.max()) - t_min + max_delay_seconds + 1
+    out_keys = out_nodes * span + (out_csr.times - t_min)
+    in_keys = in_nodes * span + (in_csr.times - t_min)
+    lo = np.searchsorted(out_keys, in_keys, side='right')
+    hi = np.searchsorted(out_keys, in_keys + max_delay_seconds, side='right')
+
+    counts = hi - lo
+    total = int(counts.sum())
+    if total == 0:
+        return empty, empty, empty
+    in_pos = np.repeat(np.arange(len(in_keys), dtype=np.int64), counts)
+    out_pos = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts - lo, counts)
+
+    in_edge = in_csr.edge_ids[in_pos]
+    out_edge = out_csr.edge_ids[out_pos]
+    node = in_nodes[in_pos]
+    keep = graph.tx_index[in_edge] != graph.tx_index[out_edge]
+    if min_amount_ratio is not None or max_amount_ratio is not None:
+        in_amount = graph.amounts[in_edge]
+        ratio = np.divide(graph.amounts[out_edge], in_amount, out=np.full(len(in_amount), np.nan),
+                          where=in_amount > 0)
+        if min_amount_ratio is not None:
+            keep &= ratio >= min_amount_ratio
+        if max_amount_ratio is not None:
+            keep &= ratio <= max_amount_ratio
+    node, in_edge, out_edge = node[keep], in_edge[keep], out_edge[keep]
+
+    # Транзакция с несколькими плательщиками/получателями дает несколько ребер: оставляем одну пару транзакций
+    triples = np.stack([node, graph.tx_index[in_edge], graph.tx_index[out_edge]], axis=1)
+    _, first = np.unique(triples, axis=0, return_index=True)
+    first.sort()
+    return node[first], in_edge[first], out_edge[first]
+
+
+def time_window_groups(seconds, window_seconds, mode='gap', keys=None, min_size=2):
+    """Группы транзакций, близких по времени, в массиве, отсортированном по (keys, seconds).
+    keys - необязательный номер независимой серии (например, участника): группы не пересекают его границы.
+    В режиме sliding возвращаются максимальные окна [t, t + window_seconds], окна могут пересекаться.
+    Возвращает массивы (начало, конец) срезов групп размером не меньше min_size"""
+    seconds = np.asarray(seconds, dtype=np.int64)
+    count = len(seconds)
+    empty = np.array([], dtype=np.int64)
+    if count == 0:
+        return empty, empty
+    if mode not in WINDOW_MODES:
+        raise ValueError(f"Неизвестный режим группировки: {mode}")
+
+    if mode == 'gap':
+        breaks = np.diff(seconds) > window_seconds
+        if keys is not None:
+            breaks |= np.diff(np.asarray(keys, dtype=np.int64)) != 0
+        starts = np.flatnonzero(np.concatenate(([True], breaks)))
+        ends = np.append(starts[1:], count)
+    else:
+        # Составной ключ серия * span + время: окно не выходит за пределы своей серии
+        t_min = int(seconds.min())
+        span = int(seconds.max()) - t_min + window_seconds + 1
+        composite = seconds - t_min
+        if keys is not None:
+            composite = composite + np.asarray(keys, dtype=np.int64) * span
+        starts = np.arange(count, dtype=np.int64)
+        ends = np.searchsorted(composite, composite + window_seconds, side='right')
+        # Окно максимально, если оно заканчивается дальше предыдущего
+        maximal = np.concatenate(([True], ends[1:] > ends[:-1]))
+        starts, ends = starts[maximal], ends[maximal]
+
+    keep = ends - starts >= min_size
+    return starts[keep], ends[keep]
+
+
+class UnionFind:
+    """Система непересекающихся множеств над элементами 0..n-1 (сжатие путей делением пополам)"""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # Корень - меньший номер, чтобы номер компоненты не зависел от порядка пар
+            if root_a < root_b:
+                self.parent[root_b] = root_a
+            else:
+                self.parent[root_a] = root_b
+
+    def union_pairs(self, a, b):
+        """Объединяет пары (a[k], b[k])"""
+        for item_a, item_b in zip(a, b):
+            self.union(item_a, item_b)
+
+    def labels(self):
+        """Номер компоненты (наименьший элемент) для каждого элемента"""
+        return [self.find(item) for item in range(len(self.parent))]
+
+
+def band_pairs(values, seconds, width, window_seconds):
+    """Пары (i, j), i < j, со значениями, отличающимися не более чем на width, и временем - не более чем
+    на window_seconds. Значения раскладываются по ячейкам ширины width: пара может лежать только в одной
+    или в соседних ячейках, поэтому для каждого элемента просматривается окно времени в своей и следующей
+    ячейке (массив отсортирован по (ячейка, время)). Число проверок пропорционально числу кандидатов,
+    а не квадрату числа элементов"""
+    values = np.asarray(values, dtype=np.float64)
+    seconds = np.asarray(seconds, dtype=np.int64)
+    empty = np.array([], dtype=np.int64)
+    if len(values) < 2:
+        return empty, empty
+
+    # Ячейки нумеруются подряд (плотно), чтобы ключ ячейка * span не переполнялся; соседняя по номеру,
+    # но не смежная ячейка дает лишних кандидатов, которые отсекает проверка значений
+    raw_cells = np.floor((values - values.min()) / width) if width > 0 else values
+    _, cells = np.unique(raw_cells, return_inverse=True)
+    cells = cells.astype(np.int64).ravel()
+    neighbours = (0, 1) if width > 0 else (0,)
+
+    t_min = int(seconds.min())
+    span = int(seconds.max()) - t_min + 2 * window_seconds + 1
+    keys = cells * span + (seconds - t_min + window_seconds)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+
+    pairs_a, pairs_b = [], []
+    for shift in neighbours:
+        if shift == 0:
+            # Своя ячейка: элементы после текущего в пределах окна
+            lo = np.arange(1, len(keys) + 1, dtype=np.int64)
+            hi = np.searchsorted(keys, keys + window_seconds, side='right')
+        else:
+            # Следующая ячейка: окно [t - window, t + window]
+            lo = np.searchsorted(keys, keys + span - window_seconds, side='left')
+            hi = np.searchsorted(keys, keys + span + window_seconds, side='right')
+        counts = np.maximum(hi - lo, 0)
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        first = np.repeat(np.arange(len(keys), dtype=np.int64), counts)
+        second = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts - lo, counts)
+        a, b = order[first], order[second]
+        keep = np.abs(values[a] - values[b]) <= width * (1 + 1e-12)
+        pairs_a.append(np.minimum(a[keep], b[keep]))
+        pairs_b.append(np.maximum(a[keep], b[keep]))
+
+    if not pairs_a:
+        return empty, empty
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+
+def strongly_connected_components(graph):
+    """Номера компонент сильной связности участников (итеративный алгоритм Тарьяна по out_edges, без учета
+    времени). Возвращает массив node -> номер компоненты и размеры компонент"""
+    indptr = graph.out_edges.indptr.tolist()
+    others = graph.out_edges.other_list
+    count = graph.node_count
+    index = [-1] * count
+    lowlink = [0] * count
+    on_stack = [False] * count
+    labels = [-1] * count
+    sizes = []
+    stack = []
+    next_index = 0
+
+    for root in range(count):
+        if index[root] != -1:
+            continue
+        # Стек обхода: (узел, позиция следующего ребра)
+        work = [(root, indptr[root])]
+        index[root] = lowlink[root] = next_index
+        next_index += 1
+        stack.append(root)
+        on_stack[root] = True
+        while work:
+            node, pos = work[-1]
+            if pos < indptr[node + 1]:
+                work[-1] = (node, pos + 1)
+                other = others[pos]
+                if index[other] == -1:
+                    index[other] = lowlink[other] = next_index
+                    next_index += 1
+                    stack.append(other)
+                    on_stack[other] = True
+                    work.append((other, indptr[other]))
+                elif on_stack[other] and index[other] < lowlink[node]:
+                    lowlink[node] = index[other]
+                continue
+            work.pop()
+            if work and lowlink[node] < lowlink[work[-1][0]]:
+                lowlink[work[-1][0]] = lowlink[node]
+            if lowlink[node] == index[node]:
+                label = len(sizes)
+                size = 0
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    labels[member] = label
+                    size += 1
+                    if member == node:
+                        break
+                sizes.append(size)
+    return np.array(labels, dtype=np.int64), np.array(sizes, dtype=np.int64)
+
+
+def find_cycles(graph, max_length=6, window_seconds=7 * 24 * 3600, max_cycles=100000, start_edges=None):
+    """Циклы A -> B -> ... -> A: каждое звено позже предыдущего, весь цикл укладывается в window_seconds
+    от первого звена, длина не больше max_length, участники (кроме A) не повторяются.
+    Обход идет только по ребрам внутри нетривиальных компонент сильной связности: вне их цикла быть не может.
+    Цикл начинается со своего самого раннего звена, поэтому каждый цикл находится один раз.
+    start_edges - начальные ребра в порядке out_edges.edge_list (по умолчанию все).
+    Возвращает списки индексов транзакций (graph.tx_ids), не больше max_cycles"""
+    labels, sizes = strongly_connected_components(graph)
+    out_edges = graph.out_edges
+    others = out_edges.other_list
+    edges = out_edges.edge_list
+    src_list = graph.src.tolist()
+    dst_list = graph.dst.tolist()
+    edge_times = graph.times.tolist()
+    tx_index = graph.tx_index_list
+    label_list = labels.tolist()
+    cyclic = (sizes[labels] > 1).tolist()
+    cycles = []
+    seen = set()
+    distance_origin, distance = None, {}
+
+    # Ребра перебираются по плательщику (out_edges), чтобы расстояния до него считались один раз
+    for start in edges if start_edges is None else start_edges:
+        if len(cycles) >= max_cycles:
+            break
+        origin = src_list[start]
+        if not cyclic[origin] or label_list[origin] != label_list[dst_list[start]]:
+            continue
+        if origin != distance_origin:
+            distance_origin = origin
+            distance = _hops_to(graph, origin, max_length - 1)
+        if distance.get(dst_list[start], max_length) > max_length - 1:
+            continue
+        deadline = edge_times[start] + window_seconds
+
+        stack = [(start, [start], {origin, dst_list[start]})]
+        while stack and len(cycles) < max_cycles:
+            edge, path, nodes = stack.pop()
+            # Оставшиеся звенья после следующего: узел, из которого A не достижим за них, не продолжаем
+            remaining = max_length - len(path) - 1
+            lo, hi = out_edges.window(dst_list[edge], edge_times[edge], deadline)
+            for pos in range(hi - 1, lo - 1, -1):
+                next_node = others[pos]
+                next_edge = edges[pos]
+                if next_node == origin:
+                    cycle = tuple(tx_index[e] for e in path) + (tx_index[next_edge],)
+                    if cycle not in seen:
+                        seen.add(cycle)
+                        cycles.append(list(cycle))
+                elif next_node not in nodes and distance.get(next_node, max_length) <= remaining:
+                    stack.append((next_edge, path + [next_edge], nodes | {next_node}))
+    return cycles
+
+
+def _hops_to(graph, target, max_hops):
+    """Наименьшее число звеньев от участников до target (обратный обход в ширину по ребрам, без учета
+    времени, не дальше max_hops): {участник: число звеньев}"""
+    distance = np.full(graph.node_count, max_hops + 1, dtype=np.int64)
+    distance[target] = 0
+    frontier = np.zeros(graph.node_count, dtype=bool)
+    frontier[target] = True
+    for hops in range(1, max_hops + 1):
+        reached = np.zeros(graph.node_count, dtype=bool)
+        reached[graph.src[frontier[graph.dst]]] = True
+        reached &= distance > max_hops
+        if not reached.any():
+            break
+        distance[reached] = hops
+        frontier = reached
+    return dict(zip(np.flatnonzero(distance <= max_hops).tolist(), distance[distance <= max_hops].tolist()))
+
+
+def fan_hubs(graph, bucket_seconds, min_counterparties, direction='in'):
+    """Участники с большим числом различных контрагентов за интервал времени: direction='in' - много
+    плательщиков одного получателя (сбор средств), 'out' - один плательщик многим получателям (раздача).
+    Разреженная матрица участник x интервал хранится в формате COO: ключ ячейки участник * число интервалов
+    + интервал; различные контрагенты ячейки считаются одной сортировкой всех ребер.
+    Возвращает список (участник, начало интервала в секундах, число контрагентов, массив ребер)"""
+    if graph.edge_count == 0:
+        return []
+    node, other = (graph.dst, graph.src) if direction == 'in' else (graph.src, graph.dst)
+
+    # Интервалы выровнены по началу суток (от 1970-01-01)
+    buckets = graph.times // bucket_seconds
+    first_bucket = int(buckets.min())
+    bucket_count = int(buckets.max()) - first_bucket + 1
+    cells = node * bucket_count + (buckets - first_bucket)
+
+    # Сортировка по (ячейка, контрагент): различные пары - где меняется ячейка или контрагент
+    order = np.lexsort((other, cells))
+    sorted_cells = cells[order]
+    sorted_other = other[order]
+    distinct = np.concatenate(([True], (sorted_cells[1:] != sorted_cells[:-1]) | (sorted_other[1:] != sorted_other[:-1])))
+    hub_cells, degrees = np.unique(sorted_cells[distinct], return_counts=True)
+    hub = degrees >= min_counterparties
+    hub_cells, degrees = hub_cells[hub], degrees[hub]
+    if len(hub_cells) == 0:
+        return []
+
+    # Ребра ячеек-концентраторов: отрезки отсортированного массива
+    starts = np.searchsorted(sorted_cells, hub_cells, side='left')
+    ends = np.searchsorted(sorted_cells, hub_cells, side='right')
+    result = []
+    for cell, degree, start, end in zip(hub_cells.tolist(), degrees.tolist(), starts.tolist(), ends.tolist()):
+        hub_node, bucket = divmod(cell, bucket_count)
+        result.append((hub_node, (bucket + first_bucket) * bucket_seconds, degree, order[start:end]))
+    return result
@@ -0,0 +1,430 @@
+import json
+import sqlite3
+
+from tx_entities import MATCH_THRESHOLD, MAX_BLOCK_SIZE, make_profile, match_profiles, profile_key
+from tx_graph import participant_key
+from tx_time import from_epoch_seconds
+
+# Постоянный индекс транзакций для find_related_tx: новые сообщения дописываются в SQLite, поиск связей
+# повторяется только для участников и сумм, затронутых новой порцией, а не по всей истории.
+# TX_INDEX - транзакции (участники хранятся в JSON), TX_PARTICIPANT - участник -> транзакции по ролям,
+# TX_EDGE - переводы плательщик -> получатель с индексами (участник, время) для запросов окрестностей
+# (tx_neighbors), TX_PERSON - наименования участников, TX_META - версия данных и признаки схемы.
+# Сущности и связные компоненты тоже хранятся в индексе и дописываются только по новым транзакциям:
+# TX_PROFILE - различные записи участников (tx_entities) с идентификатором сущности, TX_BLOCK - ключи блоков
+# записей для поиска кандидатов, TX_NODE - система непересекающихся множеств над ключами участников
+# (participant_key), TX_INDEX.COMPONENT - номер компоненты транзакции (корень множества).
+
+TX_INDEX_DDL = """
+CREATE TABLE IF NOT EXISTS TX_INDEX (
+    TX_ID INTEGER PRIMARY KEY,
+    AMOUNT REAL,
+    TX_TIME_STR TEXT,
+    TX_SECONDS INTEGER,
+    PAYERS TEXT NOT NULL,
+    RECIPIENTS TEXT NOT NULL,
+    COMPONENT INTEGER
+);
+CREATE INDEX IF NOT EXISTS TX_INDEX_AMOUNT ON TX_INDEX (AMOUNT, TX_SECONDS);
+CREATE INDEX IF NOT EXISTS TX_INDEX_TIME ON TX_INDEX (TX_SECONDS);
+CREATE TABLE IF NOT EXISTS TX_PARTICIPANT (
+    PERSON_ID TEXT NOT NULL,
+    ROLE TEXT NOT NULL,
+    TX_ID INTEGER NOT NULL,
+    PRIMARY KEY (PERSON_ID, ROLE, TX_ID)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS TX_EDGE (
+    SRC TEXT NOT NULL,
+    DST TEXT NOT NULL,
+    TX_SECONDS INTEGER,
+    AMOUNT REAL,
+    TX_ID INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS TX_EDGE_SRC ON TX_EDGE (SRC, TX_SECONDS, AMOUNT, DST, TX_ID);
+CREATE INDEX IF NOT EXISTS TX_EDGE_DST ON TX_EDGE (DST, TX_SECONDS, AMOUNT, SRC, TX_ID);
+CREATE TABLE IF NOT EXISTS TX_PERSON (
+    PERSON_ID TEXT PRIMARY KEY,
+    NAME TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS TX_PROFILE (
+    PROFILE_KEY TEXT PRIMARY KEY,
+    RAW_NAME TEXT,
+    ENTITY_ID TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS TX_PROFILE_ENTITY ON TX_PROFILE (ENTITY_ID);
+CREATE TABLE IF NOT EXISTS TX_BLOCK (
+    BLOCK_KEY TEXT NOT NULL,
+    PROFILE_KEY TEXT NOT NULL,
+    PRIMARY KEY (BLOCK_KEY, PROFILE_KEY)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS TX_NODE (
+    NODE TEXT PRIMARY KEY,
+    NODE_ID INTEGER NOT NULL UNIQUE,
+    PARENT INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS TX_META (
+    KEY TEXT PRIMARY KEY,
+    VALUE INTEGER
+) WITHOUT ROWID;
+"""
+
+ROLES = (('payer', 'payers'), ('recipient', 'recipients'))
+
+
+def _dump_key(key):
+    """Ключ записи участника или блока строкой для SQLite"""
+    return json.dumps(key, ensure_ascii=False)
+
+
+class StoredUnionFind:
+    """Система непересекающихся множеств над ключами участников в TX_NODE. Родители читаются по мере обращения
+    и записываются в save(); корень - меньший NODE_ID, как в tx_graph.UnionFind, поэтому номер компоненты
+    при слиянии переходит к более старой компоненте"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.node_ids = {}  # ключ участника -> NODE_ID
+        self.parent = {}
+        self.new_nodes = {}  # NODE_ID -> ключ участника, еще не записанного в TX_NODE
+        self.changed = set()
+        self.merged = []  # корни, присоединенные к другим компонентам
+        self.next_id = (conn.execute("SELECT MAX(NODE_ID) FROM TX_NODE").fetchone()[0] or 0) + 1
+
+    def node(self, key, create=True):
+        """NODE_ID участника (новый участник добавляется, если create); None - участника нет"""
+        node_id = self.node_ids.get(key)
+        if node_id is not None:
+            return node_id
+        row = self.conn.execute("SELECT NODE_ID, PARENT FROM TX_NODE WHERE NODE = ?", (key,)).fetchone()
+        if row is not None:
+            node_id, parent = row
+            self.parent.setdefault(node_id, parent)
+        elif create:
+            node_id = self.next_id
+            self.next_id += 1
+            self.parent[node_id] = node_id
+            self.new_nodes[node_id] = key
+        else:
+            return None
+        self.node_ids[key] = node_id
+        return node_id
+
+    def _parent(self, node_id):
+        parent = self.parent.get(node_id)
+        if parent is None:
+            parent = self.parent[node_id] = self.conn.execute(
+                "SELECT PARENT FROM TX_NODE WHERE NODE_ID = ?", (node_id,)).fetchone()[0]
+        return parent
+
+    def find(self, node_id):
+        path = []
+        parent = self._parent(node_id)
+        while parent != node_id:
+            path.append(node_id)
+            node_id = parent
+            parent = self._parent(node_id)
+        for item in path:
+            if self.parent[item] != node_id:
+                self.parent[item] = node_id
+                self.changed.add(item)
+        return node_id
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            root, other = min(root_a, root_b), max(root_a, root_b)
+            self.parent[other] = root
+            self.changed.add(other)
+            self.merged.append(other)
+
+    def save(self):
+        """Записывает новых участников и измененных родителей, переносит транзакции присоединенных компонент"""
+        self.conn.executemany("INSERT INTO TX_NODE (NODE, NODE_ID, PARENT) VALUES (?, ?, ?)",
+                              [(key, node_id, self.parent[node_id]) for node_id, key in self.new_nodes.items()])
+        self.conn.executemany("UPDATE TX_NODE SET PARENT = ? WHERE NODE_ID = ?",
+                              [(self.parent[node_id], node_id) for node_id in self.changed
+                               if node_id not in self.new_nodes])
+        self.conn.executemany("UPDATE TX_INDEX SET COMPONENT = ? WHERE COMPONENT = ?",
+                              [(self.find(other), other) for other in self.merged])
+        self.new_nodes = {}
+        self.changed = set()
+        self.merged = []
+
+
+class TxIndex:
+    """Транзакции, индекс участников, сущности и связные компоненты в базе SQLite.
+    entity_resolution - компоненты строятся по сущностям (tx_entities) или по maincode; None - как в уже
+    построенном индексе (для нового индекса - по сущностям). При смене режима компоненты строятся заново"""
+
+    def __init__(self, db_path, entity_resolution=None):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(TX_INDEX_DDL)
+        if self._meta('edges') is None:
+            self._build_edges()
+        # Режим, в котором построены компоненты: 1 - по сущностям, 0 - по maincode, None - не построены
+        built = self._meta('components')
+        if entity_resolution is None:
+            entity_resolution = built != 0
+        self.entity_resolution = entity_resolution
+        if built != int(entity_resolution):
+            self._build_components()
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM TX_INDEX").fetchone()[0]
+
+    def _meta(self, key):
+        row = self.conn.execute("SELECT VALUE FROM TX_META WHERE KEY = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO TX_META (KEY, VALUE) VALUES (?, ?)", (key, value))
+
+    def version(self):
+        """Версия данных: увеличивается при каждом добавлении новых транзакций"""
+        return self._meta('version') or 0
+
+    def _add_edges(self, tx_id, amount, tx_seconds, payers, recipients):
+        """Переводы плательщик -> получатель транзакции и наименования участников"""
+        for participant in payers + recipients:
+            if participant.get('id'):
+                self.conn.execute("INSERT OR IGNORE INTO TX_PERSON (PERSON_ID, NAME) VALUES (?, ?)",
+                                  (str(participant['id']), participant.get('name')))
+        self.conn.executemany(
+            "INSERT INTO TX_EDGE (SRC, DST, TX_SECONDS, AMOUNT, TX_ID) VALUES (?, ?, ?, ?, ?)",
+            [(str(payer['id']), str(recipient['id']), tx_seconds, amount, tx_id)
+             for payer in payers if payer.get('id') for recipient in recipients if recipient.get('id')])
+
+    def _build_edges(self):
+        """Заполняет TX_EDGE и TX_PERSON по уже сохраненным транзакциям (индекс, созданный до их появления)"""
+        with self.conn:
+            self.conn.execute("DELETE FROM TX_EDGE")
+            rows = self.conn.execute("SELECT TX_ID, AMOUNT, TX_SECONDS, PAYERS, RECIPIENTS FROM TX_INDEX").fetchall()
+            for tx_id, amount, tx_seconds, payers, recipients in rows:
+                self._add_edges(tx_id, amount, tx_seconds, json.loads(payers), json.loads(recipients))
+            self._set_meta('edges', 1)
+
+    def _build_components(self):
+        """Строит сущности и связные компоненты по всем сохраненным транзакциям (индекс, созданный до их
+        появления, или смена режима разрешения сущностей)"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(TX_INDEX)")}
+        with self.conn:
+            if 'COMPONENT' not in columns:
+                self.conn.execute("ALTER TABLE TX_INDEX ADD COLUMN COMPONENT INTEGER")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS TX_INDEX_COMPONENT ON TX_INDEX (COMPONENT)")
+            for table in ('TX_PROFILE', 'TX_BLOCK', 'TX_NODE'):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute("UPDATE TX_INDEX SET COMPONENT = NULL")
+            self._link(self.load())
+            self._set_meta('components', int(self.entity_resolution))
+
+    def _link(self, tx_data):
+        """Дописывает сущности и связные компоненты по новым для индекса транзакциям tx_data: объединяются
+        только участники этих транзакций и сущности, слившиеся с их записями"""
+        renames = self._resolve_entities(tx_data) if self.entity_resolution else {}
+        forest = StoredUnionFind(self.conn)
+        for old, new in renames.items():
+            old_node = forest.node(old, create=False)
+            if old_node is not None:
+                forest.union(old_node, forest.node(new))
+        first_nodes = []
+        for tx_id, tx in tx_data.items():
+            nodes = [forest.node(str(key)) for key in map(participant_key, tx.get('all_participants', [])) if key]
+            for node in nodes[1:]:
+                forest.union(nodes[0], node)
+            first_nodes.append((tx_id, nodes[0] if nodes else None))
+        forest.save()
+        self.conn.executemany("UPDATE TX_INDEX SET COMPONENT = ? WHERE TX_ID = ?",
+                              [(forest.find(node) if node is not None else None, tx_id) for tx_id, node in first_nodes])
+
+    def _resolve_entities(self, tx_data, threshold=MATCH_THRESHOLD, max_block_size=MAX_BLOCK_SIZE):
+        """Относит к сущностям записи участников tx_data, которых еще нет в TX_PROFILE: они сравниваются
+        с записями своих блоков (tx_entities.match_profiles вместе со всеми записями их сущностей).
+        Проставляет participant['entity_id'] и возвращает {прежний идентификатор сущности: новый}
+        для сущностей, изменившихся при объединении с новыми записями"""
+        stored = {}  # ключ записи -> идентификатор сущности
+        new_profiles = {}  # ключ записи -> запись (tx_entities.Profile)
+        occurrences = []
+        for tx in tx_data.values():
+            for participant in tx.get('all_participants', []):
+                key = profile_key(participant)
+                dumped = _dump_key(key)
+                occurrences.append((participant, dumped))
+                if dumped in stored or dumped in new_profiles:
+                    continue
+                row = self.conn.execute("SELECT ENTITY_ID FROM TX_PROFILE WHERE PROFILE_KEY = ?", (dumped,)).fetchone()
+                if row is not None:
+                    stored[dumped] = row[0]
+                else:
+                    new_profiles[dumped] = make_profile(key, participant.get('name'))
+
+        renames = {}
+        if new_profiles:
+            self.conn.executemany("INSERT OR IGNORE INTO TX_BLOCK (BLOCK_KEY, PROFILE_KEY) VALUES (?, ?)",
+                                  [(_dump_key(block), dumped) for dumped, profile in new_profiles.items()
+                                   for block in profile.blocking_keys()])
+
+            # Кандидаты - записи блоков новых записей, которые сравниваются попарно (блок не больше max_block_size)
+            block_sizes = {}
+            candidates = set()
+            for profile in new_profiles.values():
+                for block in profile.blocking_keys():
+                    if block in block_sizes:
+                        continue
+                    members = [row[0] for row in self.conn.execute(
+                        "SELECT PROFILE_KEY FROM TX_BLOCK WHERE BLOCK_KEY = ? LIMIT ?",
+                        (_dump_key(block), max_block_size + 1))]
+                    block_sizes[block] = len(members)
+                    if len(members) <= max_block_size:
+                        candidates.update(members)
+            entities = set()
+            for dumped in candidates - new_profiles.keys():
+                entities.add(self.conn.execute(
+                    "SELECT ENTITY_ID FROM TX_PROFILE WHERE PROFILE_KEY = ?", (dumped,)).fetchone()[0])
+
+            # Сущности кандидатов берутся целиком: они не разделяются, а идентификатор сущности без кода
+            # зависит от всех ее записей
+            keys = list(new_profiles)
+            profiles = list(new_profiles.values())
+            known = [None] * len(keys)
+            for entity_id in sorted(entities):
+                for dumped, raw_name in self.conn.execute(
+                        "SELECT PROFILE_KEY, RAW_NAME FROM TX_PROFILE WHERE ENTITY_ID = ?", (entity_id,)):
+                    keys.append(dumped)
+                    profiles.append(make_profile(json.loads(dumped), raw_name))
+                    known.append(entity_id)
+            for profile in profiles[len(new_profiles):]:
+                for block in profile.blocking_keys():
+                    if block not in block_sizes:
+                        block_sizes[block] = self.conn.execute(
+                            "SELECT COUNT(*) FROM (SELECT 1 FROM TX_BLOCK WHERE BLOCK_KEY = ? LIMIT ?)",
+                            (_dump_key(block), max_block_size + 1)).fetchone()[0]
+
+            entity_ids, _ = match_profiles(profiles, threshold, max_block_size, known, block_sizes)
+            for dumped, profile, old, new in zip(keys, profiles, known, entity_ids):
+                if old is None:
+                    self.conn.execute("INSERT INTO TX_PROFILE (PROFILE_KEY, RAW_NAME, ENTITY_ID) VALUES (?, ?, ?)",
+                                      (dumped, profile.raw_name, new))
+                elif old != new:
+                    renames[old] = new
+                    self.conn.execute("UPDATE TX_PROFILE SET ENTITY_ID = ? WHERE PROFILE_KEY = ?", (new, dumped))
+                stored[dumped] = new
+
+        for participant, dumped in occurrences:
+            participant['entity_id'] = stored[dumped]
+        return renames
+
+    def append(self, tx_data):
+        """Дописывает транзакции (результат parse_transactions), которых еще нет в индексе, вместе с их
+        сущностями и связными компонентами. Возвращает (ID новых транзакций, затронутые участники, затронутые суммы)"""
+        new_ids = []
+        persons = set()
+        amounts = set()
+        with self.conn:
+            for tx_id, tx in tx_data.items():
+                inserted = self.conn.execute("""
+                    INSERT OR IGNORE INTO TX_INDEX (TX_ID, AMOUNT, TX_TIME_STR, TX_SECONDS, PAYERS, RECIPIENTS)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (tx_id, tx.get('amount'), tx.get('tx_time_str'), tx.get('tx_seconds'),
+                      json.dumps(tx['payers'], ensure_ascii=False),
+                      json.dumps(tx['recipients'], ensure_ascii=False))).rowcount
+                if not inserted:
+                    continue
+                new_ids.append(tx_id)
+                self._add_edges(tx_id, tx.get('amount'), tx.get('tx_seconds'), tx['payers'], tx['recipients'])
+                if tx.get('amount'):
+                    amounts.add(tx['amount'])
+                for role, key in ROLES:
+                    for participant in tx[key]:
+                        if participant.get('id'):
+                            persons.add(str(participant['id']))
+                            self.conn.execute(
+                                "INSERT OR IGNORE INTO TX_PARTICIPANT (PERSON_ID, ROLE, TX_ID) VALUES (?, ?, ?)",
+                                (str(participant['id']), role, tx_id))
+            if new_ids:
+                self._link({tx_id: tx_data[tx_id] for tx_id in new_ids})
+                self._set_meta('version', self.version() + 1)
+        return new_ids, persons, amounts
+
+    def touched_tx_ids(self, persons, amounts, start_seconds=None, end_seconds=None, amount_tolerance=None,
+                       amount_tolerance_pct=None):
+        """ID транзакций, которые нужно проверить заново: транзакции затронутых участников и транзакции
+        с затронутыми суммами (с учетом допуска поиска близких сумм). start_seconds/end_seconds ограничивают
+        время: связи новой порции с более старыми транзакциями не ищутся (транзакции без времени берутся все)"""
+        start = start_seconds if start_seconds is not None else -2 ** 63
+        end = end_seconds if end_seconds is not None else 2 ** 63 - 1
+        tx_ids = set()
+        for person_id in persons:
+            tx_ids.update(row[0] for row in self.conn.execute("""
+                SELECT P.TX_ID FROM TX_PARTICIPANT P JOIN TX_INDEX T ON T.TX_ID = P.TX_ID
+                WHERE P.PERSON_ID = ? AND (T.TX_SECONDS BETWEEN ? AND ? OR T.TX_SECONDS IS NULL)
+            """, (person_id, start, end)))
+        for amount in amounts:
+            if amount_tolerance_pct is not None:
+                margin = abs(amount) * amount_tolerance_pct / 100
+            else:
+                margin = amount_tolerance or 0
+            tx_ids.update(row[0] for row in self.conn.execute("""
+                SELECT TX_ID FROM TX_INDEX WHERE AMOUNT BETWEEN ? AND ? AND (TX_SECONDS BETWEEN ? AND ? OR TX_SECONDS IS NULL)
+            """, (amount - margin, amount + margin, start, end)))
+        return tx_ids
+
+    def load(self, tx_ids=None):
+        """Загружает транзакции в формате parse_transactions (все, если tx_ids не задан) с сущностями
+        участников и номерами связных компонент (component_id - NODE_ID корня компоненты)"""
+        if tx_ids is None:
+            rows = self.conn.execute("""
+                SELECT TX_ID, AMOUNT, TX_TIME_STR, TX_SECONDS, PAYERS, RECIPIENTS, COMPONENT FROM TX_INDEX ORDER BY TX_ID
+            """)
+        else:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS TX_LOAD (TX_ID INTEGER PRIMARY KEY)")
+            self.conn.execute("DELETE FROM TX_LOAD")
+            self.conn.executemany("INSERT OR IGNORE INTO TX_LOAD (TX_ID) VALUES (?)", [(tx_id,) for tx_id in tx_ids])
+            rows = self.conn.execute("""
+                SELECT T.TX_ID, T.AMOUNT, T.TX_TIME_STR, T.TX_SECONDS, T.PAYERS, T.RECIPIENTS, T.COMPONENT
+                FROM TX_LOAD L JOIN TX_INDEX T ON T.TX_ID = L.TX_ID ORDER BY T.TX_ID
+            """)
+
+        tx_data = {}
+        entity_ids = {}  # ключ записи участника -> идентификатор сущности
+        for idx, (tx_id, amount, tx_time_str, tx_seconds, payers, recipients, component) in enumerate(rows):
+            payers = json.loads(payers)
+            recipients = json.loads(recipients)
+            tx = {
+                'amount': amount,
+                'tx_time_str': tx_time_str,
+                'payers': payers,
+                'recipients': recipients,
+                'all_participants': payers + recipients,
+                'msg_idx': idx,
+                'component_id': component
+            }
+            if tx_seconds is not None:
+                tx['tx_time'] = from_epoch_seconds(tx_seconds)
+                tx['tx_seconds'] = tx_seconds
+            if self.entity_resolution:
+                for participant in tx['all_participants']:
+                    dumped = _dump_key(profile_key(participant))
+                    if dumped not in entity_ids:
+                        row = self.conn.execute("SELECT ENTITY_ID FROM TX_PROFILE WHERE PROFILE_KEY = ?",
+                                                (dumped,)).fetchone()
+                        entity_ids[dumped] = row[0] if row else None
+                    if entity_ids[dumped] is not None:
+                        participant['entity_id'] = entity_ids[dumped]
+            tx_data[tx_id] = tx
+        return tx_data
+
+    def load_components(self, tx_ids):
+        """Загружает транзакции tx_ids вместе со всеми транзакциями их связных компонент"""
+        components = set()
+        for tx_id in tx_ids:
+            row = self.conn.execute("SELECT COMPONENT FROM TX_INDEX WHERE TX_ID = ?", (tx_id,)).fetchone()
+            if row is not None and row[0] is not None:
+                components.add(row[0])
+        load_ids = set(tx_ids)
+        for component in components:
+            load_ids.update(row[0] for row in self.conn.execute(
+                "SELECT TX_ID FROM TX_INDEX WHERE COMPONENT = ?", (component,)))
+        return self.load(load_ids)
@@ -0,0 +1,222 @@
+import argparse
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+from tx_index import TxIndex
+from tx_time import epoch_seconds, from_epoch_seconds, parse_time
+
+# Окрестность участника в постоянном индексе транзакций (tx_index): все, кто связан с ИИН/БИН переводами
+# не более чем через k звеньев, с фильтрами по времени и сумме. Обход в ширину выполняется по слоям:
+# переводы всего слоя выбираются одним запросом по индексам (участник, время) таблицы TX_EDGE.
+# Результаты кэшируются в памяти и в таблице TX_NEIGHBORHOOD_CACHE до изменения версии данных.
+
+NEIGHBORHOOD_CACHE_DDL = """
+CREATE TABLE IF NOT EXISTS TX_NEIGHBORHOOD_CACHE (
+    QUERY TEXT PRIMARY KEY,
+    VERSION INTEGER NOT NULL,
+    RESULT TEXT NOT NULL,
+    HITS INTEGER NOT NULL DEFAULT 0,
+    USED_AT REAL NOT NULL
+);
+"""
+
+DIRECTIONS = ('both', 'out', 'in')  # по всем переводам, только исходящим или только входящим
+
+
+class Neighborhoods:
+    """Запросы окрестностей участников над индексом tx_index с кэшем недавних результатов"""
+
+    def __init__(self, db_path, cache_size=256, max_cached=10000):
+        self.index = TxIndex(db_path)
+        self.conn = self.index.conn
+        self.conn.executescript(NEIGHBORHOOD_CACHE_DDL)
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS TX_FRONTIER (PERSON_ID TEXT PRIMARY KEY)")
+        self.cache = OrderedDict()  # запрос -> (версия, результат), последние использованные - в конце
+        self.cache_size = cache_size
+        self.max_cached = max_cached  # Записей в таблице кэша, сверх этого удаляются давно не использованные
+
+    def close(self):
+        self.index.close()
+
+    def latest_seconds(self):
+        """Время последней транзакции в индексе (секунды) или None"""
+        return self.conn.execute("SELECT MAX(TX_SECONDS) FROM TX_INDEX").fetchone()[0]
+
+    def query(self, person_id, hops=2, start_seconds=None, end_seconds=None, min_amount=None, max_amount=None,
+              direction='both', max_nodes=5000):
+        """Участники не дальше hops переводов от person_id и переводы, по которым они найдены.
+        Учитываются переводы со временем в [start_seconds, end_seconds] и суммой в [min_amount, max_amount];
+        обход останавливается на max_nodes участниках (truncated). Возвращает словарь с ключами
+        person_id, hops, nodes [{id, name, hop}], edges [{tx_id, src, dst, amount, tx_time}], truncated, cached"""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Неизвестное направление обхода: {direction}")
+        key = json.dumps([str(person_id), hops, start_seconds, end_seconds, min_amount, max_amount, direction,
+                          max_nodes])
+        version = self.index.version()
+
+        cached = self.cache.get(key)
+        if cached is None:
+            row = self.conn.execute("SELECT VERSION, RESULT FROM TX_NEIGHBORHOOD_CACHE WHERE QUERY = ?",
+                                    (key,)).fetchone()
+            cached = (row[0], json.loads(row[1])) if row else None
+        if cached is not None and cached[0] == version:
+            self._remember(key, cached)
+            with self.conn:
+                self.conn.execute("UPDATE TX_NEIGHBORHOOD_CACHE SET HITS = HITS + 1, USED_AT = ? WHERE QUERY = ?",
+                                  (time.time(), key))
+            return dict(cached[1], cached=True)
+
+        result = self._search(str(person_id), hops, start_seconds, end_seconds, min_amount, max_amount, direction,
+                              max_nodes)
+        self._remember(key, (version, result))
+        with self.conn:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO TX_NEIGHBORHOOD_CACHE (QUERY, VERSION, RESULT, HITS, USED_AT)
+                VALUES (?, ?, ?, 0, ?)
+            """, (key, version, json.dumps(result, ensure_ascii=False), time.time()))
+            self.conn.execute("""
+                DELETE FROM TX_NEIGHBORHOOD_CACHE WHERE QUERY IN (
+                    SELECT QUERY FROM TX_NEIGHBORHOOD_CACHE ORDER BY USED_AT DESC LIMIT -1 OFFSET ?)
+            """, (self.max_cached,))
+        return dict(result, cached=False)
+
+    def _remember(self, key, entry):
+        self.cache[key] = entry
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _layer_edges(self, frontier, start_seconds, end_seconds, min_amount, max_amount, direction):
+        """Переводы участников слоя frontier: (TX_ID, SRC, DST, AMOUNT, TX_SECONDS)"""
+        self.conn.execute("DELETE FROM TX_FRONTIER")
+        self.conn.executemany("INSERT OR IGNORE INTO TX_FRONTIER (PERSON_ID) VALUES (?)",
+                              [(person_id,) for person_id in frontier])
+        # Условия добавляются только для заданных фильтров: переводы без времени или суммы иначе не попадут
+        conditions, params = [], []
+        for condition, value in (("E.TX_SECONDS >= ?", start_seconds), ("E.TX_SECONDS <= ?", end_seconds),
+                                 ("E.AMOUNT >= ?", min_amount), ("E.AMOUNT <= ?", max_amount)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # CROSS JOIN закрепляет порядок соединения: слой снаружи, поиск по индексу (участник, время) внутри
+        rows = []
+        for column, selected in (('SRC', ('both', 'out')), ('DST', ('both', 'in'))):
+            if direction in selected:
+                rows.extend(self.conn.execute(f"""
+                    SELECT E.TX_ID, E.SRC, E.DST, E.AMOUNT, E.TX_SECONDS FROM TX_FRONTIER F
+                    CROSS JOIN TX_EDGE E ON E.{column} = F.PERSON_ID {where}
+                """, params))
+        return rows
+
+    def _search(self, person_id, hops, start_seconds, end_seconds, min_amount, max_amount, direction, max_nodes):
+        distance = {person_id: 0}
+        edges = {}
+        frontier = [person_id]
+        truncated = False
+        for hop in range(1, hops + 1):
+            if not frontier:
+                break
+            next_frontier = []
+            for tx_id, src, dst, amount, tx_seconds in self._layer_edges(frontier, start_seconds, end_seconds,
+                                                                         min_amount, max_amount, direction):
+                for other in (src, dst):
+                    if other not in distance:
+                        if len(distance) >= max_nodes:
+                            truncated = True
+                            break
+                        distance[other] = hop
+                        next_frontier.append(other)
+                if src in distance and dst in distance:
+                    edges[(tx_id, src, dst)] = (amount, tx_seconds)
+            frontier = next_frontier
+
+        names = {}
+        for chunk in range(0, len(distance), 500):
+            ids = list(distance)[chunk:chunk + 500]
+            names.update(self.conn.execute(
+                f"SELECT PERSON_ID, NAME FROM TX_PERSON WHERE PERSON_ID IN ({','.join('?' * len(ids))})", ids))
+
+        return {
+            'person_id': person_id,
+            'hops': hops,
+            'nodes': [{'id': node, 'name': names.get(node), 'hop': hop}
+                      for node, hop in sorted(distance.items(), key=lambda item: (item[1], item[0]))],
+            'edges': [{'tx_id': tx_id, 'src': src, 'dst': dst, 'amount': amount,
+                       'tx_time': from_epoch_seconds(tx_seconds).isoformat() if tx_seconds is not None else None}
+                      for (tx_id, src, dst), (amount, tx_seconds) in sorted(edges.items(),
+                                                                            key=lambda item: (item[1][1] or 0, item[0]))],
+            'truncated': truncated,
+        }
+
+
+def parse_bound(value):
+    """Граница времени из аргумента командной строки (дата или дата и время) в секундах"""
+    if value is None:
+        return None
+    parsed = parse_time(value) or parse_time(f"{value} 00:00:00")
+    if parsed is None:
+        raise ValueError(f"Неверный формат даты: {value}")
+    return epoch_seconds(parsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Окрестность участника в индексе транзакций')
+    parser.add_argument('--index', required=True, help='Постоянный индекс SQLite (find_related_tx.py --index)')
+    parser.add_argument('--person', '-p', required=True, help='ИИН/БИН участника')
+    parser.add_argument('--hops', '-k', type=int, default=2, help='Число звеньев от участника')
+    parser.add_argument('--days', type=float, help='Только переводы за последние N дней до --end '
+                                                   '(по умолчанию - до последней транзакции в индексе)')
+    parser.add_argument('--start', help='Начало периода (ГГГГ-ММ-ДД или ГГГГ-ММ-ДД ЧЧ:ММ:СС)')
+    parser.add_argument('--end', help='Конец периода')
+    parser.add_argument('--min-amount', '-min', type=float, help='Минимальная сумма перевода')
+    parser.add_argument('--max-amount', '-max', type=float, help='Максимальная сумма перевода')
+    parser.add_argument('--direction', choices=DIRECTIONS, default='both', help='Направление переводов')
+    parser.add_argument('--max-nodes', type=int, default=5000, help='Наибольшее число участников в результате')
+    parser.add_argument('--output', '-o', help='Сохранить результат в JSON-файл')
+
+    args = parser.parse_args()
+
+    try:
+        neighborhoods = Neighborhoods(args.index)
+        start_seconds = parse_bound(args.start)
+        end_seconds = parse_bound(args.end)
+        if args.days is not None:
+            if end_seconds is None:
+                end_seconds = neighborhoods.latest_seconds()
+            if end_seconds is not None:
+                start_seconds = end_seconds - int(args.days * 86400)
+
+        started = time.perf_counter()
+        result = neighborhoods.query(args.person, args.hops, start_seconds, end_seconds, args.min_amount,
+                                     args.max_amount, args.direction, args.max_nodes)
+        elapsed = time.perf_counter() - started
+        neighborhoods.close()
+
+        print(f"Участник {args.person}: {len(result['nodes']) - 1} связанных участников, "
+              f"{len(result['edges'])} переводов за {elapsed:.3f} с{' (из кэша)' if result['cached'] else ''}")
+        if result['truncated']:
+            print(f"Показаны первые {args.max_nodes} участников")
+        for hop in range(1, args.hops + 1):
+            nodes = [node for node in result['nodes'] if node['hop'] == hop]
+            if nodes:
+                print(f"\nЗвеньев: {hop}, участников: {len(nodes)}")
+                for node in nodes:
+                    print(f"  {node['name']} ({node['id']})")
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as out_file:
+                json.dump(result, out_file, ensure_ascii=False, indent=2)
+            print(f"\nРезультат сохранен в файл '{args.output}'")
+
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import json
+
+# Нормализованный результат find_related_tx в формате JSON Lines: одна запись на строку.
+#   {"record": "entity", "ref": ..., "id": ..., "name": ..., "entity_id"} - участник (один раз)
+#   {"record": "transaction", "tx_id": ..., "payers": [ref], ...}         - транзакция (один раз)
+#   {"record": "type", "type": ..., "description": ...}                 - заголовок типа связи
+#   {"record": "group", "relation": ..., "transactions": [tx_id], ...}   - группа со ссылками
+# Участники и транзакции пишутся перед первой группой, которая на них ссылается, поэтому файл
+# читается за один проход, а группы восстанавливаются по одной.
+
+FORMAT_VERSION = 1
+
+# Поля групп, содержащие одного участника, и поля со списком участников
+PARTICIPANT_KEYS = ('person', 'payer', 'recipient')
+PARTICIPANT_LIST_KEYS = ('members',)
+
+# Тип связи, результаты которого - списки транзакций (цепочки), а не словари групп
+CHAIN_TYPE = 'chain_by_person'
+
+
+def entity_ref(participant):
+    """Ссылка на участника: ИИН/БИН, а для участника без кода - наименование с префиксом '~'"""
+    if participant.get('id'):
+        return str(participant['id'])
+    return '~' + (participant.get('name') or '')
+
+
+class RelatedWriter:
+    """Пишет группы связанных транзакций в нормализованный файл по мере их нахождения"""
+
+    def __init__(self, path, tx_data):
+        self.tx_data = tx_data
+        self.file = open(path, 'w', encoding='utf-8')
+        self.entities = set()
+        self.transactions = set()
+        self.types = set()
+        self.group_count = 0
+        self._write({'record': 'header', 'format': 'related_transactions', 'version': FORMAT_VERSION})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False))
+        self.file.write('\n')
+
+    def _entity(self, participant):
+        ref = entity_ref(participant)
+        if ref not in self.entities:
+            self.entities.add(ref)
+            record = {'record': 'entity', 'ref': ref, 'id': participant.get('id'), 'name': participant.get('name')}
+            if participant.get('entity_id'):
+                record['entity_id'] = participant['entity_id']
+            self._write(record)
+        return ref
+
+    def _transaction(self, tx_id):
+        if tx_id not in self.transactions:
+            self.transactions.add(tx_id)
+            tx = self.tx_data[tx_id]
+            self._write({
+                'record': 'transaction',
+                'tx_id': tx_id,
+                'amount': tx.get('amount'),
+                'tx_time': tx.get('tx_time_str'),
+                'payers': [self._entity(payer) for payer in tx.get('payers', [])],
+                'recipients': [self._entity(recipient) for recipient in tx.get('recipients', [])],
+                'component_id': tx.get('component_id')
+            })
+        return tx_id
+
+    def write_groups(self, group_type, description, groups):
+        """Дописывает группы одного типа связи (формат групп find_related_in_tx_data)"""
+        if not groups:
+            return
+        if group_type not in self.types:
+            self.types.add(group_type)
+            self._write({'record': 'type', 'type': group_type, 'description': description})
+        for group in groups:
+            if group_type == CHAIN_TYPE:
+                group = {'transactions': group}
+            record = {'record': 'group', 'relation': group_type}
+            for key, value in group.items():
+                if key == 'transactions':
+                    value = [self._transaction(tx['tx_id']) for tx in value]
+                elif key in PARTICIPANT_KEYS and value is not None:
+                    value = self._entity(value)
+                elif key in PARTICIPANT_LIST_KEYS:
+                    value = [self._entity(participant) for participant in value]
+                record[key] = value
+            self._write(record)
+            self.group_count += 1
+
+
+def is_normalized(path):
+    """Проверяет, записан ли файл результатов в нормализованном формате (а не одним JSON-массивом)"""
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                return line.lstrip().startswith('{')
+    return False
+
+
+def iter_groups(path):
+    """Читает нормализованный файл лениво: (тип связи, описание, группа) по одной группе. Участники
+    и транзакции в группах восстанавливаются из таблиц, прочитанных до группы; цепочки
+    возвращаются как {'transactions': [...]}"""
+    entities = {}
+    transactions = {}
+    descriptions = {}
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.pop('record', None)
+            if kind == 'entity':
+                entities[record['ref']] = {key: record[key] for key in ('name', 'id', 'entity_id') if key in record}
+            elif kind == 'transaction':
+                record['payers'] = [entities[ref] for ref in record.get('payers', [])]
+                record['recipients'] = [entities[ref] for ref in record.get('recipients', [])]
+                transactions[record['tx_id']] = record
+            elif kind == 'type':
+                descriptions[record['type']] = record.get('description')
+            elif kind == 'group':
+                group_type = record.pop('relation')
+                for key, value in record.items():
+                    if key == 'transactions':
+                        record[key] = [transactions[tx_id] for tx_id in value]
+                    elif key in PARTICIPANT_KEYS and value is not None:
+                        record[key] = entities[value]
+                    elif key in PARTICIPANT_LIST_KEYS:
+                        record[key] = [entities[ref] for ref in value]
+                yield group_type, descriptions.get(group_type), record
+
+
+def load_related(path):
+    """Загружает нормализованный файл целиком в прежнем формате (список типов связи с группами)"""
+    related_groups = []
+    by_type = {}
+    for group_type, description, group in iter_groups(path):
+        group_info = by_type.get(group_type)
+        if group_info is None:
+            group_info = by_type[group_type] = {'type': group_type, 'description': description}
+            group_info['chains' if group_type == CHAIN_TYPE else 'groups'] = []
+            related_groups.append(group_info)
+        if group_type == CHAIN_TYPE:
+            group_info['chains'].append(group['transactions'])
+        else:
+            group_info['groups'].append(group)
+    return related_groups
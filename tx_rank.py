@@ -0,0 +1,71 @@
+import heapq
+import json
+import math
+
+from tx_graph import participant_key
+
+# Ранжирование групп связанных транзакций для find_related_tx: оценка группы по общей сумме,
+# числу транзакций и риску участников; по каждому типу связи в памяти остаются K групп
+# с наибольшей оценкой (куча), полный результат пишется в файл (tx_output.RelatedWriter).
+
+AMOUNT_WEIGHT = 1.0  # за каждый порядок общей суммы (log10)
+COUNT_WEIGHT = 1.0   # за каждое удвоение числа транзакций (log2)
+RISK_WEIGHT = 2.0    # за единицу наибольшего риска участника группы
+
+
+def load_risk(path):
+    """Риск участников из JSON-файла {ИИН/БИН: риск}"""
+    with open(path, 'r', encoding='utf-8') as file:
+        return {str(person_id): float(value) for person_id, value in json.load(file).items()}
+
+
+def group_tx_ids(group):
+    """ID транзакций группы любого типа (цепочка - список транзакций, компонента - tx_ids)"""
+    if isinstance(group, list):
+        return [tx['tx_id'] for tx in group]
+    if 'transactions' in group:
+        return [tx['tx_id'] for tx in group['transactions']]
+    return group.get('tx_ids', [])
+
+
+def group_score(group, tx_data, risk=None):
+    """Оценка группы: AMOUNT_WEIGHT * log10(1 + сумма) + COUNT_WEIGHT * log2(1 + число транзакций)
+    + RISK_WEIGHT * наибольший риск участника (risk - {ИИН/БИН: риск}, по умолчанию 0). Риск ищется по ключу
+    участника (tx_graph.participant_key), как его группируют детекторы: участник без ИИН/БИН, отнесенный
+    к сущности с ИИН/БИН, получает риск этого кода"""
+    tx_ids = group_tx_ids(group)
+    total_amount = sum(tx_data[tx_id].get('amount') or 0 for tx_id in tx_ids)
+    score = AMOUNT_WEIGHT * math.log10(1 + max(total_amount, 0)) + COUNT_WEIGHT * math.log2(1 + len(tx_ids))
+    if risk:
+        if isinstance(group, dict) and 'members' in group:
+            participants = group['members']
+        else:
+            participants = (participant for tx_id in tx_ids for participant in tx_data[tx_id].get('all_participants', []))
+        score += RISK_WEIGHT * max((risk.get(str(participant_key(participant)), 0) for participant in participants
+                                    if participant_key(participant)), default=0)
+    return round(score, 4)
+
+
+class TopGroups:
+    """K групп с наибольшей оценкой по каждому типу связи (при равной оценке - найденные раньше)"""
+
+    def __init__(self, k):
+        self.k = k
+        self.heaps = {}   # тип связи -> куча (оценка, -порядковый номер, группа)
+        self.totals = {}  # тип связи -> число всех групп
+        self.seq = 0
+
+    def push(self, group_type, score, group):
+        self.seq += 1
+        self.totals[group_type] = self.totals.get(group_type, 0) + 1
+        heap = self.heaps.setdefault(group_type, [])
+        item = (score, -self.seq, group)
+        if len(heap) < self.k:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+
+    def groups(self, group_type):
+        """Отобранные группы типа по убыванию оценки"""
+        return [group for _, _, group in sorted(self.heaps.get(group_type, []), key=lambda item: item[:2],
+                                                reverse=True)]
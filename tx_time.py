@@ -0,0 +1,134 @@
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Время транзакций для find_related_tx: разбор дат колонкой (регулярное выражение + numpy datetime64),
+# кэш формата для одиночных значений, секунды от 1970-01-01 и отсортированный индекс времени с часовыми
+# интервалами для запросов "транзакции в [t1, t2]".
+
+EPOCH = datetime(1970, 1, 1)
+
+# Поддерживаемые форматы goper_trans_date (как в parse_datetime)
+TIME_FORMATS = (
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S",
+)
+
+# Строки, которые разбираются numpy без strptime: те же форматы с двузначными полями
+ISO_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?")
+
+NO_TIME = np.iinfo(np.int64).min  # Отметка неразобранного времени в массивах
+
+_FORMAT_CACHE = {}  # (длина, разделитель даты и времени) -> формат, подошедший в прошлый раз
+
+
+def epoch_seconds(tx_time):
+    """Время транзакции в секундах от 1970-01-01 (без учета часового пояса)"""
+    return int((tx_time - EPOCH).total_seconds())
+
+
+def from_epoch_seconds(seconds):
+    """Обратное преобразование epoch_seconds"""
+    return EPOCH + timedelta(seconds=int(seconds))
+
+
+def parse_time(value):
+    """Разбирает строку даты в datetime (None, если формат не подходит); сначала пробует формат,
+    который подошел для строк той же формы"""
+    if not value:
+        return None
+    shape = (len(value), value[10:11])
+    cached = _FORMAT_CACHE.get(shape)
+    if cached is not None:
+        try:
+            return datetime.strptime(value, cached)
+        except ValueError:
+            pass
+    for fmt in TIME_FORMATS:
+        if fmt == cached:
+            continue
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        _FORMAT_CACHE[shape] = fmt
+        return parsed
+    return None
+
+
+def parse_times(values):
+    """Разбирает колонку строк дат в массив микросекунд от 1970-01-01 (NO_TIME - не разобрано).
+    Строки стандартного вида разбираются numpy одним вызовом, остальные - parse_time"""
+    result = np.full(len(values), NO_TIME, dtype=np.int64)
+    fast = [i for i, value in enumerate(values) if isinstance(value, str) and ISO_PATTERN.fullmatch(value)]
+    try:
+        result[fast] = np.array([values[i] for i in fast], dtype='datetime64[us]').astype(np.int64)
+        slow = set(range(len(values))) - set(fast)
+    except ValueError:
+        slow = range(len(values))  # Недопустимая дата в колонке (например, 30 февраля) - разбираем по одной
+
+    for i in sorted(slow):
+        parsed = parse_time(values[i]) if isinstance(values[i], str) else None
+        if parsed is not None:
+            result[i] = (parsed - EPOCH) // timedelta(microseconds=1)
+    return result
+
+
+def to_datetimes(microseconds):
+    """Массив микросекунд (parse_times) -> список datetime (None для NO_TIME)"""
+    valid = microseconds != NO_TIME
+    converted = np.where(valid, microseconds, 0).astype('datetime64[us]').tolist()
+    return [value if ok else None for value, ok in zip(converted, valid.tolist())]
+
+
+class TimeIndex:
+    """Транзакции, отсортированные по времени (секунды), и смещения начала каждого часового интервала:
+    поиск диапазона начинается с интервала и уточняется двоичным поиском внутри него"""
+
+    def __init__(self, tx_ids, seconds, bucket_seconds=3600, max_buckets=10_000_000):
+        seconds = np.asarray(seconds, dtype=np.int64)
+        order = np.argsort(seconds, kind='stable')
+        self.seconds = seconds[order]
+        self.tx_ids = [tx_ids[i] for i in order.tolist()]
+        self.positions = {tx_id: position for position, tx_id in enumerate(self.tx_ids)}
+        self.bucket_seconds = bucket_seconds
+        self.offsets = None
+        if len(self.seconds):
+            self.first_bucket = int(self.seconds[0]) // bucket_seconds
+            bucket_count = int(self.seconds[-1]) // bucket_seconds - self.first_bucket + 1
+            # При разбросе дат на века (ошибки в данных) интервалы не строятся, остается двоичный поиск
+            if bucket_count <= max_buckets:
+                bounds = (self.first_bucket + np.arange(bucket_count + 1, dtype=np.int64)) * bucket_seconds
+                self.offsets = np.searchsorted(self.seconds, bounds, side='left')
+
+    def __len__(self):
+        return len(self.tx_ids)
+
+    def _bound(self, value, side):
+        """Позиция value в отсортированных секундах (searchsorted внутри часового интервала)"""
+        if self.offsets is None:
+            return int(np.searchsorted(self.seconds, value, side=side))
+        bucket = value // self.bucket_seconds - self.first_bucket
+        if bucket < 0:
+            return 0
+        if bucket >= len(self.offsets) - 1:
+            return len(self.seconds)
+        lo, hi = int(self.offsets[bucket]), int(self.offsets[bucket + 1])
+        return lo + int(np.searchsorted(self.seconds[lo:hi], value, side=side))
+
+    def range(self, start, end):
+        """Позиции транзакций со временем в [start, end]"""
+        return self._bound(start, 'left'), self._bound(end, 'right')
+
+    def between(self, start, end):
+        """ID транзакций со временем в [start, end] в порядке времени"""
+        lo, hi = self.range(start, end)
+        return self.tx_ids[lo:hi]
+
+    def sort(self, tx_ids):
+        """Упорядочивает транзакции по времени: (ID, массив секунд); транзакции без времени пропускаются"""
+        positions = np.sort(np.fromiter((self.positions[tx_id] for tx_id in tx_ids if tx_id in self.positions),
+                                        dtype=np.int64))
+        return [self.tx_ids[position] for position in positions.tolist()], self.seconds[positions]